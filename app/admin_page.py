@@ -69,12 +69,14 @@ def render_admin_dashboard():
                             # Reuse pipeline components
                             client = None
                             model = None
+                            llm_client = None
                             if "pipeline" in st.session_state and st.session_state.pipeline:
                                 client = st.session_state.pipeline.retriever.client
                                 model = st.session_state.pipeline.retriever.model
+                                llm_client = st.session_state.pipeline.client_factory.client
                             
                             # Process single file
-                            chunks = process_uploaded_file(file, client=client, model=model)
+                            chunks = process_uploaded_file(file, client=client, model=model, llm_client=llm_client)
                             total_chunks += chunks
                             processed_count += 1
                             st.write(f"✅ Đã thêm {chunks} chunks từ {file.name}")
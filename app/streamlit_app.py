@@ -223,36 +223,40 @@ def process_query(query_text: str):
     
     # Xử lý Backend
     with st.chat_message("assistant", avatar="🎓"):
-        with st.spinner("🔍 Đang tìm kiếm thông tin..."):
-            try:
-                result = st.session_state.pipeline.run(query_text, user_id=user_id)
-                
-                if "error" in result:
-                    answer = f"⚠️ {result['error']}"
-                    st.error(answer)
-                    sources = []
-                else:
-                    answer = result["answer"]
-                    st.markdown(answer)
-                    sources = result.get("sources", [])
-                   
-                    if sources: # Hiển thị sources
-                        with st.expander("📚 Nguồn tham khảo"):
-                            for i, src in enumerate(sources[:5], 1):
-                                s_type = src.get('type', 'text').upper()
-                                s_url = src.get('url') or '#'        
-                                s_title = src.get('title')
-                                if not s_title or s_title == "None":
-                                    s_title = src.get('chunk_id', '').replace('-', ' ').replace('_', ' ').title()
-                                if not s_title:
-                                    s_title = "Tài liệu tuyển sinh"
-                                
-                                st.markdown(f"**{i}. [{s_type}] {s_title}**\n🔗 [Xem chi tiết]({s_url})")
-                    
-            except Exception as e:
-                answer = f"⚠️ Xin lỗi, hệ thống đang gặp sự cố."
-                st.error(f"System Error: {str(e)}")
+        try:
+            with st.spinner("🔍 Đang tìm kiếm thông tin..."):
+                result = st.session_state.pipeline.run_stream(query_text, user_id=user_id)
+            
+            if "error" in result:
+                answer = f"⚠️ {result['error']}"
+                st.error(answer)
                 sources = []
+            else:
+                # Hiển thị câu trả lời dần dần theo token
+                streamed = st.write_stream(result["answer_stream"])
+                answer = result.get("answer") or streamed
+                sources = result.get("sources", [])
+                # Lỗi đặt ở cuối stream (hết model, stream bị cắt) chỉ có sau khi write_stream chạy xong
+                if result.get("error"):
+                    st.error(f"⚠️ {result['error']}")
+
+                if sources: # Hiển thị sources
+                    with st.expander("📚 Nguồn tham khảo"):
+                        for i, src in enumerate(sources[:5], 1):
+                            s_type = src.get('type', 'text').upper()
+                            s_url = src.get('url') or '#'        
+                            s_title = src.get('title')
+                            if not s_title or s_title == "None":
+                                s_title = src.get('chunk_id', '').replace('-', ' ').replace('_', ' ').title()
+                            if not s_title:
+                                s_title = "Tài liệu tuyển sinh"
+                            
+                            st.markdown(f"**{i}. [{s_type}] {s_title}**\n🔗 [Xem chi tiết]({s_url})")
+                
+        except Exception as e:
+            answer = f"⚠️ Xin lỗi, hệ thống đang gặp sự cố."
+            st.error(f"System Error: {str(e)}")
+            sources = []
         
     st.session_state.messages.append({ # Lưu vào Session State VÀ Database
         "role": "assistant", 
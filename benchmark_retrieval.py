@@ -0,0 +1,269 @@
+"""
+Benchmark Retrieval - chỉ đo phần tìm kiếm, KHÔNG gọi LLM
+- Chạy embed_query + semantic_search / hybrid_search (+ rerank cross-encoder) cho từng câu hỏi có nhãn
+- Báo cáo recall@k, MRR, nDCG@k và latency p50/p90/p99 theo từng bước
+- Nhãn (qrels): data/retrieval_qrels.jsonl, mỗi dòng {"question": ..., "relevant": {"chunk_id": độ liên quan}}
+
+Tạo file nhãn nháp từ benchmark_questions.txt (cần duyệt tay trước khi dùng):
+    python benchmark_retrieval.py --build-qrels
+So sánh với lần chạy trước:
+    python benchmark_retrieval.py --modes dense,hybrid --baseline benchmark_retrieval_20260110_111552.json
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+from datetime import datetime
+from dotenv import load_dotenv
+import numpy as np
+
+load_dotenv()
+
+# Setup path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root / "src"))
+
+from config import (
+    EMBEDDING_MODELS,
+    QDRANT_PATH,
+    TOP_K_INITIAL,
+    QUERY_CACHE_SIZE,
+    STOPWORDS_FILE,
+    RRF_K,
+    CROSS_ENCODER_MODEL,
+    RETRIEVAL_QRELS_FILE
+)
+from retrieval.crag_retriever import CRAGRetriever
+from retrieval.cross_encoder_reranker import get_reranker
+from llm.client_factory import GroqClientFactory
+from llm.transport import DisabledTransport
+
+MODES = ("dense", "hybrid", "dense+rerank", "hybrid+rerank")
+
+
+def recall_at_k(ranked: list, relevant: dict, k: int) -> float:
+    hits = sum(1 for chunk_id in ranked[:k] if relevant.get(chunk_id, 0) > 0)
+    total = sum(1 for grade in relevant.values() if grade > 0)
+    return hits / total if total else 0.0
+
+
+def reciprocal_rank(ranked: list, relevant: dict) -> float:
+    for rank, chunk_id in enumerate(ranked, 1):
+        if relevant.get(chunk_id, 0) > 0:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked: list, relevant: dict, k: int) -> float:
+    """nDCG với độ liên quan nhiều mức: gain = 2^rel - 1"""
+    dcg = sum((2 ** relevant.get(chunk_id, 0) - 1) / math.log2(i + 2) for i, chunk_id in enumerate(ranked[:k]))
+    ideal = sorted(relevant.values(), reverse=True)[:k]
+    idcg = sum((2 ** grade - 1) / math.log2(i + 2) for i, grade in enumerate(ideal))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def percentiles(values: list) -> dict:
+    """p50/p90/p99 (ms); danh sách rỗng -> 0"""
+    return {f"p{q}": float(np.percentile(values, q)) if values else 0.0 for q in (50, 90, 99)}
+
+
+class RetrievalBenchmark:
+    def __init__(
+        self,
+        model_type: str = "gemma",
+        qrels_file: str = RETRIEVAL_QRELS_FILE,
+        use_query_cache: bool = False,
+        rerank: bool = False,
+        reranker_model: str = CROSS_ENCODER_MODEL
+    ):
+        self.qrels_file = qrels_file
+        model_config = EMBEDDING_MODELS[model_type]
+
+        print("🔧 Loading retriever (LLM disabled)...")
+        # Transport "disabled": nếu có bước nào lỡ gọi LLM thì lỗi ngay thay vì tốn quota
+        self.retriever = CRAGRetriever(
+            qdrant_path=QDRANT_PATH,
+            collection_name=model_config["collection_name"],
+            embedding_model=model_config["name"],
+            # Tắt cache vector câu hỏi để latency embed là thời gian encode thật
+            query_cache_size=QUERY_CACHE_SIZE if use_query_cache else 0,
+            retrieval_mode="dense",
+            stopwords_path=STOPWORDS_FILE,
+            rrf_k=RRF_K,
+            grader="llm",
+            client_factory=GroqClientFactory(transport=DisabledTransport())
+        )
+        self.reranker = get_reranker(reranker_model) if rerank else None
+        print("✅ Retriever ready")
+
+    def load_qrels(self) -> list:
+        qrels = []
+        with open(self.qrels_file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    qrels.append(json.loads(line))
+        return qrels
+
+    def search(self, mode: str, question: str, depth: int, rerank_pool: int) -> tuple:
+        """Trả về (danh sách chunk_id theo thứ tự, latency từng bước (ms))"""
+        timing = {}
+
+        start = time.perf_counter()
+        query_vector = self.retriever.embed_query(question)
+        timing["embed"] = (time.perf_counter() - start) * 1000
+
+        rerank = mode.endswith("+rerank")
+        pool = max(depth, rerank_pool) if rerank else depth
+        start = time.perf_counter()
+        if mode.startswith("hybrid"):
+            candidates = self.retriever.hybrid_search(question, query_vector, top_k=pool)
+        else:
+            candidates = self.retriever.semantic_search(query_vector, top_k=pool)
+        timing["search"] = (time.perf_counter() - start) * 1000
+
+        if rerank:
+            start = time.perf_counter()
+            candidates = self.reranker.rerank(question, candidates, top_k=depth)
+            timing["rerank"] = (time.perf_counter() - start) * 1000
+
+        timing["total"] = sum(timing.values())
+        return [c["chunk_id"] for c in candidates[:depth]], timing
+
+    def run(self, modes: list, depth: int = 10, rerank_pool: int = 20) -> dict:
+        qrels = [q for q in self.load_qrels() if any(grade > 0 for grade in q.get("relevant", {}).values())]
+        if not qrels:
+            raise ValueError(f"No labelled questions in {self.qrels_file}")
+        ks = sorted({k for k in (1, 3, 5, 10, TOP_K_INITIAL) if k <= depth})
+
+        print(f"\n{'='*60}")
+        print(f"RETRIEVAL BENCHMARK: {len(qrels)} câu hỏi | modes: {', '.join(modes)} | depth {depth}")
+        print(f"{'='*60}\n")
+
+        # Warm-up: lần encode/search đầu tiên chậm (load weights, mở collection, build BM25)
+        for mode in modes:
+            self.search(mode, qrels[0]["question"], depth, rerank_pool)
+
+        report = {
+            "questions": len(qrels),
+            "depth": depth,
+            "ks": ks,
+            "reranker": self.reranker.model_name if self.reranker else None,
+            "modes": {}
+        }
+        for mode in modes:
+            metrics = {f"recall@{k}": [] for k in ks}
+            metrics.update({f"ndcg@{k}": [] for k in ks})
+            metrics["mrr"] = []
+            latencies = {}
+
+            for q in qrels:
+                ranked, timing = self.search(mode, q["question"], depth, rerank_pool)
+                relevant = q["relevant"]
+                for k in ks:
+                    metrics[f"recall@{k}"].append(recall_at_k(ranked, relevant, k))
+                    metrics[f"ndcg@{k}"].append(ndcg_at_k(ranked, relevant, k))
+                metrics["mrr"].append(reciprocal_rank(ranked, relevant))
+                for step, ms in timing.items():
+                    latencies.setdefault(step, []).append(ms)
+
+            report["modes"][mode] = {
+                "quality": {name: float(np.mean(values)) for name, values in metrics.items()},
+                "latency_ms": {step: percentiles(values) for step, values in latencies.items()}
+            }
+        return report
+
+    def build_qrels(self, questions_file: str, pool: int = 10, force: bool = False):
+        """
+        Nhãn nháp theo pooling: chunk nằm trong top-`pool` của CẢ dense lẫn BM25 -> relevant = 1.
+        Ghi kèm danh sách candidates để người duyệt sửa nhãn; "verified": false cho tới khi duyệt xong.
+        """
+        if os.path.exists(self.qrels_file) and not force:
+            raise FileExistsError(f"{self.qrels_file} already exists (use --force to overwrite)")
+
+        with open(questions_file, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+        os.makedirs(os.path.dirname(self.qrels_file) or ".", exist_ok=True)
+        with open(self.qrels_file, "w", encoding="utf-8") as f:
+            for question in questions:
+                dense = self.retriever.semantic_search(self.retriever.embed_query(question), top_k=pool)
+                lexical = self.retriever.lexical_search(question, top_k=pool)
+                lexical_ids = {c["chunk_id"] for c in lexical}
+                candidates = {c["chunk_id"]: c.get("title") for c in dense + lexical}
+                entry = {
+                    "question": question,
+                    "relevant": {c["chunk_id"]: 1 for c in dense if c["chunk_id"] in lexical_ids},
+                    "candidates": candidates,
+                    "verified": False
+                }
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"📝 Đã ghi {len(questions)} câu hỏi vào {self.qrels_file} (cần duyệt tay 'relevant')")
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"\n{'='*60}")
+    print("KẾT QUẢ RETRIEVAL")
+    print(f"{'='*60}")
+    for mode, result in report["modes"].items():
+        base = (baseline or {}).get("modes", {}).get(mode)
+        print(f"\n📊 {mode}")
+        for name, value in result["quality"].items():
+            delta = ""
+            if base and name in base["quality"]:
+                delta = f" ({value - base['quality'][name]:+.3f})"
+            print(f"   - {name:<10} {value:.3f}{delta}")
+        print(f"   ⏱️ Latency (ms) p50 / p90 / p99:")
+        for step, p in result["latency_ms"].items():
+            delta = ""
+            if base and step in base["latency_ms"]:
+                delta = f" (p50 {p['p50'] - base['latency_ms'][step]['p50']:+.1f})"
+            print(f"   - {step:<10} {p['p50']:.1f} / {p['p90']:.1f} / {p['p99']:.1f}{delta}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Retrieval benchmark (recall@k, MRR, nDCG, latency), không gọi LLM")
+    parser.add_argument("--modes", default="dense,hybrid", help=f"Các mode, phân tách bằng dấu phẩy: {', '.join(MODES)}")
+    parser.add_argument("--depth", type=int, default=10, help="Số kết quả lấy về mỗi câu hỏi")
+    parser.add_argument("--rerank-pool", type=int, default=20, help="Số candidate đưa vào cross-encoder ở mode +rerank")
+    parser.add_argument("--qrels", default=RETRIEVAL_QRELS_FILE, help="File nhãn question -> chunk_id")
+    parser.add_argument("--reranker-model", default=CROSS_ENCODER_MODEL, help="Cross-encoder cho mode +rerank")
+    parser.add_argument("--use-query-cache", action="store_true", help="Dùng cache vector câu hỏi (mặc định tắt)")
+    parser.add_argument("--baseline", default=None, help="File JSON của lần chạy trước để in chênh lệch")
+    parser.add_argument("--build-qrels", action="store_true", help="Tạo file nhãn nháp từ benchmark_questions.txt")
+    parser.add_argument("--questions", default="benchmark_questions.txt", help="File câu hỏi cho --build-qrels")
+    parser.add_argument("--force", action="store_true", help="Ghi đè file nhãn khi --build-qrels")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"Unknown mode(s): {', '.join(unknown)}")
+
+    benchmark = RetrievalBenchmark(
+        qrels_file=args.qrels,
+        use_query_cache=args.use_query_cache,
+        rerank=any(m.endswith("+rerank") for m in modes),
+        reranker_model=args.reranker_model
+    )
+    if args.build_qrels:
+        benchmark.build_qrels(args.questions, force=args.force)
+        sys.exit(0)
+
+    report = benchmark.run(modes, depth=args.depth, rerank_pool=args.rerank_pool)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = f"benchmark_retrieval_{timestamp}.json"
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📁 File kết quả: {output_file}")
@@ -1,5 +1,7 @@
 """
 Benchmark Đơn Giản - Đánh giá PASS/FAIL
+Chạy song song nhiều câu hỏi (--workers); quota Groq do QuotaScheduler của pipeline điều phối,
+judge chấm theo batch (--judge-batch câu/lần gọi LLM).
 Tạo 2 file output:
 1. benchmark_results_full.xlsx: question + answer (đánh giá thủ công)
 2. benchmark_results_eval.xlsx: question + PASS/FAIL + thống kê (LLM đánh giá)
@@ -7,11 +9,13 @@ Tạo 2 file output:
 
 import time
 import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from groq import Groq
-import os
 from dotenv import load_dotenv
+import numpy as np
 
 load_dotenv()
 
@@ -20,6 +24,11 @@ project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 from src.pipeline import RAGPipeline
+# src/ đã nằm trong sys.path (src/pipeline.py tự thêm) -> import cùng module với pipeline (chung singleton)
+from llm.scheduler import TokenBucket
+from monitoring.tracing import get_tracer
+
+JUDGE_MODEL = "llama-3.1-8b-instant"
 
 # Check for openpyxl
 try:
@@ -32,13 +41,21 @@ except ImportError:
 
 
 class SimpleBenchmark:
-    def __init__(self, questions_file: str = "benchmark_questions.txt"):
+    def __init__(self, questions_file: str = "benchmark_questions.txt", transport: str = None, cassette: str = None):
         self.questions_file = questions_file
         self.questions = self.load_questions()
-        self.groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
         
         print(f"📋 Loaded {len(self.questions)} questions")
         
+        # Transport LLM (live / record / replay / synthetic) cho cả pipeline lẫn judge, đặt trước khi tạo pipeline
+        if transport or cassette:
+            from llm.client_factory import configure_client_factory
+            from config import LLM_TRANSPORT, LLM_CASSETTE_PATH
+            configure_client_factory(
+                transport_mode=transport or LLM_TRANSPORT,
+                cassette_path=cassette or LLM_CASSETTE_PATH
+            )
+        
         # Load pipeline
         print("🔧 Loading RAG pipeline...")
         from sentence_transformers import SentenceTransformer
@@ -48,6 +65,8 @@ class SimpleBenchmark:
             verbose=False,
             preloaded_model=embedding_model
         )
+        # Judge dùng chung client Groq (connection pool) với pipeline
+        self.groq_client = self.pipeline.client_factory.client
         print("✅ Pipeline ready")
     
     def load_questions(self) -> list:
@@ -82,25 +101,64 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
         try:
             response = self.groq_client.chat.completions.create(
                 messages=[{"role": "user", "content": prompt}],
-                model="llama-3.1-8b-instant",
+                model=JUDGE_MODEL,
                 temperature=0.1,
                 max_tokens=20
             )
-            result = response.choices[0].message.content.strip().upper()
-            
-            if "PASS" in result:
-                return ("PASS", None)
-            elif "NO_DATA" in result or "NODATA" in result:
-                return ("FAIL", "NO_DATA")
-            elif "WRONG" in result:
-                return ("FAIL", "WRONG")
-            else:
-                # Default to WRONG if just FAIL
-                return ("FAIL", "WRONG")
+            return self.parse_verdict(response.choices[0].message.content)
         except Exception as e:
             print(f"   ⚠️ Eval error: {e}")
             return ("FAIL", "ERROR")
     
+    @staticmethod
+    def parse_verdict(text: str) -> tuple:
+        result = str(text).strip().upper()
+        if "PASS" in result:
+            return ("PASS", None)
+        elif "NO_DATA" in result or "NODATA" in result:
+            return ("FAIL", "NO_DATA")
+        elif "WRONG" in result:
+            return ("FAIL", "WRONG")
+        else:
+            # Default to WRONG if just FAIL
+            return ("FAIL", "WRONG")
+    
+    def evaluate_batch(self, items: list) -> list:
+        """
+        Chấm nhiều cặp (question, answer) trong MỘT lần gọi LLM.
+        Kết quả không parse được / thiếu phần tử -> chấm lại từng câu bằng evaluate_answer.
+        """
+        blocks = "\n\n".join(
+            f"[{i}] CÂU HỎI: {question}\nCÂU TRẢ LỜI: {answer[:1500]}"
+            for i, (question, answer) in enumerate(items, 1)
+        )
+        prompt = f"""Đánh giá các câu trả lời của chatbot tư vấn tuyển sinh Đại học Bình Dương.
+
+{blocks}
+
+Tiêu chí đánh giá (cho TỪNG câu):
+- PASS: Câu trả lời có thông tin liên quan, hữu ích, hoặc trả lời đúng câu hỏi
+- FAIL_WRONG: Câu trả lời SAI, không chính xác, hoặc đưa thông tin không đúng
+- FAIL_NO_DATA: Chatbot nói "không tìm thấy", "không có thông tin", "không biết", hoặc câu trả lời quá chung chung không cụ thể
+
+CHỈ trả về JSON: {{"results": ["PASS" | "FAIL_WRONG" | "FAIL_NO_DATA", ...]}} gồm đúng {len(items)} phần tử theo thứ tự [1]..[{len(items)}]"""
+
+        try:
+            response = self.groq_client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=JUDGE_MODEL,
+                temperature=0.1,
+                max_tokens=20 * len(items) + 50,
+                response_format={"type": "json_object"}
+            )
+            verdicts = json.loads(response.choices[0].message.content).get("results", [])
+            if len(verdicts) == len(items):
+                return [self.parse_verdict(v) for v in verdicts]
+            print(f"   ⚠️ Judge batch trả {len(verdicts)}/{len(items)} kết quả, chấm lại từng câu")
+        except Exception as e:
+            print(f"   ⚠️ Judge batch error: {e}, chấm lại từng câu")
+        return [self.evaluate_answer(question, answer) for question, answer in items]
+    
     def detect_action(self, response: dict) -> str:
         """Detect action taken from pipeline response"""
         graded_stats = response.get("graded_stats", {})
@@ -119,6 +177,18 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
         else:
             return "UNKNOWN"
     
+    def _record_span(self, span):
+        with self._stage_lock:
+            self._stage_times.setdefault(span.name, []).append(span.duration_ms / 1000.0)
+    
+    @staticmethod
+    def percentiles(values: list, prefix: str = "") -> dict:
+        """p50/p90/p99 (giây); danh sách rỗng -> 0"""
+        return {
+            f"{prefix}p{q}": float(np.percentile(values, q)) if values else 0.0
+            for q in (50, 90, 99)
+        }
+    
     def save_excel(self, results_full: list, results_eval: list, stats: dict, timestamp: str):
         """Lưu kết quả dạng Excel"""
         
@@ -241,6 +311,27 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
         ws2[f"A{summary_row + 16}"] = "Thời gian TB:"
         ws2[f"B{summary_row + 16}"] = f"{stats['avg_response_time']:.2f}s"
         ws2[f"B{summary_row + 16}"].font = Font(bold=True)
+        
+        for offset, q in enumerate((50, 90, 99), start=17):
+            ws2[f"A{summary_row + offset}"] = f"p{q}:"
+            ws2[f"B{summary_row + offset}"] = f"{stats[f'latency_p{q}']:.2f}s"
+        
+        ws2[f"A{summary_row + 20}"] = "Tổng thời gian:"
+        ws2[f"B{summary_row + 20}"] = f"{stats['wall_time']:.1f}s ({stats['throughput_qpm']:.1f} câu/phút)"
+        
+        # Sheet thời gian theo stage
+        ws3 = wb2.create_sheet("Stage")
+        for col, header in zip("ABCDE", ["Stage", "Số lần", "p50 (s)", "p90 (s)", "p99 (s)"]):
+            ws3[f"{col}1"] = header
+            ws3[f"{col}1"].font = header_font
+            ws3[f"{col}1"].fill = header_fill
+        for i, (name, stage) in enumerate(stats["stages"].items(), start=2):
+            ws3[f"A{i}"] = name
+            ws3[f"B{i}"] = stage["count"]
+            ws3[f"C{i}"] = round(stage["p50"], 3)
+            ws3[f"D{i}"] = round(stage["p90"], 3)
+            ws3[f"E{i}"] = round(stage["p99"], 3)
+        ws3.column_dimensions["A"].width = 30
 
         
         ws2.column_dimensions["A"].width = 25
@@ -289,23 +380,85 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
             writer.writerow([])
             writer.writerow(["THỐNG KÊ THỜI GIAN"])
             writer.writerow(["Thời gian TB", f"{stats['avg_response_time']:.2f}s"])
+            for q in (50, 90, 99):
+                writer.writerow([f"p{q}", f"{stats[f'latency_p{q}']:.2f}s"])
+            writer.writerow(["Tổng thời gian", f"{stats['wall_time']:.1f}s"])
+            writer.writerow([])
+            writer.writerow(["Stage", "Số lần", "p50 (s)", "p90 (s)", "p99 (s)"])
+            for name, stage in stats["stages"].items():
+                writer.writerow([name, stage["count"], f"{stage['p50']:.3f}", f"{stage['p90']:.3f}", f"{stage['p99']:.3f}"])
         
         return full_file, eval_file
     
-    def run(self, limit: int = None, delay: int = 30):
+    def run(self, limit: int = None, workers: int = 4, qpm: float = None, judge_batch: int = 8):
         """
         Chạy benchmark
         Args:
             limit: Số câu hỏi tối đa (None = tất cả)
-            delay: Delay giữa các câu hỏi (giây)
+            workers: Số câu hỏi chạy đồng thời
+            qpm: Giới hạn số câu hỏi bắt đầu mỗi phút (token bucket); None = chỉ dựa vào QuotaScheduler
+            judge_batch: Số câu trả lời chấm trong một lần gọi judge
         """
         questions_to_run = self.questions[:limit] if limit else self.questions
         total = len(questions_to_run)
         
         print(f"\n{'='*60}")
-        print(f"BENCHMARK: {total} câu hỏi")
+        print(f"BENCHMARK: {total} câu hỏi ({workers} workers, judge batch {judge_batch})")
         print(f"{'='*60}\n")
         
+        # Latency từng stage lấy từ span của tracer (pipeline.retrieve, crag.grade, groq.chat, ...)
+        self._stage_times = {}
+        self._stage_lock = threading.Lock()
+        tracer = get_tracer()
+        tracer.add_listener(self._record_span)
+        
+        bucket = TokenBucket(capacity=1, per_minute=qpm) if qpm else None
+        bucket_lock = threading.Lock()
+        
+        def admit():
+            if bucket is None:
+                return
+            while True:
+                with bucket_lock:
+                    wait = bucket.time_until(1, time.time())
+                    if wait == 0:
+                        bucket.take(1)
+                        return
+                time.sleep(wait)
+        
+        def run_one(i, question):
+            admit()
+            start_time = time.time()
+            try:
+                # user_id riêng mỗi câu: rate limit theo user của SecurityManager không chặn benchmark song song
+                response = self.pipeline.run(question, user_id=f"benchmark_user_{i}")
+                return {"question": question, "response": response, "response_time": time.time() - start_time}
+            except Exception as e:
+                print(f"   ❌ ERROR [{i}]: {e}")
+                return {"question": question, "error": e}
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="benchmark") as executor:
+            wall_start = time.time()
+            try:
+                runs = list(executor.map(run_one, range(1, total + 1), questions_to_run))
+            finally:
+                # Span của judge không tính vào thời gian theo stage
+                tracer.remove_listener(self._record_span)
+            wall_time = time.time() - wall_start
+            
+            # Judge theo batch (các batch chạy song song, cũng đi qua QuotaScheduler)
+            judged = [i for i, r in enumerate(runs) if "error" not in r]
+            batches = [judged[k:k + judge_batch] for k in range(0, len(judged), judge_batch)]
+            verdict_lists = executor.map(
+                lambda batch: self.evaluate_batch(
+                    [(runs[i]["question"], runs[i]["response"].get("answer", "")) for i in batch]
+                ),
+                batches
+            )
+            verdicts = {}
+            for batch, batch_verdicts in zip(batches, verdict_lists):
+                verdicts.update(zip(batch, batch_verdicts))
+        
         results_full = []
         results_eval = []
         response_times = []
@@ -320,70 +473,18 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
         action_websearch = 0
         action_unknown = 0
         
-        for i, question in enumerate(questions_to_run, 1):
-            print(f"[{i}/{total}] {question[:60]}...")
+        for i, run in enumerate(runs):
+            question = run["question"]
+            print(f"[{i + 1}/{total}] {question[:60]}...")
             
-            try:
-                # Chạy pipeline
-                start_time = time.time()
-                response = self.pipeline.run(question, user_id="benchmark_user")
-                response_time = time.time() - start_time
-                response_times.append(response_time)
-                
-                answer = response.get("answer", "")
-                
-                # Detect action
-                action = self.detect_action(response)
-                if action == "CORRECT":
-                    action_correct += 1
-                elif action == "KNOWLEDGE_REFINEMENT":
-                    action_refinement += 1
-                elif action == "WEB_SEARCH":
-                    action_websearch += 1
-                else:
-                    action_unknown += 1
-                
-                # LLM đánh giá
-                result, fail_reason = self.evaluate_answer(question, answer)
-                
-                if result == "PASS":
-                    passed += 1
-                    print(f"   ✅ PASS | Action: {action} | Time: {response_time:.2f}s")
-                else:
-                    failed += 1
-                    if fail_reason == "WRONG":
-                        fail_wrong += 1
-                        print(f"   ❌ FAIL (Sai) | Action: {action} | Time: {response_time:.2f}s")
-                    elif fail_reason == "NO_DATA":
-                        fail_no_data += 1
-                        print(f"   ❌ FAIL (Thiếu dữ liệu) | Action: {action} | Time: {response_time:.2f}s")
-                    else:
-                        fail_error += 1
-                        print(f"   ❌ FAIL (Error) | Action: {action} | Time: {response_time:.2f}s")
-                
-                # Tạo result string cho output
-                result_str = result if result == "PASS" else f"FAIL_{fail_reason}"
-                
-                results_full.append({
-                    "question": question,
-                    "answer": answer
-                })
-                results_eval.append({
-                    "question": question,
-                    "result": result_str,
-                    "fail_reason": fail_reason,
-                    "action": action,
-                    "response_time": response_time
-                })
-                
-            except Exception as e:
-                print(f"   ❌ ERROR: {e}")
+            if "error" in run:
+                print(f"   ❌ ERROR: {run['error']}")
                 failed += 1
                 fail_error += 1
                 action_unknown += 1
                 results_full.append({
                     "question": question,
-                    "answer": f"ERROR: {e}"
+                    "answer": f"ERROR: {run['error']}"
                 })
                 results_eval.append({
                     "question": question,
@@ -392,10 +493,56 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
                     "action": "ERROR",
                     "response_time": 0
                 })
+                continue
+            
+            response = run["response"]
+            response_time = run["response_time"]
+            response_times.append(response_time)
+            answer = response.get("answer", "")
+            
+            # Detect action
+            action = self.detect_action(response)
+            if action == "CORRECT":
+                action_correct += 1
+            elif action == "KNOWLEDGE_REFINEMENT":
+                action_refinement += 1
+            elif action == "WEB_SEARCH":
+                action_websearch += 1
+            else:
+                action_unknown += 1
+            
+            # LLM đánh giá
+            result, fail_reason = verdicts[i]
+            
+            if result == "PASS":
+                passed += 1
+                print(f"   ✅ PASS | Action: {action} | Time: {response_time:.2f}s")
+            else:
+                failed += 1
+                if fail_reason == "WRONG":
+                    fail_wrong += 1
+                    print(f"   ❌ FAIL (Sai) | Action: {action} | Time: {response_time:.2f}s")
+                elif fail_reason == "NO_DATA":
+                    fail_no_data += 1
+                    print(f"   ❌ FAIL (Thiếu dữ liệu) | Action: {action} | Time: {response_time:.2f}s")
+                else:
+                    fail_error += 1
+                    print(f"   ❌ FAIL (Error) | Action: {action} | Time: {response_time:.2f}s")
+            
+            # Tạo result string cho output
+            result_str = result if result == "PASS" else f"FAIL_{fail_reason}"
             
-            # Delay để tránh rate limit
-            if i < total:
-                time.sleep(delay)
+            results_full.append({
+                "question": question,
+                "answer": answer
+            })
+            results_eval.append({
+                "question": question,
+                "result": result_str,
+                "fail_reason": fail_reason,
+                "action": action,
+                "response_time": response_time
+            })
         
         # Tính accuracy và avg response time
         accuracy = (passed / total) * 100 if total > 0 else 0
@@ -413,7 +560,14 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
             "action_refinement": action_refinement,
             "action_websearch": action_websearch,
             "action_unknown": action_unknown,
-            "avg_response_time": avg_response_time
+            "avg_response_time": avg_response_time,
+            **self.percentiles(response_times, prefix="latency_"),
+            "wall_time": wall_time,
+            "throughput_qpm": total / wall_time * 60 if wall_time > 0 else 0,
+            "stages": {
+                name: {"count": len(times), **self.percentiles(times)}
+                for name, times in sorted(self._stage_times.items())
+            }
         }
         
         # Lưu kết quả
@@ -441,6 +595,12 @@ CHỈ trả về một trong ba: PASS, FAIL_WRONG, FAIL_NO_DATA"""
         print(f"   - WEB_SEARCH: {action_websearch}")
         print(f"   - UNKNOWN: {action_unknown}")
         print(f"\n⏱️ Thời gian phản hồi TB: {avg_response_time:.2f}s")
+        print(f"   p50: {stats['latency_p50']:.2f}s | p90: {stats['latency_p90']:.2f}s | p99: {stats['latency_p99']:.2f}s")
+        print(f"   Tổng thời gian: {wall_time:.1f}s ({stats['throughput_qpm']:.1f} câu/phút)")
+        if stats["stages"]:
+            print(f"\n🔍 Thời gian theo stage (p50 / p90 / p99):")
+            for name, stage in stats["stages"].items():
+                print(f"   - {name:<28} {stage['p50']:.3f}s / {stage['p90']:.3f}s / {stage['p99']:.3f}s (n={stage['count']})")
         print(f"\n📁 File kết quả:")
         print(f"   - {full_file} (đánh giá thủ công)")
         print(f"   - {eval_file} (đánh giá tự động)")
@@ -453,8 +613,13 @@ if __name__ == "__main__":
     
     parser = argparse.ArgumentParser(description="Simple Benchmark PASS/FAIL")
     parser.add_argument("--limit", type=int, default=None, help="Số câu hỏi tối đa")
-    parser.add_argument("--delay", type=int, default=30, help="Delay giữa các câu (giây)")
+    parser.add_argument("--workers", type=int, default=4, help="Số câu hỏi chạy đồng thời")
+    parser.add_argument("--qpm", type=float, default=None, help="Giới hạn câu hỏi/phút (mặc định để QuotaScheduler điều phối)")
+    parser.add_argument("--judge-batch", type=int, default=8, help="Số câu trả lời chấm trong một lần gọi judge")
+    parser.add_argument("--transport", choices=["live", "record", "replay", "synthetic"], default=None,
+                        help="Transport LLM (mặc định theo LLM_TRANSPORT trong config)")
+    parser.add_argument("--cassette", default=None, help="File cassette cho record/replay/synthetic")
     args = parser.parse_args()
     
-    benchmark = SimpleBenchmark()
-    benchmark.run(limit=args.limit, delay=args.delay)
+    benchmark = SimpleBenchmark(transport=args.transport, cassette=args.cassette)
+    benchmark.run(limit=args.limit, workers=args.workers, qpm=args.qpm, judge_batch=args.judge_batch)
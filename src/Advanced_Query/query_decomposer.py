@@ -1,16 +1,25 @@
 from typing import List, Dict
 import re
 import json
-from groq import Groq
-import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
+sys.path.append(str(Path(__file__).parent.parent))
+from config import FAST_LLM_MODEL
+from llm.client_factory import GroqClientFactory, get_client_factory
+from llm.scheduler import PRIORITY_GRADING
+from monitoring.tracing import traced, current_span
+
 
 class QueryDecomposer:
-    def __init__(self, groq_api_key: str = None):
-        api_key = groq_api_key or os.getenv("GROQ_API_KEY")
-        self.client = Groq(api_key=api_key)        
+    def __init__(self, groq_api_key: str = None, client_factory: GroqClientFactory = None):
+        client_factory = client_factory or get_client_factory(groq_api_key)
+        self.client = client_factory.client
+        self.async_client = client_factory.async_client
+        self.hedger = client_factory.hedger
+        self.model_name = FAST_LLM_MODEL
     
         self.multi_intent_patterns = [
             r'.{10,}\s+và\s+.{10,}',      
@@ -72,8 +81,10 @@ class QueryDecomposer:
             "confidence": confidence
         }
     
+    @traced("decomposer.decompose")
     def decompose(self, query: str) -> List[str]:
         check_result = self.should_decompose(query)
+        current_span().set(llm_called=check_result["should_decompose"])
         
         if not check_result["should_decompose"]:
             print(f"[Decomposer] Single query (confidence: {check_result['confidence']:.2f})")
@@ -83,35 +94,87 @@ class QueryDecomposer:
         
         try:
             sub_queries = self._llm_decompose(query)            
-           
-            if len(sub_queries) > 1: # Validation nếu LLM trả về > 1 nhưng giống nhau hoặc vô nghĩa -> giữ nguyên
-                # Check nếu sub-queries quá ngắn hoặc giống query gốc
-                valid_subs = [sq for sq in sub_queries if len(sq) > 15 and sq.lower() != query.lower()]
-                if len(valid_subs) < 2:
-                    print("[Decomposer] LLM output invalid, keeping original")
-                    return [query]
-                sub_queries = valid_subs
-            
-            if len(sub_queries) == 1:
-                print("[Decomposer] LLM kept as single query")
-                return sub_queries
+            return self._validate_sub_queries(query, sub_queries)
             
-            print(f"[Decomposer] ✅ Split into {len(sub_queries)} sub-queries:")
-            for i, sq in enumerate(sub_queries, 1):
-                print(f"   [{i}] {sq}")
-                        
-            if len(sub_queries) > 3:#  khi quá nhiều sub-queries
-                print("[Decomposer] ⚠️ Câu hỏi quá phức tạp, yêu cầu người dùng chia nhỏ")
-                return ["TOO_COMPLEX"]
-            
-            return sub_queries
+        except Exception as e:
+            print(f"[Decomposer] ❌ Error: {e}, using original query")
+            return [query]
+    
+    @traced("decomposer.decompose")
+    async def adecompose(self, query: str) -> List[str]:
+        """Bản async của decompose (AsyncGroq)"""
+        check_result = self.should_decompose(query)
+        current_span().set(llm_called=check_result["should_decompose"])
+        
+        if not check_result["should_decompose"]:
+            print(f"[Decomposer] Single query (confidence: {check_result['confidence']:.2f})")
+            return [query]
+        
+        print(f"[Decomposer] Complex query detected - {check_result['reason']}")
+        
+        try:
+            sub_queries = await self._allm_decompose(query)
+            return self._validate_sub_queries(query, sub_queries)
             
         except Exception as e:
             print(f"[Decomposer] ❌ Error: {e}, using original query")
             return [query]
     
+    def _validate_sub_queries(self, query: str, sub_queries: List[str]) -> List[str]:
+        if len(sub_queries) > 1: # Validation nếu LLM trả về > 1 nhưng giống nhau hoặc vô nghĩa -> giữ nguyên
+            # Check nếu sub-queries quá ngắn hoặc giống query gốc
+            valid_subs = [sq for sq in sub_queries if len(sq) > 15 and sq.lower() != query.lower()]
+            if len(valid_subs) < 2:
+                print("[Decomposer] LLM output invalid, keeping original")
+                return [query]
+            sub_queries = valid_subs
+        
+        if len(sub_queries) == 1:
+            print("[Decomposer] LLM kept as single query")
+            return sub_queries
+        
+        print(f"[Decomposer] ✅ Split into {len(sub_queries)} sub-queries:")
+        for i, sq in enumerate(sub_queries, 1):
+            print(f"   [{i}] {sq}")
+                    
+        if len(sub_queries) > 3:#  khi quá nhiều sub-queries
+            print("[Decomposer] ⚠️ Câu hỏi quá phức tạp, yêu cầu người dùng chia nhỏ")
+            return ["TOO_COMPLEX"]
+        
+        return sub_queries
+    
     def _llm_decompose(self, query: str) -> List[str]:    
-        prompt = f"""Phân tách câu hỏi phức tạp thành các câu hỏi đơn giản, độc lập.
+        prompt = self._build_prompt(query)
+        response = self.hedger.run(
+            lambda model: self.client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model,
+                temperature=0.2,  # Giảm để ổn định hơn
+                max_tokens=200,
+                priority=PRIORITY_GRADING  # nằm trên đường trả lời người dùng, ưu tiên như grading
+            ),
+            self.model_name,
+            self.model_name  # hedge bằng request trùng lặp tới chính model 8B
+        )
+        return self._parse_sub_queries(query, response.choices[0].message.content)
+    
+    async def _allm_decompose(self, query: str) -> List[str]:
+        prompt = self._build_prompt(query)
+        response = await self.hedger.arun(
+            lambda model: self.async_client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model,
+                temperature=0.2,
+                max_tokens=200,
+                priority=PRIORITY_GRADING
+            ),
+            self.model_name,
+            self.model_name
+        )
+        return self._parse_sub_queries(query, response.choices[0].message.content)
+    
+    def _build_prompt(self, query: str) -> str:
+        return f"""Phân tách câu hỏi phức tạp thành các câu hỏi đơn giản, độc lập.
 
 QUY TẮC QUAN TRỌNG:
 1. CHỈ phân tách nếu câu hỏi THỰC SỰ có NHIỀU Ý KHÁC NHAU
@@ -147,15 +210,9 @@ CÂU HỎI CẦN XỬ LÝ:
 "{query}"
 
 Trả về JSON array:"""
-
-        response = self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama-3.1-8b-instant",
-            temperature=0.2,  # Giảm để ổn định hơn
-            max_tokens=200
-        )
-        
-        content = response.choices[0].message.content.strip()
+    
+    def _parse_sub_queries(self, query: str, content: str) -> List[str]:
+        content = content.strip()
         content = re.sub(r'```json\s*|\s*```', '', content)
         
         try:
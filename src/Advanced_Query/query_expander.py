@@ -2,35 +2,45 @@
 from typing import List
 import re
 import json
-from groq import Groq
+import asyncio
+from functools import partial
 import numpy as np
 from sentence_transformers import SentenceTransformer
-import os
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
+sys.path.append(str(Path(__file__).parent.parent))
+from config import FAST_LLM_MODEL
+from llm.client_factory import GroqClientFactory, get_client_factory
+from llm.scheduler import PRIORITY_EXPANSION
+from monitoring.tracing import traced, bind_context
+
 
 class QueryExpander: 
     
     def __init__(
         self, 
         groq_api_key: str = None,
-        embedding_model: SentenceTransformer = None
+        embedding_model: SentenceTransformer = None,
+        client_factory: GroqClientFactory = None
     ):
-        api_key = groq_api_key or os.getenv("GROQ_API_KEY")
-        self.client = Groq(api_key=api_key)
-        self.model_name = "llama-3.1-8b-instant"
+        client_factory = client_factory or get_client_factory(groq_api_key)
+        self.client = client_factory.client
+        self.async_client = client_factory.async_client
+        self.model_name = FAST_LLM_MODEL
         self.embed_model = embedding_model        
         print("✅ QueryExpander initialized")
     
+    @traced("expander.expand")
     def expand(
         self, 
         query: str, 
         num_variations: int = 2,
         use_filtering: bool = True,
-        include_original: bool = True
-        
-        
+        include_original: bool = True,
+        vector_context=None
     ) -> List[str]:             
         if len(query.split()) <= 3:  # không cần expansion
             print(f"[Expander] Query too short, no expansion")
@@ -38,34 +48,95 @@ class QueryExpander:
         
         try: # Generate variations với LLM            
             raw_variations = self._llm_expand(query, num_variations)            
-            if not raw_variations:
-                return [query] if include_original else []
-                      
-            if use_filtering and self.embed_model:
-                variations = self._filter_by_similarity(query, raw_variations, top_k=num_variations)
-            else:
-                variations = raw_variations[:num_variations]
-                
-            if include_original:
-                final_queries = [query] + variations
-                print(f"[Expander] ✅ Expanded into {len(final_queries)} queries (with original)")
-            else:
-                final_queries = variations
-                print(f"[Expander] ✅ Generated {len(final_queries)} variations (without original)")
-            
-            for i, q in enumerate(final_queries):
-                prefix = "[Original]" if (include_original and i == 0) else f"[Var {i}]"
-                print(f"   {prefix} {q}")
+            return self._select_variations(
+                query, raw_variations, num_variations, use_filtering, include_original, vector_context
+            )
             
-            return final_queries
+        except Exception as e:
+            print(f"[Expander] ❌ Error: {e}, using original only")
+            return [query] if include_original else []
+    
+    @traced("expander.expand")
+    async def aexpand(
+        self, 
+        query: str, 
+        num_variations: int = 2,
+        use_filtering: bool = True,
+        include_original: bool = True,
+        vector_context=None,
+        executor=None
+    ) -> List[str]:
+        """Bản async của expand: gọi LLM qua AsyncGroq, phần embed/lọc chạy trong executor"""
+        if len(query.split()) <= 3:
+            print(f"[Expander] Query too short, no expansion")
+            return [query] if include_original else []
+        
+        try:
+            raw_variations = await self._allm_expand(query, num_variations)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, bind_context(partial(
+                self._select_variations,
+                query, raw_variations, num_variations, use_filtering, include_original, vector_context
+            )))
             
         except Exception as e:
             print(f"[Expander] ❌ Error: {e}, using original only")
             return [query] if include_original else []
     
-    def _llm_expand(self, query: str, num_variations: int) -> List[str]:
+    def _select_variations(
+        self,
+        query: str,
+        raw_variations: List[str],
+        num_variations: int,
+        use_filtering: bool,
+        include_original: bool,
+        vector_context=None
+    ) -> List[str]:
+        if not raw_variations:
+            return [query] if include_original else []
+                  
+        if use_filtering and (self.embed_model or vector_context):
+            variations = self._filter_by_similarity(
+                query, raw_variations, top_k=num_variations, vector_context=vector_context
+            )
+        else:
+            variations = raw_variations[:num_variations]
+            
+        if include_original:
+            final_queries = [query] + variations
+            print(f"[Expander] ✅ Expanded into {len(final_queries)} queries (with original)")
+        else:
+            final_queries = variations
+            print(f"[Expander] ✅ Generated {len(final_queries)} variations (without original)")
+        
+        for i, q in enumerate(final_queries):
+            prefix = "[Original]" if (include_original and i == 0) else f"[Var {i}]"
+            print(f"   {prefix} {q}")
         
-        prompt = f"""Bạn là hệ thống tạo biến thể câu hỏi để cải thiện tìm kiếm.
+        return final_queries
+    
+    def _llm_expand(self, query: str, num_variations: int) -> List[str]:
+        response = self.client.chat.completions.create(
+            messages=[{"role": "user", "content": self._build_prompt(query, num_variations)}],
+            model=self.model_name,
+            temperature=0.7,  # Cao hơn để có diversity
+            max_tokens=200,
+            priority=PRIORITY_EXPANSION
+        )
+        return self._parse_variations(query, response.choices[0].message.content)
+    
+    async def _allm_expand(self, query: str, num_variations: int) -> List[str]:
+        response = await self.async_client.chat.completions.create(
+            messages=[{"role": "user", "content": self._build_prompt(query, num_variations)}],
+            model=self.model_name,
+            temperature=0.7,
+            max_tokens=200,
+            priority=PRIORITY_EXPANSION
+        )
+        return self._parse_variations(query, response.choices[0].message.content)
+    
+    def _build_prompt(self, query: str, num_variations: int) -> str:
+        return f"""Bạn là hệ thống tạo biến thể câu hỏi để cải thiện tìm kiếm.
 
 NHIỆM VỤ: Tạo {num_variations} cách hỏi KHÁC NHAU cho cùng 1 ý nghĩa.
 
@@ -93,15 +164,9 @@ CÂU HỎI GỐC:
 "{query}"
 
 Trả về JSON array với {num_variations} biến thể:"""
-
-        response = self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model=self.model_name,
-            temperature=0.7,  # Cao hơn để có diversity
-            max_tokens=200
-        )
-        
-        content = response.choices[0].message.content.strip()
+    
+    def _parse_variations(self, query: str, content: str) -> List[str]:
+        content = content.strip()
         content = re.sub(r'```json\s*|\s*```', '', content)
         
         try:
@@ -127,14 +192,18 @@ Trả về JSON array với {num_variations} biến thể:"""
         query: str, 
         variations: List[str], 
         top_k: int,
-        min_similarity: float = 0.5
+        min_similarity: float = 0.5,
+        vector_context=None
     ) -> List[str]:
         if not variations:
             return []
         
-        # Embed all
-        query_vec = self.embed_model.encode(query, convert_to_numpy=True)
-        var_vecs = self.embed_model.encode(variations, convert_to_numpy=True)
+        # Embed all trong một batch (dùng lại vector của request nếu có context)
+        if vector_context is not None:
+            vectors = vector_context.get_many([query] + variations)
+        else:
+            vectors = self.embed_model.encode([query] + variations, convert_to_numpy=True)
+        query_vec, var_vecs = vectors[0], vectors[1:]
                 
         from numpy.linalg import norm # tính độ tương đồng cosin
         scored = []
@@ -198,11 +267,7 @@ class CRAGRetrieverWithExpansion:
         return {
             "query": query,
             "refined_chunks": refined_chunks,
-            "graded_stats": {
-                "correct": len(graded["correct"]),
-                "incorrect": len(graded["incorrect"]),
-                "ambiguous": len(graded["ambiguous"])
-            },
+            "graded_stats": self.retriever.graded_stats(graded),
             "action_taken": action,
             "num_expanded_queries": len(expanded_queries)
         }
\ No newline at end of file
@@ -6,14 +6,20 @@ import time
 from collections import Counter
 import pandas as pd
 import json
+import sys
+from pathlib import Path
 from datetime import datetime
 import fitz 
 from docx import Document
-from groq import Groq
 from src.embedding.indexer import QdrantIndexer
 from src.security.security import SecurityManager 
 from langchain_text_splitters import RecursiveCharacterTextSplitter 
 from src.database import add_document, delete_document_record, get_all_documents 
+
+# Import client factory theo cùng tên module với pipeline ("llm.client_factory", không phải "src.llm...")
+# để admin dùng chung client pool, quota scheduler và metrics với chatbot
+sys.path.append(str(Path(__file__).parent))
+from llm.client_factory import GroqClientFactory, get_client_factory
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -100,8 +106,12 @@ def get_top_keywords():
         return []
 
 class GroqParser:
-    def __init__(self):
-        self.client = Groq(api_key=GROQ_API_KEY)
+    def __init__(self, llm_client=None, transport=None):
+        # Dùng client Groq của pipeline nếu có (chung connection pool + giới hạn đồng thời)
+        # transport (src.llm.transport): chạy OCR với replay/synthetic, không cần gọi Groq
+        if llm_client is None and transport is not None:
+            llm_client = GroqClientFactory(GROQ_API_KEY, transport=transport).client
+        self.client = llm_client or get_client_factory(GROQ_API_KEY).client
 
     def encode_image(self, image_bytes):
         return base64.b64encode(image_bytes).decode('utf-8')
@@ -144,7 +154,7 @@ Yêu cầu bắt buộc:
             return ""
 
 
-def process_uploaded_file(uploaded_file, client=None, model=None):
+def process_uploaded_file(uploaded_file, client=None, model=None, llm_client=None):
     
     # 1. SECURITY CHECK
     is_valid, error_msg = security_manager.validate_file(uploaded_file)
@@ -161,7 +171,7 @@ def process_uploaded_file(uploaded_file, client=None, model=None):
         with open(file_path, "wb") as f:
             f.write(file_bytes)
             
-        parser = GroqParser()
+        parser = GroqParser(llm_client)
         full_markdown_text = ""
         original_display_name = uploaded_file.name
         doc_type = "text_plain" # Mặc định        
@@ -217,18 +227,24 @@ def process_uploaded_file(uploaded_file, client=None, model=None):
             except: pass
 
         # CHUNKING & INDEXING
-        chunks_data = []
+        num_chunks = 0
         if full_markdown_text and full_markdown_text.strip():
             text_chunks = text_splitter.split_text(full_markdown_text)
-            
-            for content in text_chunks:
-                chunks_data.append({
+            upload_ts = datetime.now().timestamp()
+
+            # Đưa chunk thẳng từ text splitter vào indexer (không ghi file tạm)
+            chunk_stream = (
+                {
+                    "chunk_id": f"upload_{upload_ts}_{i}",
                     "content": content,
+                    "url": "Tài liệu Admin Upload",
+                    "title": original_display_name,
                     "type": doc_type,
-                    "source": "admin_upload_multimodal"
-                })
+                    "full_content": content
+                }
+                for i, content in enumerate(text_chunks)
+            )
 
-        if chunks_data:
             indexer = QdrantIndexer(
                 qdrant_path="./qdrant_data",
                 collection_name="bdu_chunks_gemma",
@@ -236,25 +252,14 @@ def process_uploaded_file(uploaded_file, client=None, model=None):
                 client=client,
                 model=model
             )
+            stats = indexer.index_chunks(chunk_stream, source_file=original_display_name)
+            num_chunks = stats["total"]
+
+            if num_chunks:
+                # Lưu vào SQLite để quản lý nhanh
+                add_document(original_display_name, num_chunks)
             
-            temp_jsonl = os.path.join(save_dir, "temp_chunks.jsonl")
-            with open(temp_jsonl, "w", encoding="utf-8") as f:
-                for i, item in enumerate(chunks_data):
-                    payload = {
-                        "chunk_id": f"upload_{datetime.now().timestamp()}_{i}",
-                        "content": item["content"], 
-                        "url": "Tài liệu Admin Upload",
-                        "title": original_display_name, 
-                        "type": item["type"],
-                        "full_content": item["content"] 
-                    }
-                    f.write(json.dumps(payload, ensure_ascii=False) + "\n")
-            indexer.index_jsonl(temp_jsonl)
-            
-            # Lưu vào SQLite để quản lý nhanh
-            add_document(original_display_name, len(chunks_data))
-            
-        return len(chunks_data)
+        return num_chunks
 
     except Exception as e:
         print(f"❌ Critical Error: {e}")
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .lru import LRUCache
+from .keys import normalize_query
+from .corpus_version import get_corpus_version
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời của LLM.
+    - Tầng 1: LRU trong RAM, giới hạn theo số entry và/hoặc bytes, TTL từng entry
+    - Tầng 2 (tùy chọn): SQLite, giữ được qua các lần restart
+    Key = query chuẩn hóa + TOÀN BỘ danh sách chunk_id theo thứ tự + corpus version (+ sub-queries).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 500,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: float = 86400,
+        sqlite_path: Optional[str] = None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path
+        self._lru = LRUCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+            size_fn=_json_size
+        )
+        self._db_lock = threading.Lock()
+        self.sqlite_hits = 0
+
+        if sqlite_path:
+            self._init_db()
+
+    @staticmethod
+    def make_key(query: str, chunks: List[Dict], sub_queries: List[str] = None) -> str:
+        parts = [
+            normalize_query(query),
+            "|".join(str(c.get("chunk_id", "")) for c in chunks),
+            get_corpus_version()
+        ]
+        if sub_queries:
+            parts.append("|".join(normalize_query(sq) for sq in sub_queries))
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def _init_db(self):
+        conn = sqlite3.connect(self.sqlite_path)
+        conn.execute('''CREATE TABLE IF NOT EXISTS answer_cache
+                        (key TEXT PRIMARY KEY,
+                         value TEXT,
+                         expires_at REAL)''')
+        conn.execute("DELETE FROM answer_cache WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+        conn.close()
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self._lru.get(key)
+        if value is not None or not self.sqlite_path:
+            return value
+
+        try:
+            with self._db_lock:
+                conn = sqlite3.connect(self.sqlite_path)
+                row = conn.execute(
+                    "SELECT value, expires_at FROM answer_cache WHERE key = ?", (key,)
+                ).fetchone()
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[AnswerCache] ⚠️ SQLite read error: {e}")
+            return None
+
+        if not row or row[1] < time.time():
+            return None
+
+        value = json.loads(row[0])
+        self.sqlite_hits += 1
+        # Đưa lên tầng RAM với thời gian sống còn lại
+        self._lru.set(key, value, ttl_seconds=row[1] - time.time())
+        return value
+
+    def set(self, key: str, value: Dict):
+        self._lru.set(key, value)
+        if not self.sqlite_path:
+            return
+
+        try:
+            with self._db_lock:
+                conn = sqlite3.connect(self.sqlite_path)
+                conn.execute(
+                    "INSERT OR REPLACE INTO answer_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl_seconds)
+                )
+                conn.commit()
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[AnswerCache] ⚠️ SQLite write error: {e}")
+
+    def stats(self) -> Dict:
+        stats = self._lru.stats()
+        stats["sqlite_hits"] = self.sqlite_hits
+        return stats
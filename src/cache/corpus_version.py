@@ -0,0 +1,46 @@
+import os
+import time
+import threading
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import DATA_DIR
+
+# Phiên bản dữ liệu: đổi mỗi khi index/xóa chunk -> các cache/index phụ thuộc tự làm mới.
+# Lưu ra file để các process khác (app, admin, script index) cùng thấy.
+CORPUS_VERSION_FILE = os.path.join(DATA_DIR, "corpus_version")
+
+_lock = threading.Lock()
+_cached_mtime = None
+_cached_version = "0"
+
+
+def get_corpus_version() -> str:
+    global _cached_mtime, _cached_version
+    try:
+        mtime = os.stat(CORPUS_VERSION_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return "0"
+
+    with _lock:
+        # Chỉ đọc lại file khi mtime thay đổi
+        if mtime != _cached_mtime:
+            try:
+                with open(CORPUS_VERSION_FILE, "r", encoding="utf-8") as f:
+                    _cached_version = f.read().strip() or "0"
+                _cached_mtime = mtime
+            except OSError:
+                pass
+        return _cached_version
+
+
+def bump_corpus_version() -> str:
+    version = str(time.time_ns())
+    os.makedirs(os.path.dirname(CORPUS_VERSION_FILE), exist_ok=True)
+    tmp_path = CORPUS_VERSION_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, CORPUS_VERSION_FILE)
+    print(f"[Corpus] 🔄 Corpus version -> {version}")
+    return version
@@ -0,0 +1,115 @@
+import os
+import re
+import json
+import hashlib
+from typing import Dict, List, Optional
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Cache embedding bền vững theo (model, hash nội dung).
+    - Vector lưu trong ma trận .npy memory-mapped (không load hết vào RAM)
+    - File index JSON: content_hash -> số dòng trong ma trận
+    Mỗi model có file riêng nên đổi model là tự động có cache mới.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, initial_capacity: int = 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        slug = re.sub(r'[^a-zA-Z0-9]+', '_', model_name).strip('_')
+
+        self.model_name = model_name
+        self.vectors_path = os.path.join(cache_dir, f"{slug}.npy")
+        self.index_path = os.path.join(cache_dir, f"{slug}.index.json")
+        self.initial_capacity = initial_capacity
+
+        self.rows: Dict[str, int] = {}
+        self.vectors: Optional[np.memmap] = None
+        self._dirty = False
+        self._load()
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.vectors_path)):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("model") != self.model_name:
+                print(f"[EmbedCache] ⚠️ Model mismatch, ignoring cache: {self.index_path}")
+                return
+            self.vectors = np.lib.format.open_memmap(self.vectors_path, mode="r+")
+            self.rows = index.get("rows", {})
+            print(f"[EmbedCache] 💾 Loaded {len(self.rows)} cached embeddings")
+        except Exception as e:
+            print(f"[EmbedCache] ⚠️ Cannot load cache ({e}), starting empty")
+            self.rows = {}
+            self.vectors = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self.rows
+
+    def get(self, content_hash: str) -> Optional[np.ndarray]:
+        row = self.rows.get(content_hash)
+        if row is None:
+            return None
+        return np.array(self.vectors[row])
+
+    def get_many(self, content_hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        for h in content_hashes:
+            vector = self.get(h)
+            if vector is not None:
+                found[h] = vector
+        return found
+
+    def _ensure_capacity(self, needed: int, dimension: int):
+        if self.vectors is not None and self.vectors.shape[0] >= needed:
+            return
+
+        old = self.vectors
+        capacity = max(needed, self.initial_capacity, (old.shape[0] * 2) if old is not None else 0)
+        tmp_path = self.vectors_path + ".tmp.npy"
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(capacity, dimension)
+        )
+        if old is not None:
+            grown[:old.shape[0]] = old
+        grown.flush()
+
+        # Giải phóng memmap cũ trước khi thay file
+        del grown
+        self.vectors = None
+        del old
+        os.replace(tmp_path, self.vectors_path)
+        self.vectors = np.lib.format.open_memmap(self.vectors_path, mode="r+")
+
+    def put_many(self, content_hashes: List[str], vectors: List[np.ndarray]):
+        new_items = [(h, v) for h, v in zip(content_hashes, vectors) if h not in self.rows]
+        if not new_items:
+            return
+
+        dimension = len(new_items[0][1])
+        self._ensure_capacity(len(self.rows) + len(new_items), dimension)
+
+        for h, v in new_items:
+            row = len(self.rows)
+            self.vectors[row] = np.asarray(v, dtype=np.float32)
+            self.rows[h] = row
+        self._dirty = True
+
+    def flush(self):
+        if not self._dirty:
+            return
+        self.vectors.flush()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "rows": self.rows}, f)
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
@@ -0,0 +1,34 @@
+from typing import Dict, Optional, Tuple
+
+from .lru import LRUCache
+from .keys import normalize_query
+from .corpus_version import get_corpus_version
+
+
+class GradeCache:
+    """
+    Cache kết quả chấm điểm độ liên quan (label + confidence) cho từng cặp (query, chunk).
+    Key gồm corpus version -> khi chunk được index lại / bị xóa, toàn bộ grade cũ tự hết hiệu lực.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 3600):
+        self._lru = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    @staticmethod
+    def _key(query: str, document: Dict) -> Optional[Tuple[str, str, str]]:
+        chunk_id = document.get("chunk_id")
+        if not chunk_id:
+            return None
+        return (normalize_query(query), chunk_id, get_corpus_version())
+
+    def get(self, query: str, document: Dict) -> Optional[Tuple[str, float]]:
+        key = self._key(query, document)
+        return self._lru.get(key) if key else None
+
+    def set(self, query: str, document: Dict, label: str, confidence: float):
+        key = self._key(query, document)
+        if key:
+            self._lru.set(key, (label, confidence))
+
+    def stats(self) -> Dict:
+        return self._lru.stats()
@@ -0,0 +1,19 @@
+import re
+
+# Chuẩn hóa thời gian tương đối về năm tuyển sinh hiện tại
+TIME_REPLACEMENTS = {
+    "năm nay": "năm 2025",
+    "hiện nay": "năm 2025",
+    "hiện tại": "năm 2025"
+}
+
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa câu hỏi: lowercase, gộp khoảng trắng, thay thời gian tương đối"""
+    normalized_query = " ".join(query.strip().lower().split())
+
+    for old, new in TIME_REPLACEMENTS.items():
+        pattern = rf'\b{re.escape(old)}\b'
+        normalized_query = re.sub(pattern, new, normalized_query, flags=re.IGNORECASE)
+
+    return normalized_query
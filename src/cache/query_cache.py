@@ -0,0 +1,81 @@
+import atexit
+import os
+from typing import Dict, Optional
+import numpy as np
+
+from .lru import LRUCache
+
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU: câu hỏi đã chuẩn hóa -> vector embedding.
+    - Có thể lưu xuống đĩa (.npz) để giữ cache qua các lần khởi động lại
+    - model_fingerprint (tên model + số chiều) được lưu kèm; nếu đổi model thì cache cũ bị bỏ
+    """
+
+    def __init__(
+        self,
+        model_fingerprint: str,
+        max_entries: int = 2000,
+        persist_path: Optional[str] = None,
+        save_every: int = 50
+    ):
+        self.model_fingerprint = model_fingerprint
+        self.persist_path = persist_path
+        self.save_every = save_every
+        self._lru = LRUCache(max_entries=max_entries)
+        self._unsaved = 0
+
+        if persist_path:
+            self._load()
+            atexit.register(self.save)
+
+    def get(self, normalized_query: str) -> Optional[np.ndarray]:
+        return self._lru.get(normalized_query)
+
+    def set(self, normalized_query: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)  # Vector dùng chung giữa các request
+        self._lru.set(normalized_query, vector)
+
+        self._unsaved += 1
+        if self.persist_path and self._unsaved >= self.save_every:
+            self.save()
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                if str(data["fingerprint"]) != self.model_fingerprint:
+                    print("[QueryCache] ⚠️ Embedding model changed, discarding persisted cache")
+                    return
+                for query, vector in zip(data["queries"], data["vectors"]):
+                    self.set(str(query), vector)
+            self._unsaved = 0
+            print(f"[QueryCache] 💾 Loaded {len(self._lru)} cached query vectors")
+        except Exception as e:
+            print(f"[QueryCache] ⚠️ Cannot load cache ({e}), starting empty")
+
+    def save(self):
+        if not self.persist_path or self._unsaved == 0:
+            return
+        items = self._lru.items()
+        if not items:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            tmp_path = self.persist_path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                fingerprint=np.array(self.model_fingerprint),
+                queries=np.array([q for q, _ in items]),
+                vectors=np.stack([v for _, v in items])
+            )
+            os.replace(tmp_path, self.persist_path)
+            self._unsaved = 0
+        except Exception as e:
+            print(f"[QueryCache] ⚠️ Cannot save cache: {e}")
+
+    def stats(self) -> Dict:
+        return self._lru.stats()
@@ -0,0 +1,155 @@
+import re
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+import numpy as np
+
+from .corpus_version import get_corpus_version
+from .keys import normalize_query
+
+# Token phải khớp tuyệt đối giữa hai câu hỏi: có chữ số (năm, điểm, mã ngành, khối A00)
+# hoặc viết tắt in hoa (CNTT, QTKD). Embedding gần như không phân biệt "2024" với "2025".
+_NUMERIC_TOKEN = re.compile(r"\w*\d[\w.,]*")
+_CODE_TOKEN = re.compile(r"\b[A-ZĐ]{2,}\d*\b")
+
+
+def key_tokens(query: str) -> FrozenSet[str]:
+    numeric = {t.rstrip(".,").replace(",", ".") for t in _NUMERIC_TOKEN.findall(normalize_query(query))}
+    codes = {t.lower() for t in _CODE_TOKEN.findall(query)}
+    return frozenset(numeric | codes)
+
+
+class SemanticCache:
+    """
+    Cache câu trả lời theo NGỮ NGHĨA: câu hỏi mới có cosine similarity với một câu đã trả lời
+    >= threshold thì trả lại câu trả lời cũ (bỏ qua retrieval + generation).
+    - Quét vector hóa bằng NumPy (một phép nhân ma trận)
+    - TTL từng entry, LRU eviction khi đầy
+    - Corpus version đổi (re-index / xóa file) -> xóa toàn bộ cache
+    - Hit chỉ hợp lệ khi số / mã (năm, điểm, mã ngành, viết tắt) của hai câu hỏi giống hệt nhau
+    """
+
+    def __init__(self, threshold: float = 0.93, max_entries: int = 1000, ttl_seconds: float = 6 * 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._vectors: Optional[np.ndarray] = None  # (max_entries, dim), đã chuẩn hóa L2
+        self._entries: List[Dict[str, Any]] = []    # query, result, expires_at, last_used
+        self._version = get_corpus_version()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.guard_rejections = 0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _check_version(self):
+        version = get_corpus_version()
+        if version != self._version:
+            if self._entries:
+                print(f"[SemanticCache] 🔄 Corpus changed, dropping {len(self._entries)} entries")
+                self.invalidations += 1
+            self._entries = []
+            self._version = version
+
+    def _remove(self, idx: int):
+        # Swap-remove: đưa dòng cuối vào vị trí bị xóa
+        last = len(self._entries) - 1
+        if idx != last:
+            self._vectors[idx] = self._vectors[last]
+            self._entries[idx] = self._entries[last]
+        self._entries.pop()
+
+    def lookup(self, vector: np.ndarray, query: str = None) -> Optional[Tuple[Dict, float, str]]:
+        """
+        Trả về (result, similarity, cached_query) nếu có câu hỏi đủ giống.
+        query: nếu có thì chỉ nhận entry có cùng key_tokens (số / mã) với câu hỏi.
+        """
+        with self._lock:
+            self._check_version()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            n = len(self._entries)
+            sims = self._vectors[:n] @ self._normalize(vector)
+
+            # Loại entry hết hạn
+            now = time.time()
+            expired = [i for i, e in enumerate(self._entries) if e["expires_at"] < now]
+            sims[expired] = -1.0
+
+            # Entry vượt ngưỡng, giống nhất trước; bỏ entry lệch số / mã
+            tokens = key_tokens(query) if query is not None else None
+            entry, similarity = None, 0.0
+            for i in np.argsort(-sims):
+                if sims[i] < self.threshold:
+                    break
+                if tokens is not None and self._entries[i]["tokens"] != tokens:
+                    self.guard_rejections += 1
+                    continue
+                entry, similarity = self._entries[i], float(sims[i])
+                break
+
+            for i in sorted(expired, reverse=True):
+                self._remove(i)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry["last_used"] = now
+            self.hits += 1
+            return entry["result"], similarity, entry["query"]
+
+    def store(self, query: str, vector: np.ndarray, result: Dict):
+        vector = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._check_version()
+
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries = []
+
+            if len(self._entries) >= self.max_entries:
+                # LRU: bỏ entry lâu nhất không được dùng
+                oldest = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                self._remove(oldest)
+                self.evictions += 1
+
+            idx = len(self._entries)
+            self._vectors[idx] = vector
+            self._entries.append({
+                "query": query,
+                "tokens": key_tokens(query),
+                "result": result,
+                "expires_at": now + self.ttl_seconds,
+                "last_used": now
+            })
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "guard_rejections": self.guard_rejections
+        }
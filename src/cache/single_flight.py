@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    """Một lần thực thi đang chạy; các request trùng chờ trên event này"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Gộp request trùng nhau đang chạy đồng thời: request đầu tiên (leader) thực thi,
+    các request cùng key trong lúc đó chờ và nhận lại kết quả của leader.
+    Không phải cache: leader xong là key được giải phóng ngay.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        # Follower chờ quá timeout (leader treo / stream bị bỏ dở) thì tự thực thi
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._counts = {"leaders": 0, "coalesced": 0, "timeouts": 0, "abandoned": 0}
+
+    def begin(self, key: Hashable) -> Tuple[_Call, bool]:
+        """Trả về (call, is_leader). Leader phải gọi finish() khi xong"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._counts["coalesced"] += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self._counts["leaders"] += 1
+            return call, True
+
+    def wait(self, call: _Call) -> Tuple[bool, Any]:
+        """
+        (True, result) khi leader xong; (False, None) nếu hết timeout
+        hoặc leader bỏ dở (finish không có result lẫn error) -> follower tự thực thi
+        """
+        if not call.event.wait(self.timeout):
+            with self._lock:
+                self._counts["timeouts"] += 1
+            return False, None
+        if call.error is not None:
+            raise call.error
+        if call.result is None:
+            with self._lock:
+                self._counts["abandoned"] += 1
+            return False, None
+        return True, call.result
+
+    def finish(self, key: Hashable, call: _Call, result: Any = None, error: BaseException = None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.event.set()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Chạy fn() một lần cho mỗi key đang bay. Trả về (result, shared)"""
+        call, leader = self.begin(key)
+        if not leader:
+            done, result = self.wait(call)
+            if done:
+                return result, True
+            return fn(), False
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result, False
+
+    async def ado(self, key: Hashable, afn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Bản async của do(): request trùng trong cùng event loop chờ chung một Future"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._async_calls.get(key)
+            if entry is not None and entry[0] is loop:
+                self._counts["coalesced"] += 1
+                future = entry[1]
+            else:
+                future = None
+                own = loop.create_future()
+                self._async_calls[key] = (loop, own)
+                self._counts["leaders"] += 1
+
+        if future is not None:
+            try:
+                # shield: follower bị hủy không kéo theo leader
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout), True
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self._counts["timeouts"] += 1
+                return await afn(), False
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # Leader bị hủy -> follower tự thực thi
+                return await afn(), False
+
+        try:
+            result = await afn()
+        except asyncio.CancelledError:
+            self._afinish(key, own)
+            own.cancel()
+            raise
+        except BaseException as e:
+            self._afinish(key, own)
+            own.set_exception(e)
+            own.exception()  # không có follower thì tránh cảnh báo "exception never retrieved"
+            raise
+        self._afinish(key, own)
+        own.set_result(result)
+        return result, False
+
+    def _afinish(self, key: Hashable, future: asyncio.Future):
+        with self._lock:
+            entry = self._async_calls.get(key)
+            if entry is not None and entry[1] is future:
+                del self._async_calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            in_flight = len(self._calls) + len(self._async_calls)
+        total = counts["leaders"] + counts["coalesced"]
+        return {
+            **counts,
+            "in_flight": in_flight,
+            "coalesce_rate": counts["coalesced"] / total if total else 0.0
+        }
@@ -5,6 +5,9 @@ PROJECT_ROOT = Path(__file__).parent.parent
 QDRANT_PATH = str(PROJECT_ROOT / "qdrant_data")
 DATA_DIR = str(PROJECT_ROOT / "data")
 CHUNKS_FILE = str(PROJECT_ROOT / "data" / "chunks.jsonl")
+STOPWORDS_FILE = str(PROJECT_ROOT / "data" / "vietnamese-stopwords.txt")
+# Vector đã embed theo (model, content hash) cho re-index tăng dần
+EMBEDDING_CACHE_DIR = str(PROJECT_ROOT / "data" / "embedding_cache")
 
 # Embedding models
 EMBEDDING_MODELS = {
@@ -19,6 +22,97 @@ EMBEDDING_MODELS = {
 TOP_K_INITIAL = 4
 TOP_K_FINAL = 2
 RELEVANCE_THRESHOLD = 0.5
+# "dense" = chỉ vector search | "hybrid" = BM25 (không dấu, bỏ stopwords) + dense, gộp bằng RRF
+# Giữ "dense" cho tới khi benchmark_retrieval.py --modes dense,hybrid cho thấy hybrid tốt hơn
+RETRIEVAL_MODE = "dense"
+RRF_K = 60
+# Nhãn câu hỏi -> chunk_id liên quan cho benchmark_retrieval.py (recall@k, MRR, nDCG)
+RETRIEVAL_QRELS_FILE = str(PROJECT_ROOT / "data" / "retrieval_qrels.jsonl")
+
+# Grader độ liên quan: "llm" (Groq) | "cross_encoder" (local) | "cascade" (cross-encoder trước, ca khó mới gọi LLM)
+# Mặc định "llm": ngưỡng cross-encoder chưa được hiệu chỉnh trên dữ liệu BDU, chỉ bật cascade sau khi benchmark
+GRADER_BACKEND = "llm"
+# Cross-encoder đa ngôn ngữ (mMARCO, có tiếng Việt)
+CROSS_ENCODER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+# Ngưỡng (high, low) trên sigmoid(score) theo từng model: >= high -> CORRECT, < low -> INCORRECT
+# Phân phối điểm khác nhau giữa các model -> hiệu chỉnh riêng (benchmark_retrieval.py --reranker-model ...)
+# Model chưa có ngưỡng chỉ dùng để rerank; grader "cross_encoder"/"cascade" từ chối model đó
+CROSS_ENCODER_THRESHOLDS = {
+    "cross-encoder/ms-marco-MiniLM-L-6-v2": (0.5, 0.2),
+}
+
+# Cache kết quả chấm (query, chunk) -> label; tự vô hiệu khi corpus thay đổi
+GRADE_CACHE_SIZE = 5000
+GRADE_CACHE_TTL = 3600  # giây
+
+# Query embedding cache (LRU, lưu xuống đĩa để giữ qua các lần restart; None = chỉ trong RAM)
+QUERY_CACHE_SIZE = 2000
+QUERY_CACHE_PATH = str(PROJECT_ROOT / "data" / "query_cache.npz")
+
+# Chạy retrieval cho câu gốc song song với lời gọi LLM của decomposer (dùng lại nếu câu không bị tách)
+# Xem RAGPipeline.speculation_stats(): hit_rate / waste_rate (chạy xong bị bỏ) / cancel_rate (hủy kịp, không tốn)
+SPECULATIVE_RETRIEVAL = True
+
+# Gọi LLM expansion song song với lần chấm đầu (opt-in; tốn thêm lời gọi 8B khi không cần expansion)
+# Xem CRAGRetriever.speculation_stats() để biết hit_rate / waste_rate / cancel_rate
+SPECULATIVE_EXPANSION = False
+
+# run_async: số thread tối đa cho phần blocking (embedding, Qdrant, BM25, cross-encoder)
+ASYNC_EXECUTOR_WORKERS = 8
+
+# Groq HTTP client dùng chung (keep-alive pool, timeout, giới hạn request đồng thời theo model)
+GROQ_TIMEOUT = 30.0  # giây
+GROQ_CONNECT_TIMEOUT = 5.0
+GROQ_MAX_CONNECTIONS = 20
+GROQ_MAX_KEEPALIVE = 10
+GROQ_KEEPALIVE_EXPIRY = 60.0
+GROQ_MODEL_CONCURRENCY = {
+    "llama-3.1-8b-instant": 8,
+    "llama-3.3-70b-versatile": 4,
+    "openai/gpt-oss-120b": 4,
+    "meta-llama/llama-4-scout-17b-16e-instruct": 2
+}
+GROQ_DEFAULT_CONCURRENCY = 4
+
+# Transport LLM: "live" (Groq thật) | "record" (gọi thật + ghi cassette) | "replay" (chỉ đọc cassette, không cần mạng)
+# | "synthetic" (latency/lỗi giả lập; nội dung lấy từ cassette nếu có) | "disabled" (mọi lời gọi LLM đều lỗi)
+LLM_TRANSPORT = "live"
+LLM_CASSETTE_PATH = str(PROJECT_ROOT / "data" / "llm_cassette.jsonl")
+REPLAY_LATENCY_SCALE = 0.0  # 1.0 = chờ đúng latency lúc ghi
+SYNTHETIC_TRANSPORT = {
+    "latency": ("lognormal", 0.8, 0.5),  # ("constant", s) | ("uniform", low, high) | ("lognormal", median, sigma)
+    "per_model_latency": {"llama-3.1-8b-instant": ("lognormal", 0.3, 0.4)},
+    "failure_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "retry_after": 2.0,
+    "seed": 42
+}
+
+# Quota Groq theo model: (requests/phút, tokens/phút). Scheduler điều phối request theo quota thay vì để bị 429
+GROQ_RATE_LIMITS = {
+    "llama-3.1-8b-instant": (30, 6000),
+    "llama-3.3-70b-versatile": (30, 12000),
+    "openai/gpt-oss-120b": (30, 8000),
+    "meta-llama/llama-4-scout-17b-16e-instruct": (30, 30000)
+}
+GROQ_DEFAULT_RATE_LIMIT = (30, 6000)
+# Thời gian chờ quota tối đa theo độ ưu tiên (giây); quá mức thì bỏ request. None = chờ đến khi có quota
+SCHEDULER_MAX_WAIT = {
+    "generation": 60.0,
+    "grading": 20.0,
+    "expansion": 5.0,
+    "background": None
+}
+
+# Hedged request: request chính chậm hơn p90 gần đây thì gửi thêm một request dự phòng, lấy cái về trước
+HEDGING_ENABLED = False
+HEDGE_PERCENTILE = 90
+HEDGE_MIN_DELAY = 0.3  # giây
+HEDGE_DEFAULT_DELAY = 3.0  # khi chưa đủ số liệu latency
+HEDGE_MAX_RATIO = 0.1  # tối đa 10% request được hedge (giới hạn quota)
+
+# Model nhỏ cho các bước phụ (chấm độ liên quan, tách câu hỏi, mở rộng câu hỏi)
+FAST_LLM_MODEL = "llama-3.1-8b-instant"
 
 # LLM
 LLM_MODEL = [
@@ -26,4 +120,39 @@ LLM_MODEL = [
     "openai/gpt-oss-120b"
 ]
 TEMPERATURE = 0.5
-MAX_TOKENS = 1024
\ No newline at end of file
+MAX_TOKENS = 1024
+
+# Model router: chọn model nhanh nhất đang khỏe (p50 trên cửa sổ trượt), circuit breaker có half-open
+ROUTER_WINDOW = 50  # số request gần nhất dùng để tính p50/p95 và tỉ lệ lỗi
+ROUTER_FAILURE_THRESHOLD = 3  # lỗi liên tiếp trước khi mở circuit
+ROUTER_RECOVERY_TIMEOUT = 30.0  # giây, nhân đôi mỗi lần probe half-open thất bại
+ROUTER_MAX_RECOVERY_TIMEOUT = 600.0
+ROUTER_PROBE_TIMEOUT = 60.0  # giây; request thử half-open không báo kết quả quá lâu thì cho probe khác
+
+# Semantic cache: trả lời lại câu hỏi diễn đạt khác nhưng cùng ý (cosine >= threshold)
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.93
+SEMANTIC_CACHE_SIZE = 1000
+SEMANTIC_CACHE_TTL = 6 * 3600  # giây
+
+# Gộp các câu hỏi giống hệt nhau đang được xử lý đồng thời (single-flight), key = câu hỏi chuẩn hóa + corpus version
+SINGLE_FLIGHT_ENABLED = True
+SINGLE_FLIGHT_TIMEOUT = 60.0  # giây; chờ quá lâu thì request tự chạy
+
+# Tracing: span cho từng bước của request (embedding, search, grading, LLM...), ghi ra JSONL
+# TRACE_EXPORT_FORMAT: "jsonl" (mỗi dòng một span) | "otlp" (mỗi dòng một trace, OTLP/JSON cho OpenTelemetry Collector)
+TRACING_ENABLED = True
+TRACE_EXPORT_PATH = str(PROJECT_ROOT / "data" / "traces.jsonl")
+TRACE_EXPORT_FORMAT = "jsonl"
+
+# Metrics Prometheus (text format) trên HTTP server phụ: http://<host>:<port>/metrics
+# Endpoint không có xác thực -> mặc định tắt và chỉ nghe localhost; muốn scrape từ máy khác thì đổi host có chủ đích
+METRICS_ENABLED = False
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Answer cache: LRU + TTL trong RAM, tùy chọn thêm tầng SQLite (None = tắt)
+ANSWER_CACHE_SIZE = 500
+ANSWER_CACHE_MAX_BYTES = 20 * 1024 * 1024
+ANSWER_CACHE_TTL = 24 * 3600  # giây
+ANSWER_CACHE_DB = str(PROJECT_ROOT / "data" / "answer_cache.db")
\ No newline at end of file
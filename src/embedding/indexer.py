@@ -1,10 +1,48 @@
 import json
+import os
+import sys
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue, PointIdsList
 from sentence_transformers import SentenceTransformer
 import hashlib
 
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import EMBEDDING_CACHE_DIR
+from cache.embedding_cache import EmbeddingCache
+from cache.corpus_version import bump_corpus_version
+
+
+def model_identity(model: SentenceTransformer, default: str) -> str:
+    """
+    Tên thật của model đã load: config HF (_name_or_path) -> model_id -> default.
+    base_model chỉ dùng sau cùng: với model fine-tune nó là model gốc, dùng làm key sẽ lấy nhầm vector của model gốc.
+    """
+    try:
+        name = model[0].auto_model.config._name_or_path
+    except Exception:
+        name = None
+    card = getattr(model, "model_card_data", None)
+    return name or getattr(card, "model_id", None) or default or getattr(card, "base_model", None)
+
+
+def iter_jsonl(jsonl_path: str) -> Iterator[dict]:
+    """Đọc file JSONL từng dòng một (không load cả file vào bộ nhớ)"""
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"\n⚠️  Error processing line {line_no}: {e}")
+
 
 class QdrantIndexer:
     def __init__(
@@ -13,9 +51,17 @@ class QdrantIndexer:
         collection_name: str = "bdu_chunks_gemma",
         embedding_model: str = "google/embeddinggemma-300m",
         client: QdrantClient = None,
-        model: SentenceTransformer = None
+        model: SentenceTransformer = None,
+        encode_batch_size: int = 32,
+        cache_dir: str = EMBEDDING_CACHE_DIR,
+        use_cache: bool = True
     ):
         self.collection_name = collection_name
+        self.encode_batch_size = encode_batch_size
+        self.embedding_model_name = embedding_model
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self._embedding_cache = None
         
         if client:
             print("✅ Using provided Qdrant client")
@@ -27,17 +73,44 @@ class QdrantIndexer:
         if model:
             print("✅ Using provided embedding model")
             self.model = model
+            # Cache vector + payload_hash phải theo model thật đang dùng, không theo tham số embedding_model
+            self.embedding_model_name = model_identity(model, embedding_model)
+            if self.embedding_model_name != embedding_model:
+                print(f"⚠️  Provided model is {self.embedding_model_name} (embedding_model={embedding_model})")
         else:
             print(f"🔧 Loading embedding model: {embedding_model}")
             self.model = SentenceTransformer(embedding_model)
             print("✅ Model loaded")
     
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        # Lazy: chỉ mở file cache khi thực sự index
+        if self.use_cache and self._embedding_cache is None:
+            self._embedding_cache = EmbeddingCache(self.cache_dir, self.embedding_model_name)
+        return self._embedding_cache
+
     def _generate_uuid(self, chunk_id: str) -> str:
         hash_obj = hashlib.md5(chunk_id.encode())
         return hash_obj.hexdigest()[:32]
     
     def embed(self, text: str):
-        return self.model.encode(text, convert_to_numpy=True)    
+        return self.model.encode(text, convert_to_numpy=True)
+
+    def embed_batch(self, texts: list[str]):
+        """Embed nhiều đoạn trong một lần gọi encode (sắp theo độ dài để giảm padding)"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        vectors = self.model.encode(
+            [texts[i] for i in order],
+            batch_size=self.encode_batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        # Trả lại đúng thứ tự ban đầu
+        result = [None] * len(texts)
+        for pos, i in enumerate(order):
+            result[i] = vectors[pos]
+        return result
+
     def get_file_chunks(self, title: str) -> list[dict]:
         """Lấy chi tiết các chunks của một file"""
         try:
@@ -127,84 +200,238 @@ class QdrantIndexer:
                     ]
                 )
             )
+            bump_corpus_version()
             print(f"✅ Đã xóa xong: {title}")
             return True
         except Exception as e:
             print(f"❌ Lỗi xóa file {title}: {e}")
             raise e
 
-    def index_jsonl(self, jsonl_path: str, batch_size: int = 100):
-        print(f"\n📄 Reading chunks from: {jsonl_path}")        
-        with open(jsonl_path, "r", encoding="utf-8") as f:
-            lines = [line.strip() for line in f if line.strip()]        
-        print(f"📊 Total chunks: {len(lines)}")        
+    def _build_payload(self, item: dict, content: str, chunk_id: str, source_file: str = None) -> dict:
+        payload = {
+            "chunk_id": chunk_id,
+            "content": content,
+            "url": item.get("url", "unknown"),
+            "title": item.get("title", ""), # Default empty if missing
+            "type": item.get("type", "text"),
+        }
+        # Thêm metadata
+        metadata = item.get("metadata", {})
+
+        if "full_content" in metadata:
+            payload["full_content"] = metadata["full_content"]
+        elif "full_content" in item:
+            payload["full_content"] = item["full_content"]
+
+        if "title" in metadata and metadata["title"]:
+            payload["title"] = metadata["title"]
+        # elif case handled in init payload
+
+        if "order" in metadata:
+            payload["order"] = metadata["order"]
+
+        if source_file:
+            payload["source_file"] = source_file
+
+        # Hash dùng để phát hiện chunk thay đổi khi re-index (đổi model -> hash đổi -> embed lại)
+        payload["embedding_model"] = self.embedding_model_name
+        payload["content_hash"] = EmbeddingCache.content_hash(content)
+        payload["payload_hash"] = hashlib.sha256(
+            json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        return payload
+
+    def _get_existing_hashes(self, point_ids: list) -> dict:
+        """Lấy payload_hash hiện có trong Qdrant, key theo chunk_id"""
+        try:
+            records = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=point_ids,
+                with_payload=["chunk_id", "payload_hash"],
+                with_vectors=False
+            )
+        except Exception as e:
+            print(f"\n⚠️  Cannot fetch existing points: {e}")
+            return {}
+        return {
+            r.payload.get("chunk_id"): r.payload.get("payload_hash")
+            for r in records if r.payload
+        }
+
+    def _embed_with_cache(self, contents: list[str], content_hashes: list[str]) -> tuple:
+        """Chỉ embed nội dung chưa có trong cache. Trả về (vectors, số lượng cache hit)"""
+        cache = self.embedding_cache
+        cached = cache.get_many(content_hashes) if cache else {}
+
+        missing = {}
+        for content, h in zip(contents, content_hashes):
+            if h not in cached and h not in missing:
+                missing[h] = content
+
+        if missing:
+            new_vectors = self.embed_batch(list(missing.values()))
+            new_hashes = list(missing.keys())
+            cached.update(zip(new_hashes, new_vectors))
+            if cache:
+                cache.put_many(new_hashes, new_vectors)
+
+        vectors = [cached[h] for h in content_hashes]
+        return vectors, len(content_hashes) - len(missing)
+
+    def _prune_missing(self, source_file: str, seen_chunk_ids: set) -> int:
+        """Xóa các point cùng source_file nhưng không còn trong file nguồn"""
+        stale_ids = []
+        next_offset = None
+        source_filter = Filter(
+            must=[FieldCondition(key="source_file", match=MatchValue(value=source_file))]
+        )
+        while True:
+            records, next_offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=source_filter,
+                limit=256,
+                offset=next_offset,
+                with_payload=["chunk_id"],
+                with_vectors=False
+            )
+            for record in records:
+                if record.payload.get("chunk_id") not in seen_chunk_ids:
+                    stale_ids.append(record.id)
+            if next_offset is None:
+                break
+
+        if stale_ids:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=stale_ids)
+            )
+        return len(stale_ids)
+
+    def _upsert(self, points: list):
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=points
+        )
+
+    def index_jsonl(self, jsonl_path: str, batch_size: int = 100, prune_missing: bool = False) -> dict:
+        """Index file JSONL (đọc streaming, xem index_chunks)"""
+        print(f"\n📄 Reading chunks from: {jsonl_path}")
+        return self.index_chunks(
+            iter_jsonl(jsonl_path),
+            batch_size=batch_size,
+            source_file=os.path.basename(jsonl_path),
+            prune_missing=prune_missing
+        )
+
+    def index_chunks(
+        self,
+        chunks: Iterable[dict],
+        batch_size: int = 100,
+        source_file: str = None,
+        prune_missing: bool = False
+    ) -> dict:
+        """
+        Index từ bất kỳ iterable nào của chunk dict (generator, list...) theo kiểu incremental:
+        - Chunk không đổi (payload_hash trùng) -> bỏ qua, không embed, không upsert
+        - Chunk mới/thay đổi -> lấy vector từ cache theo content_hash, chỉ embed phần thiếu
+        - prune_missing=True -> xóa các chunk cùng source_file không còn trong nguồn
+        Chỉ giữ một batch trong bộ nhớ tại một thời điểm.
+        """
+        stats = {"total": 0, "added": 0, "changed": 0, "unchanged": 0, "removed": 0, "embedded": 0, "cache_hits": 0}
+        seen_chunk_ids = set()
         total_indexed = 0
+        chunk_iter = iter(chunks)
         
-        for i in tqdm(range(0, len(lines), batch_size), desc="Indexing batches"):
-            batch_lines = lines[i:i+batch_size]
-            points = []
-            
-            for line in batch_lines:
-                try:
-                    item = json.loads(line)
-                    
-                    content = item.get("content", "")
-                    chunk_id = item.get("chunk_id", f"chunk_{total_indexed}")
-                    
-                    if not content:
-                        continue                    
-                    # Embed content để tìm kiếm
-                    vector = self.embed(content)
-                    point_id = self._generate_uuid(chunk_id)                    
-                    # Build payload
-                    payload = {
-                        "chunk_id": chunk_id,
-                        "content": content,
-                        "url": item.get("url", "unknown"),
-                        "title": item.get("title", ""), # Default empty if missing
-                        "type": item.get("type", "text"),
-                    }                    
-                    # Thêm metadata
-                    metadata = item.get("metadata", {})
-                    
-                    if "full_content" in metadata:
-                        payload["full_content"] = metadata["full_content"]
-                    elif "full_content" in item:  
-                        payload["full_content"] = item["full_content"]
-                                        
-                    if "title" in metadata and metadata["title"]:
-                        payload["title"] = metadata["title"]
-                    # elif case handled in init payload
-                    
-                    if "order" in metadata:
-                        payload["order"] = metadata["order"]
-                    
-                    points.append(
-                        PointStruct(
-                            id=point_id,
-                            vector=vector.tolist(),
-                            payload=payload
-                        )
-                    )
-                    
-                    total_indexed += 1
-                    
-                except Exception as e:
-                    print(f"\n⚠️  Error processing line {i}: {e}")
+        # Upsert batch trước chạy nền trong lúc encode batch kế tiếp
+        pending_upsert = None
+        progress = tqdm(desc="Indexing chunks", unit="chunk")
+        with ThreadPoolExecutor(max_workers=1) as upsert_executor:
+            while True:
+                batch = list(islice(chunk_iter, batch_size))
+                if not batch:
+                    break
+                progress.update(len(batch))
+                items = []
+                
+                for item in batch:
+                    try:
+                        content = item.get("content", "")
+                        if not content:
+                            continue
+                        # Không có chunk_id -> lấy theo nội dung (ổn định, không phụ thuộc vị trí trong batch)
+                        chunk_id = item.get("chunk_id") or f"chunk_{EmbeddingCache.content_hash(content)[:16]}"
+                        payload = self._build_payload(item, content, chunk_id, source_file)
+                        items.append((chunk_id, payload))
+                    except Exception as e:
+                        print(f"\n⚠️  Error processing chunk {stats['total'] + len(items)}: {e}")
+                        continue
+                
+                stats["total"] += len(items)
+                if not items:
                     continue
-            
-            # Upload batch
-            if points:
-                self.client.upsert(
-                    collection_name=self.collection_name,
-                    points=points
+                
+                seen_chunk_ids.update(chunk_id for chunk_id, _ in items)
+                existing = self._get_existing_hashes([self._generate_uuid(cid) for cid, _ in items])
+                
+                # Chỉ giữ chunk mới hoặc đã thay đổi
+                to_index = []
+                for chunk_id, payload in items:
+                    old_hash = existing.get(chunk_id)
+                    if old_hash == payload["payload_hash"]:
+                        stats["unchanged"] += 1
+                        continue
+                    stats["changed" if chunk_id in existing else "added"] += 1
+                    to_index.append((chunk_id, payload))
+                
+                if not to_index:
+                    continue
+                
+                vectors, cache_hits = self._embed_with_cache(
+                    [p["content"] for _, p in to_index],
+                    [p["content_hash"] for _, p in to_index]
                 )
+                stats["cache_hits"] += cache_hits
+                stats["embedded"] += len(to_index) - cache_hits
+                
+                points = [
+                    PointStruct(
+                        id=self._generate_uuid(chunk_id),
+                        vector=vector.tolist(),
+                        payload=payload
+                    )
+                    for (chunk_id, payload), vector in zip(to_index, vectors)
+                ]
+                total_indexed += len(points)
+                
+                # Chờ batch trước upload xong rồi mới gửi batch mới
+                if pending_upsert is not None:
+                    pending_upsert.result()
+                pending_upsert = upsert_executor.submit(self._upsert, points)
+            
+            if pending_upsert is not None:
+                pending_upsert.result()
+        progress.close()
+        
+        if self.embedding_cache:
+            self.embedding_cache.flush()
+        
+        if prune_missing and source_file:
+            stats["removed"] = self._prune_missing(source_file, seen_chunk_ids)
+        
+        if stats["added"] or stats["changed"] or stats["removed"]:
+            bump_corpus_version()
         
         print(f"\n✅ Indexing completed!")
-        print(f"   Total indexed: {total_indexed} chunks")
+        print(f"   Total chunks: {stats['total']} | Indexed: {total_indexed} chunks")
+        print(f"   ➕ Added: {stats['added']} | ✏️  Changed: {stats['changed']} | "
+              f"⏸️  Unchanged: {stats['unchanged']} | 🗑️  Removed: {stats['removed']}")
+        print(f"   🧠 Embedded: {stats['embedded']} | 💾 Cache hits: {stats['cache_hits']}")
         
         collection_info = self.client.get_collection(self.collection_name)
         print(f"   Qdrant count: {collection_info.points_count} points")
+        
+        return stats
 
 
 if __name__ == "__main__":
@@ -220,7 +447,7 @@ if __name__ == "__main__":
         collection_name=COLLECTION_NAME,
         embedding_model=MODEL_NAME
     )    
-    indexer.index_jsonl("./data/chunks.jsonl", batch_size=100)
+    indexer.index_jsonl("./data/chunks.jsonl", batch_size=100, prune_missing=True)
     
     print("\n" + "="*60)
     print("🎯 Done!")
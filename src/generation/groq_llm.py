@@ -1,53 +1,66 @@
 import os
-import hashlib
 import time
-from typing import List, Dict, Any, Optional
-from groq import Groq
+import asyncio
+from typing import List, Dict, Any, Optional, Iterator
 from dotenv import load_dotenv
-from config import LLM_MODEL, TEMPERATURE, MAX_TOKENS
+from config import (
+    LLM_MODEL, TEMPERATURE, MAX_TOKENS,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_MAX_BYTES, ANSWER_CACHE_TTL, ANSWER_CACHE_DB,
+    ROUTER_WINDOW, ROUTER_FAILURE_THRESHOLD, ROUTER_RECOVERY_TIMEOUT, ROUTER_MAX_RECOVERY_TIMEOUT,
+    ROUTER_PROBE_TIMEOUT
+)
+from cache.answer_cache import AnswerCache
+from llm.client_factory import GroqClientFactory, get_client_factory
+from llm.model_router import ModelRouter, retry_after_seconds
+from llm.scheduler import PRIORITY_GENERATION
+from monitoring.tracing import traced, current_span
+from monitoring.metrics import record_cache
 
 load_dotenv()
 
+OVERLOAD_MESSAGE = "Xin lỗi, hệ thống đang quá tải. Vui lòng thử lại sau."
+INTERRUPTED_NOTICE = "\n\n⚠️ Câu trả lời bị gián đoạn, vui lòng hỏi lại để nhận câu trả lời đầy đủ."
 
-class SimpleCache:    
-    def __init__(self, max_size: int = 50):
-        self.cache = {}
-        self.max_size = max_size
-    
-    def _hash_key(self, query: str, chunks: List[Dict]) -> str:
-        chunk_ids = [c.get('chunk_id', '') for c in chunks[:5]]
-        key_str = f"{query}|{'|'.join(chunk_ids)}"
-        return hashlib.md5(key_str.encode()).hexdigest()
-    
-    def get(self, query: str, chunks: List[Dict]) -> Optional[Dict]:
-        key = self._hash_key(query, chunks)
-        return self.cache.get(key)
-    
-    def set(self, query: str, chunks: List[Dict], response: Dict):
-        if len(self.cache) >= self.max_size:
-            self.cache.clear()
-        key = self._hash_key(query, chunks)
-        self.cache[key] = response
 
 class GroqLLM:
-    def __init__(self, api_key: str = None, enable_cache: bool = True):
+    def __init__(
+        self,
+        api_key: str = None,
+        enable_cache: bool = True,
+        cache: AnswerCache = None,
+        client_factory: GroqClientFactory = None
+    ):
+        # Không bắt buộc key ở đây: transport replay/synthetic chạy không cần Groq (LiveTransport tự kiểm tra)
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
-        if not self.api_key:
-            raise ValueError("GROQ_API_KEY not found in .env")
-        
-        self.client = Groq(api_key=self.api_key)
+        client_factory = client_factory or get_client_factory(self.api_key)
+        self.client = client_factory.client
+        self.async_client = client_factory.async_client
+        self.hedger = client_factory.hedger
         self.model_pool = LLM_MODEL
         self.temperature = TEMPERATURE
         self.max_tokens = MAX_TOKENS
         
         self.enable_cache = enable_cache
-        self.cache = SimpleCache(max_size=50) if enable_cache else None
-        self.failure_counts = {model: 0 for model in self.model_pool}
-        self.max_failures = 3
+        self.cache = None
+        if enable_cache:
+            self.cache = cache or AnswerCache(
+                max_entries=ANSWER_CACHE_SIZE,
+                max_bytes=ANSWER_CACHE_MAX_BYTES,
+                ttl_seconds=ANSWER_CACHE_TTL,
+                sqlite_path=ANSWER_CACHE_DB
+            )
+        self.router = ModelRouter(
+            self.model_pool,
+            window=ROUTER_WINDOW,
+            failure_threshold=ROUTER_FAILURE_THRESHOLD,
+            recovery_timeout=ROUTER_RECOVERY_TIMEOUT,
+            max_recovery_timeout=ROUTER_MAX_RECOVERY_TIMEOUT,
+            probe_timeout=ROUTER_PROBE_TIMEOUT
+        )
         
         print(f"✅ Groq LLM initialized: {self.model_pool}")
         if enable_cache:
-            print(f"   💾 Cache enabled (max 50 entries)")
+            print(f"   💾 Answer cache enabled (LRU {self.cache.stats()['max_entries']} entries, TTL {self.cache.ttl_seconds}s)")
 
     def build_simple_prompt(self, query: str, context_chunks: List[Dict]) -> str:
         """Enhanced prompt with security"""
@@ -162,123 +175,246 @@ TRẢ LỜI:"""
         return prompt
     
     def _call_with_failover(self, prompt: str) -> Optional[str]:
-        sorted_models = sorted(
-            self.model_pool, 
-            key=lambda m: self.failure_counts[m]
-        )
+        # Router xếp model theo độ khỏe + p50 latency; model bị rate limit / circuit open thì bỏ qua (không sleep)
+        # Hedging (nếu bật): request chính chậm quá p90 thì gửi thêm sang model khỏe kế tiếp, lấy cái về trước
+        tried = set()
+        while True:
+            primary, backup = self._pick_models(tried)
+            if primary is None:
+                return None
+            try:
+                return self.hedger.run(lambda model: self._complete(prompt, model, tried), primary, backup)
+            except Exception:
+                continue
+    
+    async def _acall_with_failover(self, prompt: str) -> Optional[str]:
+        """Bản async của _call_with_failover (AsyncGroq, không chặn event loop)"""
+        tried = set()
+        while True:
+            primary, backup = self._pick_models(tried)
+            if primary is None:
+                return None
+            try:
+                return await self.hedger.arun(lambda model: self._acomplete(prompt, model, tried), primary, backup)
+            except Exception:
+                continue
+    
+    def _pick_models(self, tried: set) -> tuple:
+        """(model chính, model dự phòng cho hedging) trong số model chưa thử"""
+        primary, backup = None, None
+        for model_name in self.router.ranked_models():
+            if model_name in tried:
+                continue
+            if primary is None:
+                tried.add(model_name)  # bị circuit chặn cũng không thử lại trong request này
+                if self.router.allow(model_name):
+                    primary = model_name
+            elif self.hedger.enabled and self.router.is_healthy(model_name):
+                backup = model_name
+                break
+        return primary, backup
+    
+    def _complete(self, prompt: str, model_name: str, tried: set) -> str:
+        tried.add(model_name)
+        start = time.time()
+        try:
+            response = self.client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model_name,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                priority=PRIORITY_GENERATION
+            )
+        except Exception as e:
+            self._on_model_error(model_name, e)
+            raise
+        
+        answer = response.choices[0].message.content.strip()
+        self.router.record_success(model_name, time.time() - start)
+        print(f"[LLM] ✅ {model_name}")
+        return answer
+    
+    async def _acomplete(self, prompt: str, model_name: str, tried: set) -> str:
+        tried.add(model_name)
+        start = time.time()
+        try:
+            response = await self.async_client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model_name,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                priority=PRIORITY_GENERATION
+            )
+        except asyncio.CancelledError:
+            # Hedge thua bị cancel: không phải lỗi của model, nhưng phải trả lại lượt probe half-open
+            self.router.release(model_name)
+            raise
+        except Exception as e:
+            self._on_model_error(model_name, e)
+            raise
         
-        for model_name in sorted_models:
-            if self.failure_counts[model_name] >= self.max_failures:
+        answer = response.choices[0].message.content.strip()
+        self.router.record_success(model_name, time.time() - start)
+        print(f"[LLM] ✅ {model_name} (async)")
+        return answer
+    
+    def _on_model_error(self, model_name: str, error: Exception, suffix: str = ""):
+        # QuotaExceeded (scheduler hết quota) xử lý như rate limit: tạm bỏ qua model, không tính là hỏng
+        retry_after = getattr(error, "retry_after", None) or retry_after_seconds(error)
+        self.router.record_failure(model_name, retry_after=retry_after)
+        print(f"[LLM] ❌ {model_name}{suffix}: {str(error)[:100]}")
+        if retry_after:
+            print(f"[LLM] ⏳ Rate limit, {model_name} paused {retry_after:.1f}s")
+    
+    def _stream_with_failover(self, prompt: str, status: Dict[str, Any] = None) -> Iterator[str]:
+        """
+        Stream token. Failover sang model khác chỉ được thực hiện TRƯỚC token đầu tiên;
+        sau khi đã trả token cho người dùng thì lỗi giữa chừng chỉ kết thúc stream
+        và đặt status["interrupted"] = True (câu trả lời bị cụt, không được cache).
+        """
+        status = status if status is not None else {}
+        for model_name in self.router.ranked_models():
+            if not self.router.allow(model_name):
                 continue
             
+            start = time.time()
             try:
-                response = self.client.chat.completions.create(
+                stream = self.client.chat.completions.create(
                     messages=[{"role": "user", "content": prompt}],
                     model=model_name,
                     temperature=self.temperature,
                     max_tokens=self.max_tokens,
+                    stream=True,
+                    priority=PRIORITY_GENERATION,
                 )
-                
-                answer = response.choices[0].message.content.strip()
-                self.failure_counts[model_name] = 0
-                print(f"[LLM] ✅ {model_name}")
-                return answer
-            
+                # Chờ token đầu tiên (lỗi ở đây vẫn còn failover được)
+                first_token = None
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        first_token = delta
+                        break
             except Exception as e:
-                error_msg = str(e).lower()
-                self.failure_counts[model_name] += 1
-                print(f"[LLM] ❌ {model_name}: {str(e)[:100]}")                
- 
-                if "rate" in error_msg or "limit" in error_msg:
-                    print(f"[LLM] ⏳ Rate limit, waiting 2s...")
-                    time.sleep(2)
-                    try:
-                        response = self.client.chat.completions.create(
-                            messages=[{"role": "user", "content": prompt}],
-                            model=model_name,
-                            temperature=self.temperature,
-                            max_tokens=self.max_tokens,
-                        )
-                        self.failure_counts[model_name] = 0
-                        return response.choices[0].message.content.strip()
-                    except:
-                        pass
-                
+                self._on_model_error(model_name, e, " (stream)")
                 continue
-        
-        return None
+            
+            if first_token is None:
+                self.router.record_failure(model_name)
+                print(f"[LLM] ❌ {model_name} (stream): empty response")
+                continue
+            
+            print(f"[LLM] ✅ {model_name} (stream)")
+            try:
+                yield first_token
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+                self.router.record_success(model_name, time.time() - start)
+            except GeneratorExit:
+                # Người dùng bỏ dở stream: không có kết quả, trả lại lượt probe half-open
+                self.router.release(model_name)
+                raise
+            except Exception as e:
+                self.router.record_failure(model_name)
+                status["interrupted"] = True
+                print(f"[LLM] ⚠️ {model_name} stream interrupted: {str(e)[:100]}")
+            return
     
-    def generate(self, query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
-        if self.enable_cache:
-            cached = self.cache.get(query, context_chunks)
-            if cached:
-                print("[LLM] 💾 Cache hit")
-                return cached        
-        # Build prompt và gọi LLM
-        prompt = self.build_simple_prompt(query, context_chunks)
-        answer = self._call_with_failover(prompt)
+    def _stream_result(self, prompt: str, result: Dict[str, Any], cache_key: Optional[str]) -> Iterator[str]:
+        """Yield token; khi stream kết thúc thì cập nhật result["answer"] và lưu answer cache"""
+        parts = []
+        status = {}
+        for token in self._stream_with_failover(prompt, status):
+            parts.append(token)
+            yield token
         
+        answer = "".join(parts).strip()
         if not answer:
-            result = {
-                "answer": "Xin lỗi, hệ thống đang quá tải. Vui lòng thử lại sau.",
+            result.update({
+                "answer": OVERLOAD_MESSAGE,
                 "sources": [],
                 "num_sources": 0,
-                "query": query,
                 "error": "All models failed"
-            }
-        else:           
-            sources = []
-            for c in context_chunks:                
-                title = c.get("title")
-                if not title or str(title).strip() == "" or title == "None":
-                    chunk_id = c.get("chunk_id", "")
-                    if chunk_id:                        
-                        title = chunk_id.replace("-", " ").replace("_", " ").title()      
-                if not title or str(title).strip() == "":
-                    title = "Tài liệu tuyển sinh BDU"
-                sources.append({
-                    "chunk_id": c.get("chunk_id"),
-                    "url": c.get("url") or "#",
-                    "title": title,
-                    "score": c.get("score"),
-                    "type": c.get("type", "text")
-                })
-            
-            result = {
-                "answer": answer,
-                "sources": sources,
-                "num_sources": len(sources),
-                "query": query
-            }
-            
-            # Only cache successful responses (not errors)
-            if self.enable_cache:
-                self.cache.set(query, context_chunks, result)
+            })
+            yield OVERLOAD_MESSAGE
+            return
         
+        result["answer"] = answer
+        if status.get("interrupted"):
+            # Câu trả lời cụt: báo cho người dùng, không lưu answer cache (pipeline cũng bỏ qua semantic cache vì có "error")
+            result.update({"answer": answer + INTERRUPTED_NOTICE, "error": "Stream interrupted", "interrupted": True})
+            yield INTERRUPTED_NOTICE
+            return
+        if self.enable_cache:
+            self.cache.set(cache_key, {k: v for k, v in result.items() if k != "answer_stream"})
+    
+    @staticmethod
+    def _cached_stream(answer: str) -> Iterator[str]:
+        yield answer
+    
+    def generate_stream(self, query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
+        """
+        Như generate() nhưng trả về ngay, với result["answer_stream"] là iterator token.
+        result["answer"] (và "error" nếu có) được điền khi stream kết thúc.
+        """
+        cache_key, cached = self._lookup_cache(query, context_chunks)
+        if cached:
+            return {**cached, "answer_stream": self._cached_stream(cached["answer"])}
+        
+        sources = self._build_sources(context_chunks)
+        result = {
+            "answer": "",
+            "sources": sources,
+            "num_sources": len(sources),
+            "query": query
+        }
+        prompt = self.build_simple_prompt(query, context_chunks)
+        result["answer_stream"] = self._stream_result(prompt, result, cache_key)
         return result
-
     
-    def generate_multi_intent(
+    def generate_multi_intent_stream(
         self,
         original_query: str,
         sub_queries: List[str],
         context_chunks: List[Dict]
     ) -> Dict[str, Any]:
-        """Generate answer for multi-intent query"""
+        cache_key, cached = self._lookup_cache(original_query, context_chunks, sub_queries)
+        if cached:
+            return {**cached, "answer_stream": self._cached_stream(cached["answer"])}
         
+        sources = self._build_multi_sources(context_chunks)
+        result = {
+            "answer": "",
+            "sources": sources,
+            "num_sources": len(sources),
+            "query": original_query
+        }
         prompt = self.build_multi_intent_prompt(original_query, sub_queries, context_chunks)
-        answer = self._call_with_failover(prompt)
-        
-        if not answer:
-            return {
-                "answer": "Xin lỗi, hệ thống đang quá tải. Vui lòng thử lại sau.",
-                "sources": [],
-                "num_sources": 0,
-                "query": original_query,
-                "error": "All models failed"
-            }
-        
-        sources = [
+        result["answer_stream"] = self._stream_result(prompt, result, cache_key)
+        return result
+    
+    def _build_sources(self, context_chunks: List[Dict]) -> List[Dict]:
+        sources = []
+        for c in context_chunks:                
+            title = c.get("title")
+            if not title or str(title).strip() == "" or title == "None":
+                chunk_id = c.get("chunk_id", "")
+                if chunk_id:                        
+                    title = chunk_id.replace("-", " ").replace("_", " ").title()      
+            if not title or str(title).strip() == "":
+                title = "Tài liệu tuyển sinh BDU"
+            sources.append({
+                "chunk_id": c.get("chunk_id"),
+                "url": c.get("url") or "#",
+                "title": title,
+                "score": c.get("score"),
+                "type": c.get("type", "text")
+            })
+        return sources
+    
+    def _build_multi_sources(self, context_chunks: List[Dict]) -> List[Dict]:
+        return [
             {
                 "chunk_id": c.get("chunk_id"),
                 "url": c.get("url"),
@@ -289,10 +425,97 @@ TRẢ LỜI:"""
             }
             for c in context_chunks
         ]
+    
+    def _lookup_cache(self, query: str, context_chunks: List[Dict], sub_queries: List[str] = None) -> tuple:
+        """Trả về (cache_key, cached_result hoặc None)"""
+        if not self.enable_cache:
+            return None, None
+        cache_key = AnswerCache.make_key(query, context_chunks, sub_queries)
+        cached = self.cache.get(cache_key)
+        current_span().set(answer_cache_hit=bool(cached))
+        record_cache("answer", bool(cached))
+        if cached:
+            print("[LLM] 💾 Cache hit (multi-intent)" if sub_queries else "[LLM] 💾 Cache hit")
+        return cache_key, cached
+    
+    def _build_result(self, query: str, answer: Optional[str], sources: List[Dict], cache_key: Optional[str]) -> Dict[str, Any]:
+        if not answer:
+            return {
+                "answer": OVERLOAD_MESSAGE,
+                "sources": [],
+                "num_sources": 0,
+                "query": query,
+                "error": "All models failed"
+            }
         
-        return {
+        result = {
             "answer": answer,
             "sources": sources,
             "num_sources": len(sources),
-            "query": original_query
-        }
\ No newline at end of file
+            "query": query
+        }
+        
+        # Only cache successful responses (not errors)
+        if self.enable_cache:
+            self.cache.set(cache_key, result)
+        
+        return result
+    
+    @traced("llm.generate")
+    def generate(self, query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
+        cache_key, cached = self._lookup_cache(query, context_chunks)
+        if cached:
+            return cached
+        # Build prompt và gọi LLM
+        prompt = self.build_simple_prompt(query, context_chunks)
+        answer = self._call_with_failover(prompt)
+        return self._build_result(query, answer, self._build_sources(context_chunks), cache_key)
+    
+    @traced("llm.generate")
+    def generate_multi_intent(
+        self,
+        original_query: str,
+        sub_queries: List[str],
+        context_chunks: List[Dict]
+    ) -> Dict[str, Any]:
+        """Generate answer for multi-intent query"""
+        cache_key, cached = self._lookup_cache(original_query, context_chunks, sub_queries)
+        if cached:
+            return cached
+        
+        prompt = self.build_multi_intent_prompt(original_query, sub_queries, context_chunks)
+        answer = self._call_with_failover(prompt)
+        return self._build_result(original_query, answer, self._build_multi_sources(context_chunks), cache_key)
+    
+    @traced("llm.generate")
+    async def agenerate(self, query: str, context_chunks: List[Dict]) -> Dict[str, Any]:
+        cache_key, cached = self._lookup_cache(query, context_chunks)
+        if cached:
+            return cached
+        prompt = self.build_simple_prompt(query, context_chunks)
+        answer = await self._acall_with_failover(prompt)
+        return self._build_result(query, answer, self._build_sources(context_chunks), cache_key)
+    
+    @traced("llm.generate")
+    async def agenerate_multi_intent(
+        self,
+        original_query: str,
+        sub_queries: List[str],
+        context_chunks: List[Dict]
+    ) -> Dict[str, Any]:
+        cache_key, cached = self._lookup_cache(original_query, context_chunks, sub_queries)
+        if cached:
+            return cached
+        prompt = self.build_multi_intent_prompt(original_query, sub_queries, context_chunks)
+        answer = await self._acall_with_failover(prompt)
+        return self._build_result(original_query, answer, self._build_multi_sources(context_chunks), cache_key)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats() if self.cache else {}
+    
+    def router_stats(self) -> Dict[str, Dict[str, Any]]:
+        """p50/p95 latency, tỉ lệ lỗi và trạng thái circuit breaker của từng model"""
+        return self.router.stats()
+    
+    def hedge_stats(self) -> Dict[str, Any]:
+        return self.hedger.stats()
\ No newline at end of file
@@ -0,0 +1,251 @@
+import os
+import sys
+import asyncio
+import threading
+import weakref
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Iterator, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import (
+    GROQ_TIMEOUT, GROQ_CONNECT_TIMEOUT, GROQ_MAX_CONNECTIONS, GROQ_MAX_KEEPALIVE,
+    GROQ_KEEPALIVE_EXPIRY, GROQ_MODEL_CONCURRENCY, GROQ_DEFAULT_CONCURRENCY,
+    HEDGING_ENABLED, HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY, HEDGE_MAX_RATIO,
+    GROQ_RATE_LIMITS, GROQ_DEFAULT_RATE_LIMIT, SCHEDULER_MAX_WAIT,
+    LLM_TRANSPORT, LLM_CASSETTE_PATH, REPLAY_LATENCY_SCALE, SYNTHETIC_TRANSPORT
+)
+from .hedging import Hedger
+from .transport import LLMTransport, build_transport
+from .model_router import retry_after_seconds
+from .scheduler import QuotaScheduler, QuotaExceeded, PRIORITY_BACKGROUND, PRIORITY_NAMES, estimate_tokens
+from monitoring.tracing import span
+from monitoring.metrics import GROQ_REQUESTS, GROQ_ERRORS
+
+load_dotenv()
+
+
+class GroqClientFactory:
+    """
+    Một cặp client Groq (sync + async) dùng chung cho mọi component của pipeline:
+    connection pool keep-alive, timeout cấu hình được và giới hạn số request đồng thời theo model.
+    Mọi request đi qua QuotaScheduler: create(..., priority=PRIORITY_*) (mặc định PRIORITY_BACKGROUND).
+    transport: nơi request thực sự được gửi (Groq thật / record / replay / synthetic);
+    không truyền thì tạo theo transport_mode (mặc định LLM_TRANSPORT) và cassette_path.
+    """
+
+    def __init__(
+        self,
+        api_key: str = None,
+        timeout: float = GROQ_TIMEOUT,
+        connect_timeout: float = GROQ_CONNECT_TIMEOUT,
+        max_connections: int = GROQ_MAX_CONNECTIONS,
+        max_keepalive: int = GROQ_MAX_KEEPALIVE,
+        keepalive_expiry: float = GROQ_KEEPALIVE_EXPIRY,
+        model_concurrency: Dict[str, int] = None,
+        default_concurrency: int = GROQ_DEFAULT_CONCURRENCY,
+        transport: LLMTransport = None,
+        transport_mode: str = LLM_TRANSPORT,
+        cassette_path: str = LLM_CASSETTE_PATH
+    ):
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.transport = transport or build_transport(
+            transport_mode,
+            api_key=self.api_key,
+            timeout=self.timeout,
+            limits=self.limits,
+            cassette_path=cassette_path,
+            replay_latency_scale=REPLAY_LATENCY_SCALE,
+            synthetic=SYNTHETIC_TRANSPORT
+        )
+        self.model_concurrency = dict(GROQ_MODEL_CONCURRENCY if model_concurrency is None else model_concurrency)
+        self.default_concurrency = default_concurrency
+        self.scheduler = QuotaScheduler(
+            GROQ_RATE_LIMITS,
+            default_limit=GROQ_DEFAULT_RATE_LIMIT,
+            max_wait=SCHEDULER_MAX_WAIT
+        )
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        # asyncio.Semaphore gắn với event loop -> mỗi loop một bộ
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        # Hedger dùng chung -> giới hạn tỉ lệ hedge tính trên toàn bộ lời gọi LLM của process
+        self.hedger = Hedger(
+            enabled=HEDGING_ENABLED,
+            percentile=HEDGE_PERCENTILE,
+            min_delay=HEDGE_MIN_DELAY,
+            default_delay=HEDGE_DEFAULT_DELAY,
+            max_hedge_ratio=HEDGE_MAX_RATIO
+        )
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = _LimitedClient(self.transport, _LimitedCompletions(self.transport, self))
+                print(f"✅ Groq client pool ready (max {self.limits.max_connections} connections, transport: {self.transport.name})")
+            return self._client
+
+    @property
+    def async_client(self):
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = _LimitedClient(self.transport, _AsyncLimitedCompletions(self.transport, self))
+            return self._async_client
+
+    def concurrency_limit(self, model: Optional[str]) -> int:
+        return self.model_concurrency.get(model, self.default_concurrency)
+
+    def model_semaphore(self, model: Optional[str]) -> threading.BoundedSemaphore:
+        with self._lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = threading.BoundedSemaphore(self.concurrency_limit(model))
+            return self._semaphores[model]
+
+    def async_model_semaphore(self, model: Optional[str]) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            per_loop = self._async_semaphores.setdefault(loop, {})
+            if model not in per_loop:
+                per_loop[model] = asyncio.Semaphore(self.concurrency_limit(model))
+            return per_loop[model]
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self.transport.close()
+                self._client = None
+
+
+class _LimitedClient:
+    """Giữ giao diện client.chat.completions.create(...) như SDK Groq"""
+
+    def __init__(self, transport: LLMTransport, completions):
+        self.transport = transport
+        self.chat = SimpleNamespace(completions=completions)
+
+
+class _LimitedCompletions:
+    def __init__(self, transport: LLMTransport, factory: GroqClientFactory):
+        self._transport = transport
+        self._factory = factory
+
+    def create(self, priority: int = PRIORITY_BACKGROUND, **kwargs):
+        model = kwargs.get("model")
+        estimated = estimate_tokens(kwargs.get("messages"), kwargs.get("max_tokens"))
+        with _call_span(model, priority, estimated, kwargs) as s:
+            try:
+                s.set(quota_wait=self._factory.scheduler.acquire(model, estimated, priority))
+            except QuotaExceeded:
+                GROQ_ERRORS.inc(model=model, kind="shed")
+                raise
+            GROQ_REQUESTS.inc(model=model, priority=PRIORITY_NAMES.get(priority, str(priority)))
+            
+            semaphore = self._factory.model_semaphore(model)
+            semaphore.acquire()
+            try:
+                response = self._transport.create(**kwargs)
+            except BaseException as e:
+                semaphore.release()
+                _on_error(self._factory, model, e)
+                raise
+            if kwargs.get("stream"):
+                # Stream giữ slot cho đến khi đọc xong (span chỉ đo đến lúc nhận response)
+                return _release_when_done(response, semaphore)
+            semaphore.release()
+            _settle(self._factory, model, estimated, response, s)
+            return response
+
+
+class _AsyncLimitedCompletions:
+    def __init__(self, transport: LLMTransport, factory: GroqClientFactory):
+        self._transport = transport
+        self._factory = factory
+
+    async def create(self, priority: int = PRIORITY_BACKGROUND, **kwargs):
+        model = kwargs.get("model")
+        estimated = estimate_tokens(kwargs.get("messages"), kwargs.get("max_tokens"))
+        with _call_span(model, priority, estimated, kwargs) as s:
+            try:
+                s.set(quota_wait=await self._factory.scheduler.aacquire(model, estimated, priority))
+            except QuotaExceeded:
+                GROQ_ERRORS.inc(model=model, kind="shed")
+                raise
+            GROQ_REQUESTS.inc(model=model, priority=PRIORITY_NAMES.get(priority, str(priority)))
+            
+            async with self._factory.async_model_semaphore(model):
+                try:
+                    response = await self._transport.acreate(**kwargs)
+                except Exception as e:
+                    _on_error(self._factory, model, e)
+                    raise
+            _settle(self._factory, model, estimated, response, s)
+            return response
+
+
+def _call_span(model: str, priority: int, estimated: int, kwargs: dict):
+    return span(
+        "groq.chat",
+        model=model,
+        priority=PRIORITY_NAMES.get(priority, priority),
+        estimated_tokens=estimated,
+        stream=bool(kwargs.get("stream"))
+    )
+
+
+def _on_error(factory: GroqClientFactory, model: str, error: BaseException):
+    retry_after = retry_after_seconds(error)
+    GROQ_ERRORS.inc(model=model, kind="rate_limit" if retry_after else "error")
+    if retry_after:
+        factory.scheduler.penalize(model, retry_after)
+
+
+def _settle(factory: GroqClientFactory, model: str, estimated: int, response, call_span):
+    usage = getattr(response, "usage", None)
+    factory.scheduler.settle(model, estimated, getattr(usage, "total_tokens", None))
+    if usage is not None:
+        call_span.set(
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None)
+        )
+
+
+def _release_when_done(stream, semaphore: threading.BoundedSemaphore) -> Iterator:
+    try:
+        yield from stream
+    finally:
+        semaphore.release()
+
+
+# Singleton dùng chung trong process
+_factory_instance = None
+_factory_lock = threading.Lock()
+
+def get_client_factory(api_key: str = None) -> GroqClientFactory:
+    global _factory_instance
+    with _factory_lock:
+        if _factory_instance is None:
+            _factory_instance = GroqClientFactory(api_key=api_key)
+        return _factory_instance
+
+
+def configure_client_factory(transport: LLMTransport = None, **kwargs) -> GroqClientFactory:
+    """Thay factory mặc định, ví dụ benchmark chạy với ReplayTransport / SyntheticTransport"""
+    global _factory_instance
+    with _factory_lock:
+        if _factory_instance is not None:
+            _factory_instance.close()
+        _factory_instance = GroqClientFactory(transport=transport, **kwargs)
+        return _factory_instance
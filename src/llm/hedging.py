@@ -0,0 +1,167 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+from monitoring.tracing import bind_context
+
+
+class Hedger:
+    """
+    Hedged request: nếu request chính chưa xong sau `delay` (p90 latency gần đây của model đó),
+    gửi thêm một request dự phòng (model phụ hoặc chính model đó), lấy kết quả về trước và hủy cái còn lại.
+    Tỉ lệ request được hedge bị chặn bởi max_hedge_ratio để không đốt quota.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        percentile: float = 90,
+        min_delay: float = 0.3,
+        default_delay: float = 3.0,
+        max_hedge_ratio: float = 0.1,
+        window: int = 200,
+        min_samples: int = 10,
+        max_workers: int = 16
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}
+        self._decisions = deque(maxlen=window)  # True = request đã hedge
+        self._counts = {"requests": 0, "hedged": 0, "backup_wins": 0, "capped": 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge") if enabled else None
+
+    def hedge_delay(self, model: str) -> float:
+        with self._lock:
+            latencies = self._latencies.get(model)
+            if not latencies or len(latencies) < self.min_samples:
+                return self.default_delay
+            return max(self.min_delay, float(np.percentile(latencies, self.percentile)))
+
+    def run(self, fn: Callable[[str], Any], primary: str, secondary: Optional[str] = None) -> Any:
+        """Gọi fn(model) (blocking). secondary=None -> không hedge"""
+        if not self.enabled or secondary is None:
+            return self._timed(fn, primary)
+
+        delay = self.hedge_delay(primary)
+        fn = bind_context(fn)
+        future = self._executor.submit(self._timed, fn, primary)
+        done, _ = wait([future], timeout=delay)
+        if done or not self._allow_hedge():
+            # finally: request chính lỗi trước delay vẫn được tính (không lệch tỉ lệ hedge)
+            try:
+                return future.result()
+            finally:
+                self._finish(hedged=False)
+
+        print(f"[Hedge] ⏱️ {primary} > {delay:.2f}s, hedging to {secondary}")
+        backup = self._executor.submit(self._timed, fn, secondary)
+        pending = {future: primary, backup: secondary}
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                pending.pop(f)
+                try:
+                    result = f.result()
+                except Exception as e:
+                    error = e
+                    continue
+                for other in pending:
+                    other.cancel()  # thread đang chạy thì để chạy nốt, kết quả bị bỏ
+                self._finish(hedged=True, backup_won=f is backup)
+                return result
+        self._finish(hedged=True)
+        raise error
+
+    async def arun(self, afn: Callable[[str], Awaitable[Any]], primary: str, secondary: Optional[str] = None) -> Any:
+        """Bản async của run: request thua bị cancel thật sự"""
+        if not self.enabled or secondary is None:
+            start = time.time()
+            result = await afn(primary)
+            self._record_latency(primary, time.time() - start)
+            return result
+
+        delay = self.hedge_delay(primary)
+        task = asyncio.ensure_future(self._atimed(afn, primary))
+        done, _ = await asyncio.wait({task}, timeout=delay)
+        if done or not self._allow_hedge():
+            try:
+                return await task
+            finally:
+                self._finish(hedged=False)
+
+        print(f"[Hedge] ⏱️ {primary} > {delay:.2f}s, hedging to {secondary}")
+        backup = asyncio.ensure_future(self._atimed(afn, secondary))
+        pending = {task, backup}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is not None:
+                    error = t.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                self._finish(hedged=True, backup_won=t is backup)
+                return t.result()
+        self._finish(hedged=True)
+        raise error
+
+    def _timed(self, fn, model: str):
+        start = time.time()
+        result = fn(model)
+        self._record_latency(model, time.time() - start)
+        return result
+
+    async def _atimed(self, afn, model: str):
+        start = time.time()
+        result = await afn(model)
+        self._record_latency(model, time.time() - start)
+        return result
+
+    def _record_latency(self, model: str, latency: float):
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.window)).append(latency)
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            hedged = sum(self._decisions)
+            # +1: tính cả request hiện tại
+            if (hedged + 1) / (len(self._decisions) + 1) > self.max_hedge_ratio:
+                self._counts["capped"] += 1
+                return False
+            return True
+
+    def _finish(self, hedged: bool, backup_won: bool = False):
+        with self._lock:
+            self._decisions.append(hedged)
+            self._counts["requests"] += 1
+            if hedged:
+                self._counts["hedged"] += 1
+            if backup_won:
+                self._counts["backup_wins"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+            recent_ratio = sum(self._decisions) / len(self._decisions) if self._decisions else 0.0
+        return {
+            **counts,
+            "enabled": self.enabled,
+            "recent_hedge_ratio": recent_ratio,
+            "max_hedge_ratio": self.max_hedge_ratio
+        }
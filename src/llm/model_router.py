@@ -0,0 +1,177 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Any
+
+import numpy as np
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Đọc header retry-after / retry-after-ms từ lỗi của SDK Groq (APIStatusError.response)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class CircuitBreaker:
+    """
+    closed -> (failure_threshold lỗi liên tiếp) -> open -> (hết recovery_timeout) -> half_open
+    half_open: cho đúng một request thử; thành công -> closed, lỗi -> open lại với thời gian chờ gấp đôi.
+    Request thử bị bỏ dở (stream bị đóng, hedge thua bị cancel) phải gọi release_probe();
+    nếu không, sau probe_timeout giây lượt thử tự hết hạn để model không bị khóa vĩnh viễn.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+        max_recovery_timeout: float = 600.0,
+        probe_timeout: float = 60.0
+    ):
+        self.failure_threshold = failure_threshold
+        self.probe_timeout = probe_timeout
+        self.base_recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.recovery_timeout = recovery_timeout
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.half_open = False
+        self.probe_in_flight = False
+        self.probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.open_until > time.time():
+            return "open"
+        if self.half_open:
+            return "half_open"
+        return "closed"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "open":
+            return False
+        if state == "half_open":
+            if self.probe_in_flight and time.time() - self.probe_started < self.probe_timeout:
+                return False
+            self.probe_in_flight = True
+            self.probe_started = time.time()
+        return True
+
+    def release_probe(self):
+        """Request thử kết thúc mà không có kết quả (bị hủy): cho phép probe khác, giữ nguyên trạng thái"""
+        self.probe_in_flight = False
+
+    def on_success(self):
+        self.consecutive_failures = 0
+        self.half_open = False
+        self.probe_in_flight = False
+        self.recovery_timeout = self.base_recovery_timeout
+
+    def on_failure(self, retry_after: float = None):
+        self.consecutive_failures += 1
+        was_probe = self.half_open
+        self.probe_in_flight = False
+
+        if retry_after:
+            # Rate limit: chờ đúng thời gian server yêu cầu, không tính là model hỏng
+            self._open(retry_after)
+        elif was_probe:
+            self.recovery_timeout = min(self.recovery_timeout * 2, self.max_recovery_timeout)
+            self._open(self.recovery_timeout)
+        elif self.consecutive_failures >= self.failure_threshold:
+            self._open(self.recovery_timeout)
+
+    def _open(self, seconds: float):
+        self.open_until = max(self.open_until, time.time() + seconds)
+        self.half_open = True  # hết thời gian open thì vào half_open
+
+
+class ModelRouter:
+    """Chọn model nhanh nhất đang khỏe theo p50 latency (cửa sổ trượt) và tỉ lệ lỗi"""
+
+    def __init__(
+        self,
+        models: List[str],
+        window: int = 50,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+        max_recovery_timeout: float = 600.0,
+        max_error_rate: float = 0.5,
+        probe_timeout: float = 60.0
+    ):
+        self.models = list(models)
+        self.max_error_rate = max_error_rate
+        self._lock = threading.Lock()
+        self._latencies = {m: deque(maxlen=window) for m in self.models}
+        self._outcomes = {m: deque(maxlen=window) for m in self.models}
+        self._breakers = {
+            m: CircuitBreaker(failure_threshold, recovery_timeout, max_recovery_timeout, probe_timeout)
+            for m in self.models
+        }
+
+    def ranked_models(self) -> List[str]:
+        """Model theo thứ tự ưu tiên: khỏe trước, trong nhóm khỏe thì p50 thấp trước"""
+        with self._lock:
+            def key(model):
+                latencies = self._latencies[model]
+                p50 = float(np.percentile(latencies, 50)) if latencies else 0.0  # chưa có số liệu -> thử trước
+                unhealthy = self._error_rate(model) > self.max_error_rate
+                return (self._breakers[model].state != "closed", unhealthy, p50)
+            return sorted(self.models, key=key)
+
+    def allow(self, model: str) -> bool:
+        with self._lock:
+            return self._breakers[model].allow()
+
+    def is_healthy(self, model: str) -> bool:
+        """Circuit đóng và tỉ lệ lỗi dưới ngưỡng (dùng để chọn model dự phòng cho hedging)"""
+        with self._lock:
+            return self._breakers[model].state == "closed" and self._error_rate(model) <= self.max_error_rate
+
+    def record_success(self, model: str, latency: float):
+        with self._lock:
+            self._latencies[model].append(latency)
+            self._outcomes[model].append(True)
+            self._breakers[model].on_success()
+
+    def release(self, model: str):
+        """Request bị hủy (không thành công, không lỗi): trả lại lượt probe half-open nếu đang giữ"""
+        with self._lock:
+            self._breakers[model].release_probe()
+
+    def record_failure(self, model: str, retry_after: float = None):
+        with self._lock:
+            self._outcomes[model].append(False)
+            self._breakers[model].on_failure(retry_after)
+
+    def _error_rate(self, model: str) -> float:
+        outcomes = self._outcomes[model]
+        if not outcomes:
+            return 0.0
+        return 1.0 - sum(outcomes) / len(outcomes)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for model in self.models:
+                latencies = self._latencies[model]
+                breaker = self._breakers[model]
+                result[model] = {
+                    "state": breaker.state,
+                    "p50": float(np.percentile(latencies, 50)) if latencies else None,
+                    "p95": float(np.percentile(latencies, 95)) if latencies else None,
+                    "error_rate": self._error_rate(model),
+                    "samples": len(self._outcomes[model]),
+                    "retry_in": max(0.0, breaker.open_until - time.time())
+                }
+            return result
@@ -0,0 +1,220 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Độ ưu tiên (số nhỏ = ưu tiên cao)
+PRIORITY_GENERATION = 0  # câu trả lời cho người dùng
+PRIORITY_GRADING = 1  # chấm độ liên quan, tách câu hỏi
+PRIORITY_EXPANSION = 2  # mở rộng câu hỏi (không bắt buộc)
+PRIORITY_BACKGROUND = 3  # benchmark, OCR khi nạp dữ liệu
+
+PRIORITY_NAMES = {
+    PRIORITY_GENERATION: "generation",
+    PRIORITY_GRADING: "grading",
+    PRIORITY_EXPANSION: "expansion",
+    PRIORITY_BACKGROUND: "background"
+}
+
+IMAGE_TOKEN_ESTIMATE = 1000
+
+
+class QuotaExceeded(Exception):
+    """Request bị loại (shed) vì phải chờ quota lâu hơn mức cho phép của độ ưu tiên đó"""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int = 0) -> int:
+    """
+    Ước lượng token trước khi gửi: ~3 ký tự/token (tiếng Việt có dấu tách token nhiều hơn tiếng Anh)
+    + max_tokens vì Groq tính TPM cả phần output.
+    """
+    chars = 0
+    images = 0
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                else:
+                    images += 1
+    return chars // 3 + images * IMAGE_TOKEN_ESTIMATE + (max_tokens or 0)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.tokens = capacity
+        self.updated = time.time()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)  # request lớn hơn cả bucket: chờ đầy bucket
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self, seconds: float, now: float):
+        """Server báo rate limit -> coi như bucket rỗng thêm `seconds` giây"""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class QuotaScheduler:
+    """
+    Điều phối quota Groq (requests/phút + tokens/phút) cho mọi bước của pipeline.
+    Mỗi model một cặp token bucket; request chờ theo thứ tự (độ ưu tiên, thứ tự đến).
+    Request phải chờ quá max_wait (theo tên độ ưu tiên) thì bị loại (QuotaExceeded) thay vì chờ mãi.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[int, int]],
+        default_limit: Tuple[int, int] = (30, 6000),
+        max_wait: Dict[str, Optional[float]] = None,
+        window: int = 200
+    ):
+        self.limits = dict(limits)
+        self.default_limit = default_limit
+        self.max_wait = dict(max_wait or {})
+        self._cond = threading.Condition()
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._queues: Dict[str, list] = {}
+        self._seq = itertools.count()
+        self._waits = {p: deque(maxlen=window) for p in PRIORITY_NAMES}
+        self._counts = {p: {"admitted": 0, "shed": 0} for p in PRIORITY_NAMES}
+
+    def acquire(self, model: str, tokens: int, priority: int = PRIORITY_BACKGROUND) -> float:
+        """Chờ (blocking) đến khi model còn quota. Trả về thời gian đã chờ"""
+        start = time.time()
+        with self._cond:
+            ticket = self._enqueue(model, priority)
+            while True:
+                delay = self._try_take(model, ticket, tokens)
+                if delay == 0:
+                    break
+                self._check_shed(model, ticket, priority, time.time() - start + delay)
+                self._cond.wait(delay)
+        return self._admitted(priority, time.time() - start)
+
+    async def aacquire(self, model: str, tokens: int, priority: int = PRIORITY_BACKGROUND) -> float:
+        """Bản async của acquire: chờ bằng asyncio.sleep, không chặn event loop"""
+        start = time.time()
+        with self._cond:
+            ticket = self._enqueue(model, priority)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_take(model, ticket, tokens)
+                    if delay == 0:
+                        break
+                    self._check_shed(model, ticket, priority, time.time() - start + delay)
+                await asyncio.sleep(min(delay, 0.05))
+        except asyncio.CancelledError:
+            with self._cond:
+                self._remove(model, ticket)
+            raise
+        return self._admitted(priority, time.time() - start)
+
+    def settle(self, model: str, estimated: int, actual: Optional[int]):
+        """Bù trừ chênh lệch giữa token ước lượng và token thực tế (response.usage)"""
+        if actual is None:
+            return
+        with self._cond:
+            _, token_bucket = self._get_buckets(model)
+            token_bucket.tokens = min(token_bucket.capacity, token_bucket.tokens + estimated - actual)
+            self._cond.notify_all()
+
+    def penalize(self, model: str, retry_after: float):
+        """Groq trả 429 dù đã điều phối (quota dùng chung với process khác) -> tạm dừng model đó"""
+        with self._cond:
+            now = time.time()
+            for bucket in self._get_buckets(model):
+                bucket.drain(retry_after, now)
+
+    def _get_buckets(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            rpm, tpm = self.limits.get(model, self.default_limit)
+            self._buckets[model] = (TokenBucket(rpm, rpm), TokenBucket(tpm, tpm))
+        return self._buckets[model]
+
+    def _enqueue(self, model: str, priority: int) -> tuple:
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._queues.setdefault(model, []), ticket)
+        return ticket
+
+    def _remove(self, model: str, ticket: tuple):
+        queue = self._queues[model]
+        if ticket in queue:
+            queue.remove(ticket)
+            heapq.heapify(queue)
+            self._cond.notify_all()
+
+    def _try_take(self, model: str, ticket: tuple, tokens: int) -> float:
+        """0 nếu đã lấy được quota, ngược lại số giây nên chờ"""
+        queue = self._queues[model]
+        if queue[0] != ticket:
+            return 0.05  # chưa tới lượt; request đứng trước lấy xong sẽ notify
+        request_bucket, token_bucket = self._get_buckets(model)
+        now = time.time()
+        delay = max(request_bucket.time_until(1, now), token_bucket.time_until(tokens, now))
+        if delay > 0:
+            return delay
+        request_bucket.take(1)
+        token_bucket.take(tokens)
+        heapq.heappop(queue)
+        self._cond.notify_all()
+        return 0
+
+    def _check_shed(self, model: str, ticket: tuple, priority: int, projected_wait: float):
+        name = PRIORITY_NAMES.get(priority, priority)
+        max_wait = self.max_wait.get(name)
+        if max_wait is None or projected_wait <= max_wait:
+            return
+        self._remove(model, ticket)
+        self._counts[priority]["shed"] += 1
+        print(f"[Scheduler] 🚫 Shed {name} request on {model} (wait {projected_wait:.1f}s > {max_wait}s)")
+        raise QuotaExceeded(f"{model}: {name} request would wait {projected_wait:.1f}s", retry_after=projected_wait)
+
+    def _admitted(self, priority: int, waited: float) -> float:
+        with self._cond:
+            self._waits[priority].append(waited)
+            self._counts[priority]["admitted"] += 1
+        if waited > 1.0:
+            print(f"[Scheduler] ⏳ {PRIORITY_NAMES.get(priority, priority)} request paced {waited:.1f}s")
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queue_depth = {
+                model: {PRIORITY_NAMES[p]: sum(1 for t in queue if t[0] == p) for p in PRIORITY_NAMES}
+                for model, queue in self._queues.items() if queue
+            }
+            by_priority = {}
+            for p, name in PRIORITY_NAMES.items():
+                waits = self._waits[p]
+                by_priority[name] = {
+                    **self._counts[p],
+                    "wait_p50": float(np.percentile(waits, 50)) if waits else None,
+                    "wait_p95": float(np.percentile(waits, 95)) if waits else None
+                }
+        return {"queue_depth": queue_depth, "priorities": by_priority}
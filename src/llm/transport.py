@@ -0,0 +1,414 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import httpx
+from groq import Groq, AsyncGroq
+
+# Tham số không ảnh hưởng nội dung trả lời -> không đưa vào key của cassette
+_NON_KEY_PARAMS = ("stream", "stream_options", "timeout", "extra_headers", "extra_query", "extra_body")
+
+
+def cassette_key(kwargs: Dict[str, Any]) -> str:
+    """Key = hash(model, prompt, tham số sinh). Stream và non-stream dùng chung một bản ghi"""
+    params = {k: v for k, v in kwargs.items() if k not in _NON_KEY_PARAMS}
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_response(content: str, model: str, usage: Optional[Dict[str, int]] = None):
+    """Response giả lập đúng các field pipeline đọc: choices[0].message.content, usage"""
+    usage = usage or {}
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=SimpleNamespace(
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            total_tokens=usage.get("total_tokens")
+        ) if usage else None
+    )
+
+
+def make_chunk(delta: Optional[str], model: str):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=delta), finish_reason=None if delta else "stop")]
+    )
+
+
+def _split_chunks(content: str, chunk_chars: int) -> List[str]:
+    return [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)] or [""]
+
+
+def _usage_dict(response) -> Optional[Dict[str, int]]:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None)
+    }
+
+
+class TransportError(Exception):
+    """Lỗi giả lập có cùng hình dạng với APIStatusError của SDK (status_code, response.headers)"""
+
+    def __init__(self, message: str, status_code: int = 500, headers: Dict[str, str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=dict(headers or {}))
+
+
+class CassetteMiss(Exception):
+    """Replay không có bản ghi cho request này (prompt/tham số đã đổi -> cần record lại)"""
+
+
+class LLMTransport:
+    """
+    Lớp dưới cùng của GroqClientFactory: nhận kwargs của chat.completions.create và trả response kiểu SDK.
+    Scheduler, semaphore, tracing, metrics vẫn chạy phía trên -> đo được latency của code mình khi không có mạng.
+    """
+
+    name = "base"
+
+    def create(self, **kwargs):
+        raise NotImplementedError
+
+    async def acreate(self, **kwargs):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LiveTransport(LLMTransport):
+    """Gọi Groq thật qua SDK (sync + async), dùng chung connection pool"""
+
+    name = "live"
+
+    def __init__(self, api_key: str, timeout: httpx.Timeout, limits: httpx.Limits):
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in .env")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = Groq(
+                    api_key=self.api_key,
+                    timeout=self.timeout,
+                    http_client=httpx.Client(limits=self.limits, timeout=self.timeout)
+                )
+            return self._client
+
+    @property
+    def async_client(self):
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncGroq(
+                    api_key=self.api_key,
+                    timeout=self.timeout,
+                    http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+                )
+            return self._async_client
+
+    def create(self, **kwargs):
+        return self.client.chat.completions.create(**kwargs)
+
+    async def acreate(self, **kwargs):
+        return await self.async_client.chat.completions.create(**kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+class DisabledTransport(LLMTransport):
+    """Mọi lời gọi LLM đều lỗi: dùng cho benchmark chỉ đo retrieval, đảm bảo không tốn quota"""
+
+    name = "disabled"
+
+    def create(self, **kwargs):
+        raise TransportError(f"LLM calls are disabled ({kwargs.get('model')})", status_code=503)
+
+    async def acreate(self, **kwargs):
+        self.create(**kwargs)
+
+
+class Cassette:
+    """File JSONL: mỗi dòng một bản ghi {key, model, content, usage, latency}. Key trùng -> bản ghi mới nhất thắng"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def append(self, kwargs: Dict[str, Any], content: str, usage: Optional[Dict[str, int]], latency: float):
+        entry = {
+            "key": cassette_key(kwargs),
+            "model": kwargs.get("model"),
+            "content": content,
+            "usage": usage,
+            "latency": round(latency, 4),
+            "recorded_at": time.time()
+        }
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class RecordingTransport(LLMTransport):
+    """Chuyển request sang transport thật và ghi lại response (kể cả stream) vào cassette"""
+
+    name = "record"
+
+    def __init__(self, inner: LLMTransport, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    def create(self, **kwargs):
+        start = time.time()
+        response = self.inner.create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream(response, kwargs, start)
+        self.cassette.append(kwargs, response.choices[0].message.content, _usage_dict(response), time.time() - start)
+        return response
+
+    async def acreate(self, **kwargs):
+        start = time.time()
+        response = await self.inner.acreate(**kwargs)
+        if kwargs.get("stream"):
+            return self._arecord_stream(response, kwargs, start)
+        self.cassette.append(kwargs, response.choices[0].message.content, _usage_dict(response), time.time() - start)
+        return response
+
+    def _record_stream(self, stream, kwargs: Dict[str, Any], start: float) -> Iterator:
+        parts = []
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+            yield chunk
+        self.cassette.append(kwargs, "".join(parts), None, time.time() - start)
+
+    async def _arecord_stream(self, stream, kwargs: Dict[str, Any], start: float) -> AsyncIterator:
+        parts = []
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+            yield chunk
+        self.cassette.append(kwargs, "".join(parts), None, time.time() - start)
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayTransport(LLMTransport):
+    """
+    Trả response đã ghi, không cần mạng.
+    latency_scale: 0 = trả ngay; 1.0 = chờ đúng latency lúc ghi (tái hiện phân bố latency thật).
+    """
+
+    name = "replay"
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0, chunk_chars: int = 16):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self.chunk_chars = chunk_chars
+        self.misses = 0
+
+    def lookup(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self.cassette.get(cassette_key(kwargs))
+        if entry is None:
+            self.misses += 1
+            raise CassetteMiss(f"No recording for {kwargs.get('model')} (record again with LLM_TRANSPORT='record')")
+        return entry
+
+    def create(self, **kwargs):
+        entry = self.lookup(kwargs)
+        time.sleep(entry["latency"] * self.latency_scale)
+        return self._respond(entry, kwargs)
+
+    async def acreate(self, **kwargs):
+        entry = self.lookup(kwargs)
+        await asyncio.sleep(entry["latency"] * self.latency_scale)
+        return self._arespond(entry, kwargs) if kwargs.get("stream") else self._respond(entry, kwargs)
+
+    def _respond(self, entry: Dict[str, Any], kwargs: Dict[str, Any]):
+        model = kwargs.get("model")
+        if kwargs.get("stream"):
+            return iter([make_chunk(part, model) for part in _split_chunks(entry["content"], self.chunk_chars)])
+        return make_response(entry["content"], model, entry.get("usage"))
+
+    async def _arespond(self, entry: Dict[str, Any], kwargs: Dict[str, Any]) -> AsyncIterator:
+        for part in _split_chunks(entry["content"], self.chunk_chars):
+            yield make_chunk(part, kwargs.get("model"))
+
+
+class LatencyModel:
+    """
+    Phân bố latency (giây) cho synthetic transport:
+    ("constant", value) | ("uniform", low, high) | ("lognormal", median, sigma).
+    per_model: ghi đè phân bố cho từng model (ví dụ 70B chậm hơn 8B).
+    """
+
+    def __init__(self, distribution: tuple = ("lognormal", 0.8, 0.5), per_model: Dict[str, tuple] = None):
+        self.distribution = tuple(distribution)
+        self.per_model = {model: tuple(d) for model, d in (per_model or {}).items()}
+        for d in (self.distribution, *self.per_model.values()):
+            if d[0] not in ("constant", "uniform", "lognormal"):
+                raise ValueError(f"Unknown latency distribution: {d[0]}")
+
+    def sample(self, model: str, rng: random.Random) -> float:
+        kind, *params = self.per_model.get(model, self.distribution)
+        if kind == "constant":
+            return params[0]
+        if kind == "uniform":
+            return rng.uniform(params[0], params[1])
+        return rng.lognormvariate(0.0, params[1]) * params[0]
+
+
+def default_responder(kwargs: Dict[str, Any]) -> str:
+    if (kwargs.get("response_format") or {}).get("type") == "json_object":
+        return "{}"
+    return f"[synthetic] {kwargs.get('model')}"
+
+
+class SyntheticTransport(LLMTransport):
+    """
+    Transport giả lập có kiểm soát: latency theo LatencyModel, lỗi 5xx và 429 (kèm retry-after) theo tỉ lệ.
+    Nội dung lấy từ cassette nếu có (ghi thật, latency/lỗi giả lập), không thì từ responder.
+    seed cố định -> cùng chuỗi latency/lỗi mỗi lần chạy.
+    """
+
+    name = "synthetic"
+
+    def __init__(
+        self,
+        latency: LatencyModel = None,
+        failure_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 2.0,
+        seed: Optional[int] = 42,
+        cassette: Cassette = None,
+        responder: Callable[[Dict[str, Any]], str] = default_responder,
+        chunk_chars: int = 16
+    ):
+        self.latency = latency or LatencyModel()
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.cassette = cassette
+        self.responder = responder
+        self.chunk_chars = chunk_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _plan(self, kwargs: Dict[str, Any]):
+        """(latency, lỗi sẽ raise hoặc None, nội dung)"""
+        model = kwargs.get("model")
+        with self._lock:
+            latency = self.latency.sample(model, self._rng)
+            roll = self._rng.random()
+        error = None
+        if roll < self.rate_limit_rate:
+            error = TransportError(
+                f"Synthetic rate limit on {model}", status_code=429, headers={"retry-after": str(self.retry_after)}
+            )
+        elif roll < self.rate_limit_rate + self.failure_rate:
+            error = TransportError(f"Synthetic server error on {model}", status_code=503)
+
+        entry = self.cassette.get(cassette_key(kwargs)) if self.cassette is not None else None
+        content = entry["content"] if entry else self.responder(kwargs)
+        return latency, error, content
+
+    def _usage(self, kwargs: Dict[str, Any], content: str) -> Dict[str, int]:
+        prompt_chars = sum(len(m.get("content")) for m in kwargs.get("messages") or [] if isinstance(m.get("content"), str))
+        prompt_tokens, completion_tokens = prompt_chars // 3, len(content) // 3
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    def create(self, **kwargs):
+        latency, error, content = self._plan(kwargs)
+        time.sleep(latency)
+        if error is not None:
+            raise error
+        if kwargs.get("stream"):
+            return iter([make_chunk(part, kwargs.get("model")) for part in _split_chunks(content, self.chunk_chars)])
+        return make_response(content, kwargs.get("model"), self._usage(kwargs, content))
+
+    async def acreate(self, **kwargs):
+        latency, error, content = self._plan(kwargs)
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise error
+        if kwargs.get("stream"):
+            return self._astream(content, kwargs.get("model"))
+        return make_response(content, kwargs.get("model"), self._usage(kwargs, content))
+
+    async def _astream(self, content: str, model: str) -> AsyncIterator:
+        for part in _split_chunks(content, self.chunk_chars):
+            yield make_chunk(part, model)
+
+
+def build_transport(
+    mode: str,
+    api_key: str = None,
+    timeout: httpx.Timeout = None,
+    limits: httpx.Limits = None,
+    cassette_path: str = None,
+    replay_latency_scale: float = 0.0,
+    synthetic: Dict[str, Any] = None
+) -> LLMTransport:
+    """mode: "live" | "record" | "replay" | "synthetic" | "disabled" """
+    if mode == "live":
+        return LiveTransport(api_key, timeout, limits)
+    if mode == "record":
+        return RecordingTransport(LiveTransport(api_key, timeout, limits), Cassette(cassette_path))
+    if mode == "replay":
+        cassette = Cassette(cassette_path)
+        print(f"[Transport] 📼 Replay {len(cassette)} recorded responses from {cassette_path}")
+        return ReplayTransport(cassette, latency_scale=replay_latency_scale)
+    if mode == "synthetic":
+        options = dict(synthetic or {})
+        latency = LatencyModel(options.pop("latency", ("lognormal", 0.8, 0.5)), options.pop("per_model_latency", None))
+        cassette = Cassette(cassette_path) if cassette_path and os.path.exists(cassette_path) else None
+        return SyntheticTransport(latency=latency, cassette=cassette, **options)
+    if mode == "disabled":
+        return DisabledTransport()
+    raise ValueError(f"Unknown LLM transport: {mode}")
@@ -0,0 +1,284 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import TRACING_ENABLED, TRACE_EXPORT_PATH, TRACE_EXPORT_FORMAT
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """Một bước trong request: thời gian bắt đầu/kết thúc + thuộc tính (model, token, cache hit, action...)"""
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"] = None, attributes: Dict[str, Any] = None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        # Span gốc giữ danh sách span đã xong của cả trace, export một lần khi span gốc kết thúc
+        self._finished: List["Span"] = parent._finished if parent else []
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {str(error)[:200]}"
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self._finished.append(self)
+        self.tracer.notify(self)
+        if self.parent is None:
+            self.tracer.export(self._finished)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """Tracing tắt / không có span nào đang chạy: mọi thao tác đều bỏ qua"""
+
+    def set(self, **attributes):
+        return self
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlExporter:
+    """
+    Ghi trace ra file JSONL.
+    format="jsonl": mỗi dòng một span; format="otlp": mỗi dòng một trace theo OTLP/JSON (resourceSpans),
+    đọc được bằng OpenTelemetry Collector (otlpjsonfile receiver).
+    """
+
+    def __init__(self, path: str, format: str = "jsonl", service_name: str = "chatbot-crag"):
+        if format not in ("jsonl", "otlp"):
+            raise ValueError(f"Unknown trace format: {format}")
+        self.path = path
+        self.format = format
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        if self.format == "otlp":
+            lines = [json.dumps(self._to_otlp(spans), ensure_ascii=False)]
+        else:
+            lines = [json.dumps(span.to_dict(), ensure_ascii=False, default=str) for span in spans]
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def _to_otlp(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "chatbot-crag.tracing"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent.span_id if span.parent else "",
+                            "name": span.name,
+                            "kind": 1,  # SPAN_KIND_INTERNAL
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+                            "status": {"code": 2 if span.status == "error" else 1}
+                        }
+                        for span in spans
+                    ]
+                }]
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)}
+    return {"key": key, "value": typed}
+
+
+class Tracer:
+    """
+    exporter: ghi trace khi span gốc kết thúc.
+    listeners: gọi với từng span vừa kết thúc (ví dụ metrics latency theo stage), không cần exporter.
+    """
+
+    def __init__(self, exporter: Optional[JsonlExporter] = None, enabled: bool = True, listeners: List[Callable] = None):
+        self.exporter = exporter
+        self.listeners: List[Callable] = list(listeners or [])
+        self._enabled = enabled
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and (self.exporter is not None or bool(self.listeners))
+
+    def add_listener(self, listener: Callable):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            current = _current_span.get()
+            parent = current if isinstance(current, Span) else None
+        return Span(self, name, parent, attributes)
+
+    def notify(self, span: Span):
+        for listener in tuple(self.listeners):
+            try:
+                listener(span)
+            except Exception as e:
+                print(f"[Tracing] ⚠️ Listener failed: {e}")
+
+    def export(self, spans: List[Span]):
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception as e:
+            print(f"[Tracing] ⚠️ Export failed: {e}")
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            # TRACING_ENABLED chỉ bật/tắt ghi file; listener (metrics) vẫn nhận span khi tắt
+            exporter = JsonlExporter(TRACE_EXPORT_PATH, TRACE_EXPORT_FORMAT) if TRACING_ENABLED else None
+            _tracer = Tracer(exporter)
+        return _tracer
+
+
+def configure_tracing(exporter: Optional[JsonlExporter] = None, enabled: bool = True) -> Tracer:
+    """Thay tracer mặc định (lấy từ config), ví dụ để benchmark ghi trace ra file riêng"""
+    global _tracer
+    with _tracer_lock:
+        listeners = _tracer.listeners if _tracer is not None else None
+        _tracer = Tracer(exporter, enabled=enabled, listeners=listeners)
+        return _tracer
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+@contextmanager
+def use_span(span):
+    """Đặt span làm span hiện tại (không tự end)"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Generator bị đóng ở context khác (ví dụ stream bị GC)
+            pass
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """with span("crag.search", top_k=4) as s: ... s.set(results=len(results))"""
+    s = get_tracer().start_span(name, **attributes)
+    with use_span(s):
+        try:
+            yield s
+        except BaseException as e:
+            s.record_error(e)
+            raise
+        finally:
+            s.end()
+
+
+def traced(name: str = None):
+    """Decorator tạo span cho cả hàm sync lẫn async"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    Giữ span hiện tại khi chạy fn ở thread khác (ThreadPoolExecutor / run_in_executor không copy contextvars).
+    Mỗi lần gọi chạy trong một bản copy riêng -> dùng được cho executor.map.
+    """
+    if not get_tracer().enabled:
+        return fn
+    captured = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return captured.copy().run(fn, *args, **kwargs)
+    return wrapper
@@ -3,6 +3,9 @@ load_dotenv()
 import sys
 from pathlib import Path
 import time
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 
 sys.path.append(str(Path(__file__).parent))
@@ -17,9 +20,37 @@ from config import (
     QDRANT_PATH, 
     TOP_K_INITIAL, 
     TOP_K_FINAL, 
-    RELEVANCE_THRESHOLD
+    RELEVANCE_THRESHOLD,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_PATH,
+    RETRIEVAL_MODE,
+    RRF_K,
+    STOPWORDS_FILE,
+    GRADER_BACKEND,
+    CROSS_ENCODER_MODEL,
+    GRADE_CACHE_SIZE,
+    GRADE_CACHE_TTL,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_TTL,
+    ASYNC_EXECUTOR_WORKERS,
+    SPECULATIVE_RETRIEVAL,
+    SPECULATIVE_EXPANSION,
+    SINGLE_FLIGHT_ENABLED,
+    SINGLE_FLIGHT_TIMEOUT,
+    METRICS_ENABLED,
+    METRICS_HOST,
+    METRICS_PORT
 )
 from security.security import SecurityManager
+from llm.client_factory import get_client_factory
+from cache.semantic_cache import SemanticCache
+from cache.single_flight import SingleFlight
+from cache.keys import normalize_query
+from cache.corpus_version import get_corpus_version
+from monitoring.tracing import get_tracer, traced, span, use_span, current_span, bind_context
+from monitoring.metrics import observe_span, record_cache, start_metrics_server
 
 
 class RAGPipeline:
@@ -36,6 +67,9 @@ class RAGPipeline:
         if self.verbose:
             print(f"🔧 Initializing Pipeline ({model_type})...")
 
+        # Một client Groq (pool keep-alive + giới hạn theo model) dùng chung cho mọi component
+        self.client_factory = get_client_factory()
+        
         # Khởi tạo Retriever với model đã load sẵn
         self.retriever = CRAGRetriever(
             qdrant_path=QDRANT_PATH,
@@ -43,7 +77,18 @@ class RAGPipeline:
             embedding_model=model_config["name"],
             relevance_threshold=RELEVANCE_THRESHOLD,
             # Truyền model vào
-            preloaded_model=preloaded_model
+            preloaded_model=preloaded_model,
+            query_cache_size=QUERY_CACHE_SIZE,
+            query_cache_path=QUERY_CACHE_PATH,
+            retrieval_mode=RETRIEVAL_MODE,
+            stopwords_path=STOPWORDS_FILE,
+            rrf_k=RRF_K,
+            grader=GRADER_BACKEND,
+            cross_encoder_model=CROSS_ENCODER_MODEL,
+            grade_cache_size=GRADE_CACHE_SIZE,
+            grade_cache_ttl=GRADE_CACHE_TTL,
+            speculative_expansion=SPECULATIVE_EXPANSION,
+            client_factory=self.client_factory
         )
         self.security = SecurityManager(
             max_length=500,
@@ -51,61 +96,408 @@ class RAGPipeline:
             window_seconds=60
         )
         
-        self.llm = GroqLLM()
-        self.decomposer = QueryDecomposer()
+        self.llm = GroqLLM(client_factory=self.client_factory)
+        self.decomposer = QueryDecomposer(client_factory=self.client_factory)
         self.multi_retriever = MultiQueryRetriever(self.retriever)
         
+        # Semantic cache đứng trước toàn bộ pipeline: câu hỏi diễn đạt lại được trả lời ngay
+        self.semantic_cache = SemanticCache(
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            max_entries=SEMANTIC_CACHE_SIZE,
+            ttl_seconds=SEMANTIC_CACHE_TTL
+        ) if SEMANTIC_CACHE_ENABLED else None
+        
+        # Câu hỏi giống hệt đang chạy -> chờ kết quả của lần chạy đó thay vì chạy lại toàn bộ pipeline
+        self.single_flight = SingleFlight(timeout=SINGLE_FLIGHT_TIMEOUT) if SINGLE_FLIGHT_ENABLED else None
+        
+        # Cập nhật từ nhiều thread (executor, request song song) -> có lock
+        self._speculation_lock = threading.Lock()
+        self._speculation_counts = {"launched": 0, "used": 0, "wasted": 0, "cancelled": 0}
+        
+        # Executor giới hạn cho phần blocking (embedding, Qdrant, BM25, cross-encoder) của run_async
+        self.executor = ThreadPoolExecutor(max_workers=ASYNC_EXECUTOR_WORKERS, thread_name_prefix="rag-io")
+        
+        # Latency theo stage lấy từ span của tracer; endpoint /metrics chạy một lần cho cả process
+        if METRICS_ENABLED:
+            get_tracer().add_listener(observe_span)
+            start_metrics_server(METRICS_PORT, METRICS_HOST)
+        
         if self.verbose:
             print("✅ Pipeline ready\n")
     
     def run(self, query: str, user_id: str = "default") -> Dict[str, Any]:
-        is_valid, error_msg = self.security.validate_and_limit(user_id, query)
-        if not is_valid:
-            return {
-                "error": error_msg,
-                "answer": f"❌ {error_msg}",
-                "sources": [],
-                "num_sources": 0
-            }
+        with span("pipeline.run") as root:
+            # Rate limit theo user áp dụng cho mọi request, kể cả request được gộp
+            error_result = self._validate(query, user_id)
+            if error_result:
+                result = error_result
+            elif not self.single_flight:
+                result = self._run(query)
+            else:
+                result, shared = self.single_flight.do(self._flight_key(query), lambda: self._run(query))
+                if shared:
+                    result = self._shared_result(result, query)
+            self._trace_result(root, result)
+            return result
+    
+    def _run(self, query: str) -> Dict[str, Any]:
+        early_result, state = self._prepare(query)
+        if early_result:
+            return early_result
+        
+        # Generation
+        generation_start = time.time()
+        generation_result = self._generate(query, state["sub_queries"], state["refined_chunks"])
+        generation_time = time.time() - generation_start
+        
+        return self._finalize(state, generation_result, generation_time)
+    
+    def run_stream(self, query: str, user_id: str = "default") -> Dict[str, Any]:
+        """
+        Như run() nhưng phần generation được stream: result["answer_stream"] yield từng token.
+        Khi stream kết thúc, result được cập nhật đầy đủ (answer, timing...) như kết quả của run().
+        Request trùng với một stream đang chạy thì chờ stream đó xong rồi nhận nguyên câu trả lời.
+        """
+        # Span gốc kéo dài đến khi stream kết thúc
+        root = get_tracer().start_span("pipeline.run_stream")
+        try:
+            with use_span(root):
+                result, streaming = self._run_stream(query, user_id, root)
+        except BaseException as e:
+            root.record_error(e)
+            root.end()
+            raise
+        if not streaming:
+            self._trace_result(root, result)
+            root.end()
+        return result
+    
+    def _run_stream(self, query: str, user_id: str, root) -> tuple:
+        """Trả về (result, streaming); streaming=False khi kết thúc sớm (lỗi, cache, gộp request)"""
+        error_result = self._validate(query, user_id)
+        if error_result:
+            return self._with_stream(error_result), False
+        
+        flight = None
+        if self.single_flight:
+            key = self._flight_key(query)
+            call, leader = self.single_flight.begin(key)
+            if leader:
+                flight = (key, call)
+            else:
+                done, shared = self.single_flight.wait(call)
+                if done:
+                    return self._with_stream(self._shared_result(shared, query)), False
+        
+        try:
+            early_result, state = self._prepare(query)
+            if early_result:
+                self._finish_flight(flight, early_result)
+                return self._with_stream(early_result), False
+            
+            generation_start = time.time()
+            generation_result = self._generate_stream(query, state["sub_queries"], state["refined_chunks"])
+        except BaseException as e:
+            self._finish_flight(flight, error=e)
+            raise
+        
+        result = {
+            "query": query,
+            "sub_queries": state["sub_queries"],
+            "answer": "",
+            "sources": generation_result["sources"],
+            "num_sources": generation_result["num_sources"],
+            "retrieved_chunks": len(state["refined_chunks"]),
+            "graded_stats": state["graded_stats"],
+            "model_type": self.model_type
+        }
+        
+        def answer_stream():
+            completed = False
+            try:
+                with use_span(root), span("pipeline.generate", stream=True):
+                    yield from generation_result["answer_stream"]
+                final_generation = {k: v for k, v in generation_result.items() if k != "answer_stream"}
+                result.update(self._finalize(state, final_generation, time.time() - generation_start))
+                completed = True
+            finally:
+                # Stream bị bỏ dở -> request đang chờ tự chạy lại
+                final = {k: v for k, v in result.items() if k != "answer_stream"} if completed else None
+                self._finish_flight(flight, final)
+                if final:
+                    self._trace_result(root, final)
+                else:
+                    root.set(aborted=True)
+                root.end()
+        
+        result["answer_stream"] = answer_stream()
+        return result, True
+    
+    def _prepare(self, query: str) -> tuple:
+        """
+        Semantic cache -> decomposition -> retrieval (request đã qua validate).
+        Trả về (early_result, None) nếu kết thúc sớm, ngược lại (None, state) cho bước generation.
+        """
         start_time = time.time()
         
         if self.verbose:
             print(f"🔎 Query: {query}\n")
         
-        # Query Decomposition
+        # Semantic cache lookup (vector câu hỏi cũng được query cache giữ lại cho retrieval)
+        query_vector = None
+        if self.semantic_cache:
+            with span("pipeline.embed_query"):
+                query_vector = self.retriever.embed_query(query)
+            cached = self._semantic_lookup(query, query_vector, start_time)
+            if cached:
+                return cached, None
+        
+        # Query Decomposition (retrieval câu gốc chạy song song nếu decomposer phải gọi LLM)
         decompose_start = time.time()
+        speculative = self._start_speculative_retrieval(query)
         sub_queries = self.decomposer.decompose(query)
         decompose_time = time.time() - decompose_start
         
         # Xử lý câu hỏi quá phức tạp
         if sub_queries == ["TOO_COMPLEX"]:
-            return {
-                "query": query,
-                "sub_queries": [],
-                "answer": "Xin lỗi, câu hỏi của bạn có quá nhiều ý. Để tôi có thể trả lời chính xác hơn, bạn vui lòng chia thành các câu hỏi nhỏ hơn nhé! 😊",
-                "sources": [],
-                "num_sources": 0,
-                "retrieved_chunks": 0,
-                "graded_stats": {},
-                "timing": {"decomposition": decompose_time, "retrieval": 0, "generation": 0, "total": decompose_time},
-                "model_type": self.model_type,
-                "too_complex": True
-            }
+            self._discard_speculative(speculative)
+            return self._too_complex_result(query, decompose_time), None
         
         # Retrieval
         retrieval_start = time.time()
-        refined_chunks, graded_stats = self._retrieve(sub_queries)
+        speculative_result = self._take_speculative(speculative, query, sub_queries)
+        if speculative_result:
+            refined_chunks, graded_stats = speculative_result
+        else:
+            refined_chunks, graded_stats = self._retrieve(sub_queries)
+        retrieval_time = time.time() - retrieval_start
+        
+        if self.verbose:
+            print(f"   ⏱️  Retrieval time: {retrieval_time:.3f}s\n")
+        
+        return None, {
+            "query": query,
+            "query_vector": query_vector,
+            "sub_queries": sub_queries,
+            "refined_chunks": refined_chunks,
+            "graded_stats": graded_stats,
+            "start_time": start_time,
+            "decompose_time": decompose_time,
+            "retrieval_time": retrieval_time
+        }
+    
+    async def run_async(self, query: str, user_id: str = "default") -> Dict[str, Any]:
+        """
+        Bản asyncio của run(): các lời gọi Groq dùng AsyncGroq, phần blocking chạy trong self.executor.
+        Một process có thể giữ nhiều câu hỏi cùng lúc (asyncio.gather nhiều run_async).
+        """
+        with span("pipeline.run", mode="async") as root:
+            error_result = self._validate(query, user_id)
+            if error_result:
+                result = error_result
+            elif not self.single_flight:
+                result = await self._run_async(query)
+            else:
+                result, shared = await self.single_flight.ado(self._flight_key(query), lambda: self._run_async(query))
+                if shared:
+                    result = self._shared_result(result, query)
+            self._trace_result(root, result)
+            return result
+    
+    async def _run_async(self, query: str) -> Dict[str, Any]:
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        
+        if self.verbose:
+            print(f"🔎 Query: {query}\n")
+        
+        query_vector = None
+        if self.semantic_cache:
+            with span("pipeline.embed_query"):
+                query_vector = await loop.run_in_executor(self.executor, self.retriever.embed_query, query)
+            cached = self._semantic_lookup(query, query_vector, start_time)
+            if cached:
+                return cached
+        
+        decompose_start = time.time()
+        speculative = self._start_speculative_retrieval(query, lambda: asyncio.create_task(self._aretrieve([query])))
+        sub_queries = await self.decomposer.adecompose(query)
+        decompose_time = time.time() - decompose_start
+        
+        if sub_queries == ["TOO_COMPLEX"]:
+            self._discard_speculative(speculative)
+            return self._too_complex_result(query, decompose_time)
+        
+        retrieval_start = time.time()
+        if speculative and sub_queries == [query]:
+            # Chờ Task xong (lỗi giữ trong Task) -> _take_speculative đọc .result() như Future
+            await asyncio.gather(speculative, return_exceptions=True)
+        speculative_result = self._take_speculative(speculative, query, sub_queries)
+        if speculative_result:
+            refined_chunks, graded_stats = speculative_result
+        else:
+            refined_chunks, graded_stats = await self._aretrieve(sub_queries)
         retrieval_time = time.time() - retrieval_start
         
         if self.verbose:
             print(f"   ⏱️  Retrieval time: {retrieval_time:.3f}s\n")
         
-        # Generation
         generation_start = time.time()
-        generation_result = self._generate(query, sub_queries, refined_chunks)
+        generation_result = await self._agenerate(query, sub_queries, refined_chunks)
         generation_time = time.time() - generation_start
         
-        total_time = time.time() - start_time
+        state = {
+            "query": query,
+            "query_vector": query_vector,
+            "sub_queries": sub_queries,
+            "refined_chunks": refined_chunks,
+            "graded_stats": graded_stats,
+            "start_time": start_time,
+            "decompose_time": decompose_time,
+            "retrieval_time": retrieval_time
+        }
+        return self._finalize(state, generation_result, generation_time)
+    
+    def _should_speculate(self, query: str) -> bool:
+        # Chỉ đoán trước khi decomposer sẽ gọi LLM (câu đơn thì decompose trả về ngay)
+        return SPECULATIVE_RETRIEVAL and self.decomposer.should_decompose(query)["should_decompose"]
+    
+    def _start_speculative_retrieval(self, query: str, launch=None):
+        """Retrieval câu gốc chạy trước trong executor (hoặc launch() trả về asyncio.Task ở bản async)"""
+        if not self._should_speculate(query):
+            return None
+        self._count_speculation("launched")
+        if launch:
+            return launch()
+        return self.executor.submit(bind_context(self._retrieve), [query])
+    
+    def _take_speculative(self, speculative, query: str, sub_queries: list):
+        """
+        Dùng kết quả retrieval đoán trước nếu decomposer giữ nguyên câu hỏi, ngược lại bỏ đi.
+        Dùng chung cho Future (sync) và asyncio.Task đã xong (async) -> thống kê giống nhau.
+        """
+        if speculative is None:
+            return None
+        if sub_queries != [query]:
+            self._discard_speculative(speculative)
+            return None
+        try:
+            result = speculative.result()
+            self._count_speculation("used")
+            print("[Pipeline] ⚡ Speculative retrieval reused (query kept whole)")
+            return result
+        except Exception as e:
+            self._count_speculation("wasted")
+            print(f"[Pipeline] ⚠️ Speculative retrieval failed ({e}), retrying")
+            return None
+    
+    def _discard_speculative(self, speculative):
+        if speculative is None:
+            return
+        # Future chưa chạy / asyncio.Task chưa xong thì hủy được ("cancelled");
+        # thread đang chạy / đã xong thì để chạy nốt và bỏ kết quả ("wasted")
+        cancelled = speculative.cancel()
+        self._count_speculation("cancelled" if cancelled else "wasted")
+        print("[Pipeline] 🗑️ Speculative retrieval discarded (query was split)")
+    
+    def _count_speculation(self, key: str):
+        with self._speculation_lock:
+            self._speculation_counts[key] += 1
+    
+    def speculation_stats(self) -> Dict[str, Any]:
+        """hit_rate = tỉ lệ retrieval đoán trước được dùng; waste_rate = tỉ lệ chạy rồi bị bỏ hoặc lỗi (không tính lần hủy kịp)"""
+        with self._speculation_lock:
+            counts = dict(self._speculation_counts)
+        launched = counts["launched"]
+        return {
+            **counts,
+            "hit_rate": counts["used"] / launched if launched else 0.0,
+            "waste_rate": counts["wasted"] / launched if launched else 0.0,
+            "cancel_rate": counts["cancelled"] / launched if launched else 0.0
+        }
+    
+    @staticmethod
+    def _trace_result(root, result: Dict[str, Any]):
+        root.set(
+            cache_hit=result.get("cache_hit", "none"),
+            coalesced=result.get("coalesced", False),
+            sub_queries=len(result.get("sub_queries") or []),
+            num_sources=result.get("num_sources", 0)
+        )
+        if "error" in result:
+            root.set(error=str(result["error"]))
+    
+    def _flight_key(self, query: str) -> tuple:
+        return (normalize_query(query), get_corpus_version())
+    
+    def _finish_flight(self, flight, result: Dict[str, Any] = None, error: BaseException = None):
+        if flight:
+            self.single_flight.finish(flight[0], flight[1], result, error)
+    
+    @staticmethod
+    def _shared_result(result: Dict[str, Any], query: str) -> Dict[str, Any]:
+        shared = dict(result)
+        shared["query"] = query
+        shared["coalesced"] = True
+        return shared
+    
+    @staticmethod
+    def _with_stream(result: Dict[str, Any]) -> Dict[str, Any]:
+        result["answer_stream"] = iter([result["answer"]])
+        return result
+    
+    def scheduler_stats(self) -> Dict[str, Any]:
+        """Độ sâu hàng đợi và thời gian chờ quota Groq theo độ ưu tiên"""
+        return self.client_factory.scheduler.stats()
+    
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """Số request được gộp vào một lần chạy đang diễn ra (single-flight)"""
+        return self.single_flight.stats() if self.single_flight else {}
+    
+    def _validate(self, query: str, user_id: str) -> Dict[str, Any]:
+        is_valid, error_msg = self.security.validate_and_limit(user_id, query)
+        if is_valid:
+            return None
+        return {
+            "error": error_msg,
+            "answer": f"❌ {error_msg}",
+            "sources": [],
+            "num_sources": 0
+        }
+    
+    def _too_complex_result(self, query: str, decompose_time: float) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "sub_queries": [],
+            "answer": "Xin lỗi, câu hỏi của bạn có quá nhiều ý. Để tôi có thể trả lời chính xác hơn, bạn vui lòng chia thành các câu hỏi nhỏ hơn nhé! 😊",
+            "sources": [],
+            "num_sources": 0,
+            "retrieved_chunks": 0,
+            "graded_stats": {},
+            "timing": {"decomposition": decompose_time, "retrieval": 0, "generation": 0, "total": decompose_time},
+            "model_type": self.model_type,
+            "too_complex": True
+        }
+    
+    def _finalize(self, state: Dict[str, Any], generation_result: Dict[str, Any], generation_time: float) -> Dict[str, Any]:
+        query = state["query"]
+        sub_queries = state["sub_queries"]
+        refined_chunks = state["refined_chunks"]
+        graded_stats = state["graded_stats"]
+        decompose_time = state["decompose_time"]
+        retrieval_time = state["retrieval_time"]
+        total_time = time.time() - state["start_time"]
+        
+        # Lỗi / stream bị gián đoạn -> không đưa vào semantic cache
+        if self.semantic_cache and "error" not in generation_result:
+            self.semantic_cache.store(query, state["query_vector"], {
+                "sub_queries": sub_queries,
+                "answer": generation_result["answer"],
+                "sources": generation_result["sources"],
+                "num_sources": generation_result["num_sources"],
+                "retrieved_chunks": len(refined_chunks),
+                "graded_stats": graded_stats
+            })
         
         if self.verbose:
             print(f"💬 Answer Generated")
@@ -116,7 +508,7 @@ class RAGPipeline:
             print(f"   - Retrieval: {retrieval_time:.3f}s")
             print(f"   - Generation: {generation_time:.3f}s")
         
-        return {
+        finalized = {
             "query": query,
             "sub_queries": sub_queries,
             "answer": generation_result["answer"],
@@ -132,7 +524,31 @@ class RAGPipeline:
             },
             "model_type": self.model_type
         }
+        for key in ("error", "interrupted"):
+            if key in generation_result:
+                finalized[key] = generation_result[key]
+        return finalized
+    
+    def _semantic_lookup(self, query: str, query_vector, start_time: float) -> Dict[str, Any]:
+        hit = self.semantic_cache.lookup(query_vector, query)
+        record_cache("semantic", bool(hit))
+        if not hit:
+            return None
+        
+        cached_result, similarity, cached_query = hit
+        print(f"[SemanticCache] 💾 Hit (sim={similarity:.3f}): '{query[:50]}' ≈ '{cached_query[:50]}'")
+        total_time = time.time() - start_time
+        return {
+            **cached_result,
+            "query": query,
+            "timing": {"decomposition": 0, "retrieval": 0, "generation": 0, "total": total_time},
+            "model_type": self.model_type,
+            "cache_hit": "semantic",
+            "cache_similarity": similarity,
+            "cached_query": cached_query
+        }
     
+    @traced("pipeline.retrieve")
     def _retrieve(self, sub_queries: list) -> tuple:       
         if len(sub_queries) == 1:
             # Single query retrieval
@@ -147,13 +563,7 @@ class RAGPipeline:
             
             refined_chunks = result["refined_chunks"]
             graded_stats = result["graded_stats"]
-            
-            if self.verbose:
-                print(f"\n📊 Grading Stats:")
-                print(f"   ✓ Correct: {graded_stats['correct']}")
-                print(f"   ⚠ Ambiguous: {graded_stats['ambiguous']}")
-                print(f"   ✗ Incorrect: {graded_stats['incorrect']}")
-                print(f"   → Retrieved: {len(refined_chunks)} chunks")
+            self._log_grading(graded_stats, refined_chunks)
         
         else:
             # Multi-query retrieval
@@ -167,8 +577,56 @@ class RAGPipeline:
         
         return refined_chunks, graded_stats
     
+    @traced("pipeline.retrieve")
+    async def _aretrieve(self, sub_queries: list) -> tuple:
+        if len(sub_queries) == 1:
+            if self.verbose:
+                print("🔍 Single-Query Retrieval (async)")
+            
+            result = await self.retriever.aretrieve(
+                sub_queries[0],
+                top_k_initial=TOP_K_INITIAL,
+                top_k_final=TOP_K_FINAL,
+                executor=self.executor
+            )
+            refined_chunks = result["refined_chunks"]
+            graded_stats = result["graded_stats"]
+            self._log_grading(graded_stats, refined_chunks)
+            return refined_chunks, graded_stats
+        
+        result = await self.multi_retriever.aretrieve_multi(
+            sub_queries,
+            top_k_per_query=3,
+            executor=self.executor
+        )
+        return result["merged_chunks"], result["stats"]
+    
+    def _log_grading(self, graded_stats: dict, refined_chunks: list):
+        if self.verbose:
+            print(f"\n📊 Grading Stats:")
+            print(f"   ✓ Correct: {graded_stats['correct']}")
+            print(f"   ⚠ Ambiguous: {graded_stats['ambiguous']}")
+            print(f"   ✗ Incorrect: {graded_stats['incorrect']}")
+            print(f"   → Retrieved: {len(refined_chunks)} chunks")
+        if graded_stats.get("grading_shed"):
+            print("   🚫 Grading shed (Groq quota): một số chunk chưa được chấm, tạm tính AMBIGUOUS")
+    
+    @traced("pipeline.generate")
     def _generate(self, query: str, sub_queries: list, chunks: list) -> dict:        
         if len(sub_queries) == 1:
             return self.llm.generate(query, chunks)
         else:
-            return self.llm.generate_multi_intent(query, sub_queries, chunks)
\ No newline at end of file
+            return self.llm.generate_multi_intent(query, sub_queries, chunks)
+    
+    def _generate_stream(self, query: str, sub_queries: list, chunks: list) -> dict:
+        if len(sub_queries) == 1:
+            return self.llm.generate_stream(query, chunks)
+        else:
+            return self.llm.generate_multi_intent_stream(query, sub_queries, chunks)
+    
+    @traced("pipeline.generate")
+    async def _agenerate(self, query: str, sub_queries: list, chunks: list) -> dict:
+        if len(sub_queries) == 1:
+            return await self.llm.agenerate(query, chunks)
+        else:
+            return await self.llm.agenerate_multi_intent(query, sub_queries, chunks)
@@ -0,0 +1,104 @@
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'Học phí' -> 'hoc phi' (để query không dấu vẫn match)"""
+    text = text.lower().replace("đ", "d")
+    text = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+
+class VietnameseTokenizer:
+    """
+    Tokenizer cho BM25: bỏ dấu, tách âm tiết, loại stopwords.
+    Sinh thêm bigram âm tiết vì từ tiếng Việt thường gồm 2 âm tiết ("hoc phi", "cong nghe").
+    """
+
+    def __init__(self, stopwords_path: str = None):
+        self.stopwords = set()
+        if stopwords_path and os.path.exists(stopwords_path):
+            with open(stopwords_path, "r", encoding="utf-8") as f:
+                self.stopwords = {fold_diacritics(line.strip()) for line in f if line.strip()}
+        else:
+            print(f"[BM25] ⚠️ Stopwords file not found: {stopwords_path}")
+
+    def tokenize(self, text: str) -> List[str]:
+        syllables = re.findall(r'\w+', fold_diacritics(text))
+        tokens = [s for s in syllables if s not in self.stopwords]
+
+        for first, second in zip(syllables, syllables[1:]):
+            bigram = f"{first} {second}"
+            if bigram in self.stopwords:
+                continue
+            if first in self.stopwords and second in self.stopwords:
+                continue
+            tokens.append(bigram)
+
+        return tokens
+
+
+class BM25Index:
+    """BM25 (Okapi) in-process trên nội dung chunk, dùng inverted index"""
+
+    def __init__(self, tokenizer: VietnameseTokenizer, k1: float = 1.5, b: float = 0.75):
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.idf: Dict[str, float] = {}
+        self.avg_doc_length = 0.0
+
+    def build(self, documents: List[Tuple[str, str]]):
+        """documents: list (doc_id, text)"""
+        self.doc_ids = []
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+
+        for doc_idx, (doc_id, text) in enumerate(documents):
+            tokens = self.tokenizer.tokenize(text)
+            self.doc_ids.append(doc_id)
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((doc_idx, tf))
+
+        num_docs = len(self.doc_ids)
+        self.avg_doc_length = sum(self.doc_lengths) / num_docs if num_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (num_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        if not self.doc_ids:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(self.tokenizer.tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_idx, tf in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_idx] / self.avg_doc_length
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        return [(self.doc_ids[doc_idx], score) for doc_idx, score in ranked]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Gộp nhiều danh sách xếp hạng: score = sum(1 / (k + rank))"""
+    fused: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
@@ -1,19 +1,32 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import numpy as np
+import asyncio
+from functools import partial
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from qdrant_client import QdrantClient
 from sentence_transformers import SentenceTransformer
-from groq import Groq
 import os
 import re
 import sys
+import threading
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 
+from config import CROSS_ENCODER_MODEL, CROSS_ENCODER_THRESHOLDS
 from .relevance_evaluator import RelevanceEvaluator 
 from .web_search_corrector import WebSearchCorrector
+from .vector_context import QueryVectorContext
+from .bm25_index import BM25Index, VietnameseTokenizer, reciprocal_rank_fusion
+from .cross_encoder_reranker import get_reranker
 from Advanced_Query.query_expander import QueryExpander
+from cache.keys import normalize_query
+from cache.query_cache import QueryEmbeddingCache
+from cache.corpus_version import get_corpus_version
+from cache.grade_cache import GradeCache
+from llm.client_factory import GroqClientFactory, get_client_factory
+from monitoring.tracing import traced, span, current_span, bind_context
+from monitoring.metrics import CRAG_ACTIONS, CRAG_RETRIEVALS, record_cache
 from qdrant_client.models import Filter, FieldCondition, MatchValue
 
 # Config: Boost score cho chunks có chunk_id chứa keywords đặc biệt
@@ -42,12 +55,50 @@ class CRAGRetriever:
         embedding_model: str = "google/embeddinggemma-300m",
         relevance_threshold: float = 0.6,
         min_correct_threshold: int = 2,
-        preloaded_model: SentenceTransformer = None
+        preloaded_model: SentenceTransformer = None,
+        query_cache_size: int = 2000,
+        query_cache_path: str = None,
+        retrieval_mode: str = "dense",
+        stopwords_path: str = None,
+        rrf_k: int = 60,
+        grader: str = "llm",
+        cross_encoder_model: str = CROSS_ENCODER_MODEL,
+        grade_cache_size: int = 5000,
+        grade_cache_ttl: float = 3600,
+        speculative_expansion: bool = False,
+        client_factory: GroqClientFactory = None
     ):
         self.collection_name = collection_name
         self.relevance_threshold = relevance_threshold
         self.min_correct_threshold = min_correct_threshold
         
+        # "dense" = chỉ vector search, "hybrid" = BM25 + dense gộp bằng RRF
+        if retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError(f"Unknown retrieval_mode: {retrieval_mode}")
+        self.retrieval_mode = retrieval_mode
+        self.stopwords_path = stopwords_path
+        self.rrf_k = rrf_k
+        self._bm25 = None
+        self._bm25_payloads = {}
+        self._bm25_version = None
+        self._bm25_lock = threading.Lock()
+        
+        # Grader: "llm" (Groq), "cross_encoder" (local), "cascade" (cross-encoder trước, ca khó mới gọi LLM)
+        if grader not in ("llm", "cross_encoder", "cascade"):
+            raise ValueError(f"Unknown grader: {grader}")
+        # Ngưỡng chưa hiệu chỉnh sẽ quyết định sai chunk giữ/bỏ -> không cho chọn
+        if grader != "llm" and cross_encoder_model not in CROSS_ENCODER_THRESHOLDS:
+            raise ValueError(
+                f"Grader '{grader}' needs calibrated thresholds for {cross_encoder_model} in CROSS_ENCODER_THRESHOLDS"
+            )
+        self.grader = grader
+        
+        # Speculative expansion: gọi LLM expansion song song với lần chấm đầu, bỏ kết quả nếu không cần
+        self.speculative_expansion = speculative_expansion
+        self._speculation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="crag-spec") if speculative_expansion else None
+        self._speculation_lock = threading.Lock()
+        self._speculation_counts = {"launched": 0, "used": 0, "wasted": 0, "cancelled": 0}
+        
         print(f"📦 Connecting to Qdrant: {qdrant_path}")
         self.client = QdrantClient(path=qdrant_path)
         
@@ -63,37 +114,78 @@ class CRAGRetriever:
                 # Thử load offline từ cache
                 self.model = SentenceTransformer(embedding_model, local_files_only=True)
         
-        # Initialize Components
+        # Cache vector câu hỏi (fingerprint theo model -> đổi model là cache tự vô hiệu)
+        self.query_cache = None
+        if query_cache_size > 0:
+            fingerprint = f"{embedding_model}:{self.model.get_sentence_embedding_dimension()}"
+            self.query_cache = QueryEmbeddingCache(
+                model_fingerprint=fingerprint,
+                max_entries=query_cache_size,
+                persist_path=query_cache_path
+            )
+        
+        # Initialize Components (GROQ_API_KEY chỉ bắt buộc với transport "live", factory tự kiểm tra)
         groq_api_key = os.getenv("GROQ_API_KEY")
-        if not groq_api_key:
-            raise ValueError("GROQ_API_KEY required for CRAG")
-        llm_client = Groq(api_key=groq_api_key)
-        self.evaluator = RelevanceEvaluator(llm_client)
+        client_factory = client_factory or get_client_factory(groq_api_key)
+        self.grade_cache = GradeCache(grade_cache_size, grade_cache_ttl) if grade_cache_size > 0 else None
+        self.evaluator = RelevanceEvaluator(
+            client_factory.client,
+            grade_cache=self.grade_cache,
+            async_llm_client=client_factory.async_client,
+            hedger=client_factory.hedger
+        )
         self.web_corrector = WebSearchCorrector()
+        self.reranker = get_reranker(cross_encoder_model) if grader != "llm" else None
         self.expander = QueryExpander(
-            groq_api_key=groq_api_key,
-            embedding_model=self.model  # Dùng chung model
+            embedding_model=self.model,  # Dùng chung model
+            client_factory=client_factory
         )
         
-        print("✅ True CRAG Retriever ready (Optimized Lazy Expansion mode)")
+        mode = "Speculative" if speculative_expansion else "Optimized Lazy"
+        print(f"✅ True CRAG Retriever ready ({mode} Expansion mode, retrieval: {retrieval_mode}, grader: {grader})")
     
     def embed_query(self, query: str) -> np.ndarray:
-        # Embed query with normalization
-        normalized_query = query.strip().lower()
-        
-        # Chuẩn hóa thời gian
-        time_replacements = {
-            "năm nay": "năm 2025",
-            "hiện nay": "năm 2025", 
-            "hiện tại": "năm 2025"
-        }
+        # Embed query with normalization (chuẩn hóa thời gian)
+        normalized_query = normalize_query(query)
+        
+        if self.query_cache is not None:
+            cached = self.query_cache.get(normalized_query)
+            record_cache("query_embedding", cached is not None)
+            if cached is not None:
+                return cached
+        
+        vector = self.model.encode(normalized_query, convert_to_numpy=True)
+        
+        if self.query_cache is not None:
+            self.query_cache.set(normalized_query, vector)
+        return vector
+    
+    def embed_queries(self, queries: List[str]) -> List[np.ndarray]:
+        """Embed nhiều query: lấy từ cache nếu có, phần còn lại encode trong MỘT batch"""
+        normalized = [normalize_query(q) for q in queries]
+        vectors = [
+            self.query_cache.get(nq) if self.query_cache is not None else None
+            for nq in normalized
+        ]
+        if self.query_cache is not None:
+            hits = sum(v is not None for v in vectors)
+            record_cache("query_embedding", True, hits)
+            record_cache("query_embedding", False, len(vectors) - hits)
         
-        for old, new in time_replacements.items():
-            pattern = rf'\b{re.escape(old)}\b'
-            normalized_query = re.sub(pattern, new, normalized_query, flags=re.IGNORECASE)
+        missing = sorted({nq for nq, v in zip(normalized, vectors) if v is None})
+        if missing:
+            encoded = dict(zip(missing, self.model.encode(missing, convert_to_numpy=True)))
+            if self.query_cache is not None:
+                for nq, vector in encoded.items():
+                    self.query_cache.set(nq, vector)
+            vectors = [v if v is not None else encoded[nq] for nq, v in zip(normalized, vectors)]
         
-        return self.model.encode(normalized_query, convert_to_numpy=True)
+        return vectors
     
+    def new_vector_context(self) -> QueryVectorContext:
+        return QueryVectorContext(self.embed_queries)
+    
+    @traced("qdrant.search")
     def semantic_search(self, query_vector: np.ndarray, top_k: int = 10) -> List[Dict]:
         #Semantic search in Qdrant
         results = self.client.search(
@@ -104,45 +196,165 @@ class CRAGRetriever:
             with_vectors=False
         )
         
-        candidates = []
-        for hit in results:
-            content = hit.payload.get("content", "")  
-            title = hit.payload.get("title")
-            if not title:
-                # Fallback 1: Lấy từ chunk_id
-                title = hit.payload.get("chunk_id", "").replace("-", " ").title()            
-            if not title:
-                title = "Tài liệu tuyển sinh"            
-            candidates.append({
-                "id": hit.id,
-                "score": hit.score,
-                "chunk_id": hit.payload.get("chunk_id"),
-                "content": content,
-                "full_content": hit.payload.get("full_content"),
-                "url": hit.payload.get("url"),
-                "type": hit.payload.get("type"),
-                "title": title,
-                "order": hit.payload.get("order"),
-                "source": "database"
-            })
-        
-        # Boost score cho chunks có chunk_id đặc biệt
+        candidates = [self._to_candidate(hit.id, hit.score, hit.payload) for hit in results]
         for candidate in candidates:
-            chunk_id = candidate.get("chunk_id", "").lower()
-            if any(kw in chunk_id for kw in BOOST_KEYWORDS):
-                candidate["score"] += BOOST_SCORE_AMOUNT
-                candidate["boosted"] = True
+            self._apply_boost(candidate)
         
         # Re-sort theo score mới
         candidates.sort(key=lambda x: x["score"], reverse=True)
         
         return candidates
     
+    def _apply_boost(self, candidate: Dict):
+        """Boost score cho chunks có chunk_id đặc biệt"""
+        chunk_id = (candidate.get("chunk_id") or "").lower()
+        if any(kw in chunk_id for kw in BOOST_KEYWORDS):
+            candidate["score"] += BOOST_SCORE_AMOUNT
+            candidate["boosted"] = True
+    
+    def _cosine_scores(self, query_vector: np.ndarray, point_ids: List) -> Dict[Any, float]:
+        """Cosine giữa query và các point (lấy vector từ Qdrant) cho chunk chỉ có trong kết quả BM25"""
+        if not point_ids:
+            return {}
+        records = self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=point_ids,
+            with_payload=False,
+            with_vectors=True
+        )
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = {}
+        for record in records:
+            vector = np.asarray(record.vector, dtype=np.float32)
+            scores[record.id] = float(vector @ query / (np.linalg.norm(vector) or 1.0))
+        return scores
+    
+    def _to_candidate(self, point_id, score: float, payload: Dict) -> Dict:
+        content = payload.get("content", "")  
+        title = payload.get("title")
+        if not title:
+            # Fallback 1: Lấy từ chunk_id
+            title = payload.get("chunk_id", "").replace("-", " ").title()            
+        if not title:
+            title = "Tài liệu tuyển sinh"            
+        return {
+            "id": point_id,
+            "score": score,
+            "chunk_id": payload.get("chunk_id"),
+            "content": content,
+            "full_content": payload.get("full_content"),
+            "url": payload.get("url"),
+            "type": payload.get("type"),
+            "title": title,
+            "order": payload.get("order"),
+            "source": "database"
+        }
+    
+    def _get_bm25(self) -> BM25Index:
+        """Build BM25 index từ Qdrant (lazy), tự build lại khi corpus version đổi"""
+        version = get_corpus_version()
+        with self._bm25_lock:
+            if self._bm25 is not None and self._bm25_version == version:
+                return self._bm25
+            
+            print("[CRAG] 🔧 Building BM25 index...")
+            documents = []
+            payloads = {}
+            next_offset = None
+            while True:
+                records, next_offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=256,
+                    offset=next_offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                for record in records:
+                    chunk_id = record.payload.get("chunk_id")
+                    if not chunk_id:
+                        continue
+                    text = f"{record.payload.get('title', '')}\n{record.payload.get('content', '')}"
+                    documents.append((chunk_id, text))
+                    payloads[chunk_id] = (record.id, record.payload)
+                if next_offset is None:
+                    break
+            
+            bm25 = BM25Index(VietnameseTokenizer(self.stopwords_path))
+            bm25.build(documents)
+            self._bm25, self._bm25_payloads, self._bm25_version = bm25, payloads, version
+            print(f"[CRAG] ✅ BM25 index ready ({len(bm25)} chunks)")
+            return bm25
+    
+    def lexical_search(self, query: str, top_k: int = 10) -> List[Dict]:
+        bm25 = self._get_bm25()
+        candidates = []
+        for chunk_id, score in bm25.search(query, top_k=top_k):
+            point_id, payload = self._bm25_payloads[chunk_id]
+            candidate = self._to_candidate(point_id, score, payload)
+            candidate["bm25_score"] = score
+            candidates.append(candidate)
+        return candidates
+    
+    def hybrid_search(self, query: str, query_vector: np.ndarray, top_k: int = 10) -> List[Dict]:
+        """
+        Dense + BM25, gộp bằng Reciprocal Rank Fusion.
+        Thứ tự theo RRF (rrf_score, chuẩn hóa về [0, 1]); "score" vẫn là cosine như semantic_search
+        để so sánh được ở các bước sau (HYBRID correction, multi-query dedup).
+        """
+        pool_size = top_k * 2
+        dense = self.semantic_search(query_vector, top_k=pool_size)
+        lexical = self.lexical_search(query, top_k=pool_size)
+        
+        by_id = {}
+        for cand in lexical + dense:  # dense ghi đè để giữ score cosine gốc
+            by_id[cand["chunk_id"]] = {**by_id.get(cand["chunk_id"], {}), **cand}
+        
+        fused = reciprocal_rank_fusion(
+            [[c["chunk_id"] for c in dense], [c["chunk_id"] for c in lexical]],
+            k=self.rrf_k
+        )
+        
+        # Chuẩn hóa RRF về [0, 1] (1.0 = hạng 1 ở cả hai danh sách)
+        max_rrf = 2.0 / (self.rrf_k + 1)
+        dense_ids = {c["chunk_id"] for c in dense}
+        candidates = []
+        for chunk_id, rrf_score in fused[:top_k]:
+            cand = by_id[chunk_id]
+            cand["rrf_score"] = rrf_score / max_rrf
+            candidates.append(cand)
+        
+        # Chunk chỉ có ở BM25 đang mang score BM25 -> thay bằng cosine thật
+        lexical_only = [c for c in candidates if c["chunk_id"] not in dense_ids]
+        cosine = self._cosine_scores(query_vector, [c["id"] for c in lexical_only])
+        for cand in lexical_only:
+            cand["score"] = cosine.get(cand["id"], 0.0)
+            self._apply_boost(cand)
+        return candidates
+    
+    @traced("crag.search")
+    def search(self, query: str, query_vector: np.ndarray, top_k: int = 10) -> List[Dict]:
+        current_span().set(mode=self.retrieval_mode, top_k=top_k)
+        if self.retrieval_mode == "hybrid":
+            try:
+                return self.hybrid_search(query, query_vector, top_k=top_k)
+            except Exception as e:
+                print(f"[CRAG] ⚠️ Hybrid search error ({e}), falling back to dense")
+        return self.semantic_search(query_vector, top_k=top_k)
+    
     def evaluate_relevance(self, query: str, candidates: List[Dict]) -> Dict[str, List[Dict]]:
-        print(f"[CRAG] Evaluating {len(candidates)} candidates...")
+        print(f"[CRAG] Evaluating {len(candidates)} candidates ({self.grader})...")
         
-        labels = self.evaluator.evaluate_batch(query, candidates)
+        labels = self.grade_labels(query, candidates)
+        return self._group_by_label(candidates, labels)
+    
+    async def aevaluate_relevance(self, query: str, candidates: List[Dict], executor=None) -> Dict[str, List[Dict]]:
+        print(f"[CRAG] Evaluating {len(candidates)} candidates ({self.grader}, async)...")
         
+        labels = await self.agrade_labels(query, candidates, executor)
+        return self._group_by_label(candidates, labels)
+    
+    def _group_by_label(self, candidates: List[Dict], labels: List[str]) -> Dict[str, List[Dict]]:
         graded = {
             "correct": [],
             "incorrect": [],
@@ -159,10 +371,118 @@ class CRAGRetriever:
         
         return graded
     
+    @traced("crag.grade")
+    def grade_labels(self, query: str, candidates: List[Dict]) -> List[str]:
+        """Nhãn CORRECT/AMBIGUOUS/INCORRECT cho từng candidate theo grader đã cấu hình"""
+        if not candidates:
+            return []
+        current_span().set(grader=self.grader, candidates=len(candidates))
+        
+        if self.grader == "llm":
+            return self.evaluator.evaluate_batch(query, candidates)
+        
+        labels = self.reranker.label_documents(query, candidates)
+        if self.grader == "cross_encoder":
+            return labels
+        
+        borderline = self._cascade_split(labels)
+        if borderline:
+            llm_labels = self.evaluator.evaluate_batch(query, [candidates[i] for i in borderline])
+            self._cascade_merge(labels, borderline, llm_labels)
+        return labels
+    
+    @traced("crag.grade")
+    async def agrade_labels(self, query: str, candidates: List[Dict], executor=None) -> List[str]:
+        """Bản async của grade_labels: LLM qua AsyncGroq, cross-encoder chạy trong executor"""
+        if not candidates:
+            return []
+        current_span().set(grader=self.grader, candidates=len(candidates))
+        
+        if self.grader == "llm":
+            return await self.evaluator.aevaluate_batch(query, candidates)
+        
+        loop = asyncio.get_running_loop()
+        labels = await loop.run_in_executor(executor, bind_context(self.reranker.label_documents), query, candidates)
+        if self.grader == "cross_encoder":
+            return labels
+        
+        borderline = self._cascade_split(labels)
+        if borderline:
+            llm_labels = await self.evaluator.aevaluate_batch(query, [candidates[i] for i in borderline])
+            self._cascade_merge(labels, borderline, llm_labels)
+        return labels
+    
+    @traced("crag.grade_pairs")
+    def grade_pairs(self, pairs: List[Tuple[str, Dict]]) -> List[str]:
+        """Như grade_labels nhưng cho các cặp (query, candidate) của NHIỀU query: một lần gọi grader"""
+        if not pairs:
+            return []
+        current_span().set(grader=self.grader, candidates=len(pairs))
+        
+        if self.grader == "llm":
+            return self.evaluator.evaluate_pairs(pairs)
+        
+        labels = self.reranker.label_pairs(pairs)
+        if self.grader == "cross_encoder":
+            return labels
+        
+        borderline = self._cascade_split(labels)
+        if borderline:
+            llm_labels = self.evaluator.evaluate_pairs([pairs[i] for i in borderline])
+            self._cascade_merge(labels, borderline, llm_labels)
+        return labels
+    
+    @traced("crag.grade_pairs")
+    async def agrade_pairs(self, pairs: List[Tuple[str, Dict]], executor=None) -> List[str]:
+        if not pairs:
+            return []
+        current_span().set(grader=self.grader, candidates=len(pairs))
+        
+        if self.grader == "llm":
+            return await self.evaluator.aevaluate_pairs(pairs)
+        
+        loop = asyncio.get_running_loop()
+        labels = await loop.run_in_executor(executor, bind_context(self.reranker.label_pairs), pairs)
+        if self.grader == "cross_encoder":
+            return labels
+        
+        borderline = self._cascade_split(labels)
+        if borderline:
+            llm_labels = await self.evaluator.aevaluate_pairs([pairs[i] for i in borderline])
+            self._cascade_merge(labels, borderline, llm_labels)
+        return labels
+    
+    def _cascade_split(self, labels: List[str]) -> List[int]:
+        """CASCADE: cross-encoder quyết các ca chắc chắn; trả về vị trí ca AMBIGUOUS (vùng giữa 2 ngưỡng) cần gửi LLM"""
+        borderline = [i for i, label in enumerate(labels) if label == "AMBIGUOUS"]
+        if borderline:
+            print(f"[CRAG] Cascade: {len(labels) - len(borderline)} decided locally, {len(borderline)} sent to LLM")
+        else:
+            print(f"[CRAG] Cascade: all {len(labels)} decided locally")
+        return borderline
+    
+    def _cascade_merge(self, labels: List[str], borderline: List[int], llm_labels: List[str]):
+        """Ghi label của LLM đè lên các vị trí borderline (tại chỗ)"""
+        for i, label in zip(borderline, llm_labels):
+            labels[i] = label
+    
     def needs_expansion(self, graded: Dict[str, List[Dict]]) -> bool:  #Quyết định có cần Query Expansion không
         correct_count = len(graded["correct"])
         return correct_count < self.min_correct_threshold
     
+    def _check_expansion(self, graded: Dict[str, List[Dict]]) -> bool:
+        """needs_expansion + log, dùng chung cho retrieve / aretrieve"""
+        if self.needs_expansion(graded):
+            print(f"\n[CRAG] ⚠️  Insufficient CORRECT chunks ({len(graded['correct'])} < {self.min_correct_threshold})")
+            print("[CRAG] 🔄 Triggering Query Expansion...")
+            return True
+        print(f"[CRAG] ✅ Sufficient CORRECT chunks ({len(graded['correct'])}), no expansion needed")
+        return False
+    
+    @staticmethod
+    def _merge_graded(graded: Dict[str, List[Dict]], expansion_graded: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+        return {label: graded[label] + expansion_graded[label] for label in graded}
+    
     def decide_action(self, graded: Dict[str, List[Dict]]) -> str:
         correct_count = len(graded["correct"])
         ambiguous_count = len(graded["ambiguous"])
@@ -175,6 +495,7 @@ class CRAGRetriever:
         
         return "HYBRID"
     
+    @traced("crag.correction")
     def apply_correction(
         self, 
         query: str,
@@ -182,6 +503,7 @@ class CRAGRetriever:
         action: str
     ) -> List[Dict]:
         print(f"[CRAG] Action: {action}")
+        current_span().set(action=action)
         
         if action == "WEB_SEARCH":
             web_results = self.web_corrector.search(query, max_results=3)
@@ -194,8 +516,7 @@ class CRAGRetriever:
             return refined
         
         else:  # HYBRID
-            internal = graded["correct"] + graded["ambiguous"]
-            internal = sorted(internal, key=lambda x: x["score"], reverse=True)[:3]
+            internal = self._hybrid_internal(graded)
             
             web_results = self.web_corrector.search(query, max_results=2)
             
@@ -203,103 +524,468 @@ class CRAGRetriever:
             print(f"[CRAG] Hybrid: {len(internal)} internal + {len(web_results)} web")
             return combined
     
+    def _hybrid_internal(self, graded: Dict[str, List[Dict]]) -> List[Dict]:
+        """Phần tài liệu nội bộ của action HYBRID: CORRECT + AMBIGUOUS, lấy 3 chunk điểm cao nhất"""
+        internal = graded["correct"] + graded["ambiguous"]
+        return sorted(internal, key=lambda x: x["score"], reverse=True)[:3]
+    
+    @traced("crag.correction")
+    async def aapply_correction(
+        self, 
+        query: str,
+        graded: Dict[str, List[Dict]],
+        action: str,
+        executor=None
+    ) -> List[Dict]:
+        print(f"[CRAG] Action: {action}")
+        current_span().set(action=action)
+        
+        if action == "WEB_SEARCH":
+            web_results = await self.web_corrector.asearch(query, max_results=3, executor=executor)
+            print(f"[CRAG] Using {len(web_results)} web search results")
+            return web_results
+        
+        elif action == "KNOWLEDGE_REFINEMENT":
+            refined = graded["correct"][:5]
+            print(f"[CRAG] Using {len(refined)} correct documents")
+            return refined
+        
+        else:  # HYBRID
+            internal = self._hybrid_internal(graded)
+            
+            web_results = await self.web_corrector.asearch(query, max_results=2, executor=executor)
+            
+            combined = internal + web_results
+            print(f"[CRAG] Hybrid: {len(internal)} internal + {len(web_results)} web")
+            return combined
+    
+    @traced("crag.retrieve")
     def retrieve(
         self, 
         query: str, 
         top_k_initial: int = 4,
-        top_k_final: int = 2
+        top_k_final: int = 2,
+        vector_context: QueryVectorContext = None
     ) -> Dict[str, Any]:
+        # Vector dùng chung cho cả request: mỗi chuỗi chỉ embed một lần
+        vector_context = vector_context or self.new_vector_context()
 
         # INITIAL RETRIEVAL 
         print("[CRAG] Phase 1: Initial retrieval...")        
-        query_vector = self.embed_query(query)
-        initial_candidates = self.semantic_search(query_vector, top_k=top_k_initial)
+        with span("crag.embed"):
+            query_vector = vector_context.get(query)
+        initial_candidates = self.search(query, query_vector, top_k=top_k_initial)
         
         if len(initial_candidates) == 0:
             print("[CRAG] No candidates found")
-            return {
-                "query": query,
-                "refined_chunks": [],
-                "graded_stats": {"correct": 0, "incorrect": 0, "ambiguous": 0},
-                "action_taken": "NONE",
-                "expansion_triggered": False
-            }        
+            return self._empty_result(query)
+        initial_ids = set(c["chunk_id"] for c in initial_candidates)
+        
+        # SPECULATIVE: expansion + search chạy song song với lần chấm đầu
+        speculative = None
+        if self.speculative_expansion:
+            self._count_speculation("launched")
+            speculative = self._speculation_executor.submit(
+                bind_context(self._expand_and_search), query, top_k_initial, vector_context, initial_ids
+            )
+        
         # EVALUATE INITIAL RESULTS 
         graded = self.evaluate_relevance(query, initial_candidates)
         
         # OPTIMIZED LAZY EXPANSION
-        expansion_triggered = False
+        expansion_triggered = self._check_expansion(graded)
         
-        if self.needs_expansion(graded):
-            print(f"\n[CRAG] ⚠️  Insufficient CORRECT chunks ({len(graded['correct'])} < {self.min_correct_threshold})")
-            print("[CRAG] 🔄 Triggering Query Expansion...")
+        if expansion_triggered:
+            expansion_candidates = None
+            if speculative is not None:
+                try:
+                    expansion_candidates = speculative.result()
+                    self._count_speculation("used")
+                    print("[CRAG] ⚡ Speculative expansion used")
+                except Exception as e:
+                    print(f"[CRAG] ⚠️ Speculative expansion failed ({e}), expanding again")
+            if expansion_candidates is None:
+                expansion_candidates = self._expand_and_search(query, top_k_initial, vector_context, initial_ids)
             
-            expansion_triggered = True
-            
-            # Chỉ lấy variations
-            expanded_queries = self.expander.expand(
-                query, 
-                num_variations=2,
-                include_original=False 
-            )            
-            # Track chunks đã có để tránh duplicate
-            expansion_candidates = []
-            seen_ids = set(c["chunk_id"] for c in initial_candidates)
-            
-            # Embed và search song song cho các expanded queries
-            def search_expanded_query(exp_q: str) -> List[Dict]:
-                """Thread-safe function để xử lý một expanded query"""
-                exp_vector = self.embed_query(exp_q)
-                return self.semantic_search(exp_vector, top_k=top_k_initial)
-            
-            print(f"[CRAG] 🚀 Parallel expansion with {len(expanded_queries)} queries...")
-            with ThreadPoolExecutor(max_workers=max(1, min(len(expanded_queries), 3))) as executor:           
-                future_to_query = {
-                    executor.submit(search_expanded_query, eq): eq 
-                    for eq in expanded_queries
-                }               
-                for future in as_completed(future_to_query):
-                    exp_q = future_to_query[future]
-                    try:
-                        exp_results = future.result()
-                        print(f"[CRAG]    ✓ Expanded: {exp_q[:50]}... ({len(exp_results)} results)")                        
-                        # Only add new chunks
-                        for cand in exp_results:
-                            cand_id = cand.get("chunk_id")
-                            if cand_id and cand_id not in seen_ids:
-                                seen_ids.add(cand_id)
-                                expansion_candidates.append(cand)
-                    except Exception as e:
-                        print(f"[CRAG]    ✗ Expansion error for '{exp_q[:30]}...': {e}")
-            
-            print(f"[CRAG] Found {len(expansion_candidates)} new chunks via parallel expansion")            
-            
-            all_candidates = initial_candidates + expansion_candidates
-            graded = self.evaluate_relevance(query, all_candidates)
+            # Chỉ chấm chunk MỚI từ expansion, giữ nguyên kết quả chấm của initial candidates
+            if expansion_candidates:
+                graded = self._merge_graded(graded, self.evaluate_relevance(query, expansion_candidates))
         
         else:
-            print(f"[CRAG] ✅ Sufficient CORRECT chunks ({len(graded['correct'])}), no expansion needed")
+            self._discard_speculation(speculative)
         
         # DECIDE ACTION & REFINE 
         action = self.decide_action(graded)
-        refined_chunks = self.apply_correction(query, graded, action)
-        refined_chunks = refined_chunks[:top_k_final]
+        corrected = self.apply_correction(query, graded, action)
+        
+        current_span().set(action=action, expansion_triggered=expansion_triggered)
+        return self._finish_retrieval(query, graded, action, corrected, top_k_final, expansion_triggered)
+    
+    @traced("crag.retrieve_batch")
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        top_k_initial: int = 4,
+        top_k_final: int = 2
+    ) -> List[Dict[str, Any]]:
+        """
+        CRAG cho nhiều query cùng lúc (sub-queries): embed một batch, search song song,
+        chấm tất cả cặp (query, candidate) trong một lần gọi grader, rồi tách kết quả theo từng query.
+        """
+        vector_context = self.new_vector_context()
+        with span("crag.embed", texts=len(queries)):
+            vectors = vector_context.get_many(queries)
+        
+        print(f"[CRAG] Batch retrieval for {len(queries)} queries...")
+        with ThreadPoolExecutor(max_workers=max(1, min(len(queries), 4))) as executor:
+            candidate_lists = list(executor.map(
+                bind_context(lambda qv: self.search(qv[0], qv[1], top_k=top_k_initial)), zip(queries, vectors)
+            ))
+        
+        graded_list = self._split_graded(
+            candidate_lists, self.grade_pairs(self._batch_pairs(queries, candidate_lists))
+        )
+        
+        # Expansion cho các query chưa đủ CORRECT: expand song song, chấm chung một batch
+        needs = [i for i, cands in enumerate(candidate_lists) if cands and self.needs_expansion(graded_list[i])]
+        if needs:
+            print(f"[CRAG] 🔄 Expansion for {len(needs)}/{len(queries)} queries")
+            with ThreadPoolExecutor(max_workers=len(needs)) as executor:
+                futures = [
+                    executor.submit(
+                        bind_context(self._expand_and_search), queries[i], top_k_initial, vector_context,
+                        {c["chunk_id"] for c in candidate_lists[i]}
+                    )
+                    for i in needs
+                ]
+                expansion_lists = [f.result() for f in futures]
+            self._merge_expansion_grades(
+                graded_list, needs, expansion_lists,
+                self.grade_pairs(self._batch_pairs([queries[i] for i in needs], expansion_lists))
+            )
+        
+        results = []
+        for i, query in enumerate(queries):
+            if not candidate_lists[i]:
+                results.append(self._empty_result(query))
+                continue
+            action = self.decide_action(graded_list[i])
+            corrected = self.apply_correction(query, graded_list[i], action)
+            results.append(self._finish_retrieval(query, graded_list[i], action, corrected, top_k_final, i in needs))
+        current_span().set(actions=[r["action_taken"] for r in results], expanded=len(needs))
+        return results
+    
+    @traced("crag.retrieve_batch")
+    async def aretrieve_batch(
+        self,
+        queries: List[str],
+        top_k_initial: int = 4,
+        top_k_final: int = 2,
+        executor=None
+    ) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        vector_context = self.new_vector_context()
+        with span("crag.embed", texts=len(queries)):
+            vectors = await loop.run_in_executor(executor, vector_context.get_many, queries)
+        
+        print(f"[CRAG] Batch retrieval for {len(queries)} queries (async)...")
+        candidate_lists = await asyncio.gather(*[
+            loop.run_in_executor(executor, bind_context(partial(self.search, q, v, top_k=top_k_initial)))
+            for q, v in zip(queries, vectors)
+        ])
+        
+        graded_list = self._split_graded(
+            candidate_lists, await self.agrade_pairs(self._batch_pairs(queries, candidate_lists), executor)
+        )
+        
+        needs = [i for i, cands in enumerate(candidate_lists) if cands and self.needs_expansion(graded_list[i])]
+        if needs:
+            print(f"[CRAG] 🔄 Expansion for {len(needs)}/{len(queries)} queries")
+            expansion_lists = await asyncio.gather(*[
+                self._aexpand_and_search(
+                    queries[i], top_k_initial, vector_context,
+                    {c["chunk_id"] for c in candidate_lists[i]}, executor
+                )
+                for i in needs
+            ])
+            self._merge_expansion_grades(
+                graded_list, needs, expansion_lists,
+                await self.agrade_pairs(self._batch_pairs([queries[i] for i in needs], expansion_lists), executor)
+            )
         
+        async def finish(i: int, query: str) -> Dict[str, Any]:
+            if not candidate_lists[i]:
+                return self._empty_result(query)
+            action = self.decide_action(graded_list[i])
+            corrected = await self.aapply_correction(query, graded_list[i], action, executor)
+            return await loop.run_in_executor(
+                executor, bind_context(self._finish_retrieval),
+                query, graded_list[i], action, corrected, top_k_final, i in needs
+            )
+        
+        results = list(await asyncio.gather(*[finish(i, q) for i, q in enumerate(queries)]))
+        current_span().set(actions=[r["action_taken"] for r in results], expanded=len(needs))
+        return results
+    
+    def _batch_pairs(self, queries: List[str], candidate_lists: List[List[Dict]]) -> List[Tuple[str, Dict]]:
+        pairs = [(query, cand) for query, cands in zip(queries, candidate_lists) for cand in cands]
+        print(f"[CRAG] Batch grading {len(pairs)} (query, candidate) pairs for {len(queries)} queries ({self.grader})...")
+        return pairs
+    
+    def _split_graded(self, candidate_lists: List[List[Dict]], labels: List[str]) -> List[Dict[str, List[Dict]]]:
+        """Tách label của batch phẳng về từng query (cùng thứ tự với _batch_pairs)"""
+        graded_list = []
+        pos = 0
+        for cands in candidate_lists:
+            graded = {"correct": [], "incorrect": [], "ambiguous": []}
+            for cand, label in zip(cands, labels[pos:pos + len(cands)]):
+                graded[label.lower()].append(cand)
+            pos += len(cands)
+            graded_list.append(graded)
+        return graded_list
+    
+    def _merge_expansion_grades(
+        self,
+        graded_list: List[Dict[str, List[Dict]]],
+        indices: List[int],
+        expansion_lists: List[List[Dict]],
+        labels: List[str]
+    ):
+        for i, expansion_graded in zip(indices, self._split_graded(expansion_lists, labels)):
+            graded_list[i] = self._merge_graded(graded_list[i], expansion_graded)
+    
+    @traced("crag.expand_and_search")
+    def _expand_and_search(
+        self,
+        query: str,
+        top_k: int,
+        vector_context: QueryVectorContext,
+        seen_ids: set
+    ) -> List[Dict]:
+        """Expansion (chỉ lấy variations) + search song song; trả về các chunk chưa có trong seen_ids"""
+        expanded_queries = self.expander.expand(
+            query, 
+            num_variations=2,
+            include_original=False,
+            vector_context=vector_context
+        )            
+        # Track chunks đã có để tránh duplicate
+        expansion_candidates = []
+        seen_ids = set(seen_ids)
+        
+        # Vector của variations đã có sẵn từ bước lọc (nếu chưa thì embed chung một batch)
+        expanded_vectors = vector_context.get_many(expanded_queries) if expanded_queries else []
+        
+        print(f"[CRAG] 🚀 Parallel expansion with {len(expanded_queries)} queries...")
+        with ThreadPoolExecutor(max_workers=max(1, min(len(expanded_queries), 3))) as executor:           
+            future_to_query = {
+                executor.submit(bind_context(self.search), eq, exp_vector, top_k): eq 
+                for eq, exp_vector in zip(expanded_queries, expanded_vectors)
+            }               
+            for future in as_completed(future_to_query):
+                exp_q = future_to_query[future]
+                try:
+                    self._add_expansion_results(exp_q, future.result(), seen_ids, expansion_candidates)
+                except Exception as e:
+                    print(f"[CRAG]    ✗ Expansion error for '{exp_q[:30]}...': {e}")
+        
+        print(f"[CRAG] Found {len(expansion_candidates)} new chunks via parallel expansion")            
+        return expansion_candidates
+    
+    @traced("crag.retrieve")
+    async def aretrieve(
+        self, 
+        query: str, 
+        top_k_initial: int = 4,
+        top_k_final: int = 2,
+        vector_context: QueryVectorContext = None,
+        executor=None
+    ) -> Dict[str, Any]:
+        """
+        Bản async của retrieve: gọi LLM (grading, expansion) qua AsyncGroq,
+        embedding / Qdrant / BM25 / cross-encoder chạy trong executor (giới hạn số thread).
+        """
+        loop = asyncio.get_running_loop()
+        vector_context = vector_context or self.new_vector_context()
+        
+        print("[CRAG] Phase 1: Initial retrieval (async)...")
+        with span("crag.embed"):
+            query_vector = await loop.run_in_executor(executor, vector_context.get, query)
+        initial_candidates = await loop.run_in_executor(
+            executor, bind_context(partial(self.search, query, query_vector, top_k=top_k_initial))
+        )
+        
+        if len(initial_candidates) == 0:
+            print("[CRAG] No candidates found")
+            return self._empty_result(query)
+        
+        initial_ids = set(c["chunk_id"] for c in initial_candidates)
+        
+        speculative = None
+        if self.speculative_expansion:
+            self._count_speculation("launched")
+            speculative = asyncio.create_task(
+                self._aexpand_and_search(query, top_k_initial, vector_context, initial_ids, executor)
+            )
+        
+        graded = await self.aevaluate_relevance(query, initial_candidates, executor)
+        
+        expansion_triggered = self._check_expansion(graded)
+        
+        if expansion_triggered:
+            expansion_candidates = None
+            if speculative is not None:
+                try:
+                    expansion_candidates = await speculative
+                    self._count_speculation("used")
+                    print("[CRAG] ⚡ Speculative expansion used")
+                except Exception as e:
+                    print(f"[CRAG] ⚠️ Speculative expansion failed ({e}), expanding again")
+            if expansion_candidates is None:
+                expansion_candidates = await self._aexpand_and_search(
+                    query, top_k_initial, vector_context, initial_ids, executor
+                )
+            
+            if expansion_candidates:
+                graded = self._merge_graded(graded, await self.aevaluate_relevance(query, expansion_candidates, executor))
+        
+        else:
+            self._discard_speculation(speculative)
+        
+        action = self.decide_action(graded)
+        corrected = await self.aapply_correction(query, graded, action, executor)
+        
+        current_span().set(action=action, expansion_triggered=expansion_triggered)
+        # Keyword fallback có thể đọc Qdrant -> chạy trong executor
+        return await loop.run_in_executor(
+            executor, bind_context(self._finish_retrieval),
+            query, graded, action, corrected, top_k_final, expansion_triggered
+        )
+    
+    @traced("crag.expand_and_search")
+    async def _aexpand_and_search(
+        self,
+        query: str,
+        top_k: int,
+        vector_context: QueryVectorContext,
+        seen_ids: set,
+        executor=None
+    ) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        expanded_queries = await self.expander.aexpand(
+            query,
+            num_variations=2,
+            include_original=False,
+            vector_context=vector_context,
+            executor=executor
+        )
+        expansion_candidates = []
+        seen_ids = set(seen_ids)
+        
+        print(f"[CRAG] 🚀 Parallel expansion with {len(expanded_queries)} queries...")
+        if expanded_queries:
+            expanded_vectors = await loop.run_in_executor(executor, vector_context.get_many, expanded_queries)
+            results = await asyncio.gather(*[
+                loop.run_in_executor(executor, bind_context(partial(self.search, eq, exp_vector, top_k=top_k)))
+                for eq, exp_vector in zip(expanded_queries, expanded_vectors)
+            ], return_exceptions=True)
+            
+            for exp_q, exp_results in zip(expanded_queries, results):
+                if isinstance(exp_results, Exception):
+                    print(f"[CRAG]    ✗ Expansion error for '{exp_q[:30]}...': {exp_results}")
+                else:
+                    self._add_expansion_results(exp_q, exp_results, seen_ids, expansion_candidates)
+        
+        print(f"[CRAG] Found {len(expansion_candidates)} new chunks via parallel expansion")
+        return expansion_candidates
+    
+    def _count_speculation(self, key: str):
+        with self._speculation_lock:
+            self._speculation_counts[key] += 1
+    
+    def _discard_speculation(self, speculative):
+        if speculative is None:
+            return
+        # Chưa chạy thì hủy được ("cancelled"); đang chạy / đã xong thì bỏ kết quả (1 lời gọi 8B bị lãng phí)
+        cancelled = speculative.cancel()
+        self._count_speculation("cancelled" if cancelled else "wasted")
+        print("[CRAG] 🗑️ Speculative expansion discarded (enough CORRECT chunks)")
+    
+    def speculation_stats(self) -> Dict[str, Any]:
+        """hit_rate = tỉ lệ expansion đoán trước được dùng; waste_rate = tỉ lệ expansion chạy xong rồi bị bỏ (không tính lần hủy kịp)"""
+        with self._speculation_lock:
+            counts = dict(self._speculation_counts)
+        launched = counts["launched"]
+        return {
+            **counts,
+            "hit_rate": counts["used"] / launched if launched else 0.0,
+            "waste_rate": counts["wasted"] / launched if launched else 0.0,
+            "cancel_rate": counts["cancelled"] / launched if launched else 0.0
+        }
+    
+    def _add_expansion_results(self, exp_q: str, exp_results: List[Dict], seen_ids: set, expansion_candidates: List[Dict]):
+        print(f"[CRAG]    ✓ Expanded: {exp_q[:50]}... ({len(exp_results)} results)")                        
+        # Only add new chunks
+        for cand in exp_results:
+            cand_id = cand.get("chunk_id")
+            if cand_id and cand_id not in seen_ids:
+                seen_ids.add(cand_id)
+                expansion_candidates.append(cand)
+    
+    def _finish_retrieval(
+        self,
+        query: str,
+        graded: Dict[str, List[Dict]],
+        action: str,
+        corrected: List[Dict],
+        top_k_final: int,
+        expansion_triggered: bool
+    ) -> Dict[str, Any]:
+        """Bước chung sau correction (sync / async / batch): cắt top_k_final, keyword fallback, đóng gói kết quả"""
+        refined_chunks = corrected[:top_k_final]
         # KEYWORD-BASED FALLBACK: Inject chunk đặc biệt nếu query chứa keywords
         refined_chunks = self._apply_keyword_fallback(query, refined_chunks)
-        
+        return self._build_result(query, refined_chunks, graded, action, expansion_triggered)
+    
+    def _empty_result(self, query: str) -> Dict[str, Any]:
+        CRAG_ACTIONS.inc(action="NONE")
+        return {
+            "query": query,
+            "refined_chunks": [],
+            "graded_stats": {"correct": 0, "incorrect": 0, "ambiguous": 0},
+            "action_taken": "NONE",
+            "expansion_triggered": False
+        }
+    
+    def _build_result(
+        self,
+        query: str,
+        refined_chunks: List[Dict],
+        graded: Dict[str, List[Dict]],
+        action: str,
+        expansion_triggered: bool
+    ) -> Dict[str, Any]:
+        CRAG_ACTIONS.inc(action=action)
+        CRAG_RETRIEVALS.inc(expansion="true" if expansion_triggered else "false")
         return {
             "query": query,
             "refined_chunks": refined_chunks,
-            "graded_stats": {
-                "correct": len(graded["correct"]),
-                "incorrect": len(graded["incorrect"]),
-                "ambiguous": len(graded["ambiguous"])
-            },
+            "graded_stats": self.graded_stats(graded),
             "action_taken": action,
             "expansion_triggered": expansion_triggered
         }
     
+    @staticmethod
+    def graded_stats(graded: Dict[str, List[Dict]]) -> Dict[str, Any]:
+        """Số chunk theo nhãn; grading_shed = có chunk bị AMBIGUOUS do scheduler từ chối chấm (hết quota)"""
+        return {
+            "correct": len(graded["correct"]),
+            "incorrect": len(graded["incorrect"]),
+            "ambiguous": len(graded["ambiguous"]),
+            "grading_shed": any(doc.get("grading_shed") for docs in graded.values() for doc in docs)
+        }
+    
+    @traced("crag.keyword_fallback")
     def _apply_keyword_fallback(self, query: str, refined_chunks: List[Dict]) -> List[Dict]:
         """Inject chunk đặc biệt nếu query chứa keywords và chunk chưa có trong kết quả"""
         query_lower = query.lower()
@@ -1,14 +1,23 @@
 from typing import List, Dict, Tuple
 from sentence_transformers import CrossEncoder
 import numpy as np
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import CROSS_ENCODER_MODEL, CROSS_ENCODER_THRESHOLDS
 
 
 class CrossEncoderReranker:    
     def __init__(
         self,
-        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
-        preloaded_model: CrossEncoder = None
+        model_name: str = CROSS_ENCODER_MODEL,
+        preloaded_model: CrossEncoder = None,
+        high_threshold: float = None,
+        low_threshold: float = None
     ):
+        self.model_name = model_name
         if preloaded_model:
             print("✅ Using preloaded Cross-Encoder model")
             self.model = preloaded_model
@@ -17,14 +26,20 @@ class CrossEncoderReranker:
             self.model = CrossEncoder(model_name)
             print("✅ Cross-Encoder ready")
         
-        self.high_threshold = 0.5 
-        self.low_threshold = 0.2  
+        # Ngưỡng theo model (config), tham số truyền vào được ưu tiên; model chưa hiệu chỉnh -> không gán nhãn
+        default_high, default_low = CROSS_ENCODER_THRESHOLDS.get(model_name, (None, None))
+        self.high_threshold = default_high if high_threshold is None else high_threshold
+        self.low_threshold = default_low if low_threshold is None else low_threshold
     
     def get_scores(self, query: str, documents: List[Dict]) -> List[float]:
-        if not documents:
+        return self.score_pairs([(query, doc) for doc in documents])
+    
+    def score_pairs(self, query_doc_pairs: List[Tuple[str, Dict]]) -> List[float]:
+        """Điểm cho các cặp (query, document) của nhiều query khác nhau trong một lần predict"""
+        if not query_doc_pairs:
             return []
         pairs = []
-        for doc in documents:
+        for query, doc in query_doc_pairs:
             content = doc.get("full_content") or doc.get("content", "")
             content = content[:1000] if len(content) > 1000 else content
             pairs.append([query, content])        
@@ -55,6 +70,35 @@ class CrossEncoderReranker:
         
         return sorted_docs
     
+    def score_to_label(self, score: float) -> str:
+        if self.high_threshold is None or self.low_threshold is None:
+            raise ValueError(f"No calibrated thresholds for {self.model_name} (CROSS_ENCODER_THRESHOLDS)")
+        if score >= self.high_threshold:
+            return "CORRECT"
+        if score >= self.low_threshold:
+            return "AMBIGUOUS"
+        return "INCORRECT"
+    
+    def label_documents(self, query: str, documents: List[Dict]) -> List[str]:
+        """Nhãn CORRECT/AMBIGUOUS/INCORRECT theo thứ tự documents (cùng format RelevanceEvaluator)"""
+        if not documents:
+            return []
+        
+        scores = self.get_scores(query, documents)
+        labels = []
+        for doc, score in zip(documents, scores):
+            doc["rerank_score"] = score
+            labels.append(self.score_to_label(score))
+        return labels
+    
+    def label_pairs(self, query_doc_pairs: List[Tuple[str, Dict]]) -> List[str]:
+        scores = self.score_pairs(query_doc_pairs)
+        labels = []
+        for (_, doc), score in zip(query_doc_pairs, scores):
+            doc["rerank_score"] = score
+            labels.append(self.score_to_label(score))
+        return labels
+    
     def grade_documents(
         self, 
         query: str, 
@@ -63,7 +107,7 @@ class CrossEncoderReranker:
         if not documents:
             return {"correct": [], "ambiguous": [], "incorrect": []}
         
-        scores = self.get_scores(query, documents)
+        labels = self.label_documents(query, documents)
         
         graded = {
             "correct": [],
@@ -71,15 +115,8 @@ class CrossEncoderReranker:
             "incorrect": []
         }
         
-        for doc, score in zip(documents, scores):
-            doc["rerank_score"] = score
-            
-            if score >= self.high_threshold:
-                graded["correct"].append(doc)
-            elif score >= self.low_threshold:
-                graded["ambiguous"].append(doc)
-            else:
-                graded["incorrect"].append(doc)
+        for doc, label in zip(documents, labels):
+            graded[label.lower()].append(doc)
         
         # Log kết quả
         print(f"[CrossEncoder] Grading results:")
@@ -90,12 +127,12 @@ class CrossEncoderReranker:
         return graded
 
 
-# Singleton để preload model
-_reranker_instance = None
-
-def get_reranker(model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2") -> CrossEncoderReranker:
+# Một instance cho mỗi model để preload (đổi model_name -> load model tương ứng)
+_reranker_instances: Dict[str, CrossEncoderReranker] = {}
+_reranker_lock = threading.Lock()
 
-    global _reranker_instance
-    if _reranker_instance is None:
-        _reranker_instance = CrossEncoderReranker(model_name=model_name)
-    return _reranker_instance
+def get_reranker(model_name: str = CROSS_ENCODER_MODEL) -> CrossEncoderReranker:
+    with _reranker_lock:
+        if model_name not in _reranker_instances:
+            _reranker_instances[model_name] = CrossEncoderReranker(model_name=model_name)
+        return _reranker_instances[model_name]
@@ -1,16 +1,19 @@
 from typing import List, Dict, Any
 from collections import defaultdict
+import asyncio
 import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 from retrieval.crag_retriever import CRAGRetriever
+from monitoring.tracing import traced
 
 class MultiQueryRetriever:
     def __init__(self, crag_retriever: CRAGRetriever):      
         self.retriever = crag_retriever
         print("✅ MultiQueryRetriever initialized")
     
+    @traced("multi_query.retrieve")
     def retrieve_multi(
         self, 
         sub_queries: List[str],
@@ -18,18 +21,37 @@ class MultiQueryRetriever:
     ) -> Dict[str, Any]:
         print(f"\n🔍 Multi-Query Retrieval for {len(sub_queries)} quer{'ies' if len(sub_queries) > 1 else 'y'}")
         
+        # Embed một batch, search song song, chấm tất cả (sub-query, candidate) trong một lần gọi
+        results = self.retriever.retrieve_batch(
+            sub_queries,
+            top_k_initial=4,
+            top_k_final=top_k_per_query
+        )
+        return self._build_result(sub_queries, results)
+    
+    @traced("multi_query.retrieve")
+    async def aretrieve_multi(
+        self, 
+        sub_queries: List[str],
+        top_k_per_query: int = 3,
+        executor=None
+    ) -> Dict[str, Any]:
+        """Bản async của retrieve_multi"""
+        print(f"\n🔍 Multi-Query Retrieval (async) for {len(sub_queries)} quer{'ies' if len(sub_queries) > 1 else 'y'}")
+        
+        results = await self.retriever.aretrieve_batch(
+            sub_queries,
+            top_k_initial=4,
+            top_k_final=top_k_per_query,
+            executor=executor
+        )
+        return self._build_result(sub_queries, results)
+    
+    def _build_result(self, sub_queries: List[str], results: List[Dict[str, Any]]) -> Dict[str, Any]:
         per_query_results = {}
         all_chunks = []
         
-        for i, sub_q in enumerate(sub_queries, 1):
-            print(f"   [{i}/{len(sub_queries)}] {sub_q}")
-            
-            result = self.retriever.retrieve(
-                sub_q,
-                top_k_initial=4,
-                top_k_final=top_k_per_query
-            )
-            
+        for i, (sub_q, result) in enumerate(zip(sub_queries, results), 1):
             chunks = result["refined_chunks"]
             per_query_results[sub_q] = chunks
 
@@ -37,7 +59,7 @@ class MultiQueryRetriever:
                 chunk["source_query"] = sub_q
             
             all_chunks.extend(chunks)
-            print(f"      → {len(chunks)} chunks")        
+            print(f"   [{i}/{len(sub_queries)}] {sub_q} → {len(chunks)} chunks")
 
         merged_chunks = self._merge_chunks(all_chunks)
         
@@ -51,7 +73,8 @@ class MultiQueryRetriever:
             "stats": {
                 "total_queries": len(sub_queries),
                 "total_retrieved": len(all_chunks),
-                "after_merge": len(merged_chunks)
+                "after_merge": len(merged_chunks),
+                "grading_shed": any(r["graded_stats"].get("grading_shed") for r in results)
             }
         }
     
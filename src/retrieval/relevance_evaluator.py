@@ -1,30 +1,267 @@
 # [File: src/retrieval/relevance_evaluator.py]
-from typing import List, Dict
-from groq import Groq
+from typing import List, Dict, Optional, Tuple
 import json
 import re
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import FAST_LLM_MODEL
+from cache.grade_cache import GradeCache
+from llm.hedging import Hedger
+from llm.scheduler import PRIORITY_GRADING, QuotaExceeded
+from monitoring.tracing import traced, current_span
+from monitoring.metrics import GRADING_SHED, record_cache
 
 
 class RelevanceEvaluator:    
-    def __init__(self, llm_client: Groq):
+    def __init__(self, llm_client, grade_cache: GradeCache = None, async_llm_client=None, hedger: Hedger = None):
         self.llm = llm_client
-        self.model_name = "llama-3.1-8b-instant"
+        self.async_llm = async_llm_client
+        self.model_name = FAST_LLM_MODEL
+        # Chỉ có một model 8B -> hedge bằng một request trùng lặp tới chính model đó
+        self.hedger = hedger or Hedger(enabled=False)
         # Ngưỡng tin cậy, nếu dưới mức này sẽ bị đánh tụt hạng
         self.confidence_threshold = 0.7 
+        self.grade_cache = grade_cache
     
+    @traced("evaluator.grade")
     def evaluate_batch(self, query: str, documents: List[Dict]) -> List[str]:
         """
-        Đánh giá độ liên quan kèm độ tin cậy
+        Đánh giá độ liên quan kèm độ tin cậy.
+        Cặp (query, chunk) đã chấm lấy từ cache; chỉ gửi phần chưa có cho LLM trong một batch.
         """
         if not documents:
-            return []        
+            return []
+        
+        labels, uncached = self._lookup_cached(query, documents)
+        if uncached:
+            docs_to_grade = [documents[i] for i in uncached]
+            results = self._grade_with_llm(query, docs_to_grade)
+            self._store_grades(query, docs_to_grade, uncached, results, labels)
+        
+        return labels
+    
+    @traced("evaluator.grade")
+    async def aevaluate_batch(self, query: str, documents: List[Dict]) -> List[str]:
+        """Bản async của evaluate_batch (AsyncGroq)"""
+        if not documents:
+            return []
+        
+        labels, uncached = self._lookup_cached(query, documents)
+        if uncached:
+            docs_to_grade = [documents[i] for i in uncached]
+            results = await self._agrade_with_llm(query, docs_to_grade)
+            self._store_grades(query, docs_to_grade, uncached, results, labels)
+        
+        return labels
+    
+    @traced("evaluator.grade_pairs")
+    def evaluate_pairs(self, pairs: List[Tuple[str, Dict]]) -> List[str]:
+        """
+        Chấm nhiều cặp (query, document) thuộc các câu hỏi khác nhau trong MỘT lời gọi LLM
+        (dùng cho multi-query retrieval). Trả về label theo đúng thứ tự pairs.
+        """
+        if not pairs:
+            return []
+        
+        labels, uncached = self._lookup_cached_pairs(pairs)
+        if uncached:
+            pairs_to_grade = [pairs[i] for i in uncached]
+            results = self._grade_pairs_with_llm(pairs_to_grade)
+            self._store_pair_grades(pairs_to_grade, uncached, results, labels)
+        
+        return labels
+    
+    @traced("evaluator.grade_pairs")
+    async def aevaluate_pairs(self, pairs: List[Tuple[str, Dict]]) -> List[str]:
+        if not pairs:
+            return []
+        
+        labels, uncached = self._lookup_cached_pairs(pairs)
+        if uncached:
+            pairs_to_grade = [pairs[i] for i in uncached]
+            results = await self._agrade_pairs_with_llm(pairs_to_grade)
+            self._store_pair_grades(pairs_to_grade, uncached, results, labels)
+        
+        return labels
+    
+    def _lookup_cached(self, query: str, documents: List[Dict]) -> Tuple[List[Optional[str]], List[int]]:
+        return self._lookup_cached_pairs([(query, doc) for doc in documents])
+    
+    def _lookup_cached_pairs(self, pairs: List[Tuple[str, Dict]]) -> Tuple[List[Optional[str]], List[int]]:
+        labels: List[Optional[str]] = [None] * len(pairs)
+        uncached = []
+        for i, (query, doc) in enumerate(pairs):
+            cached = self.grade_cache.get(query, doc) if self.grade_cache else None
+            if cached:
+                labels[i] = cached[0]
+            else:
+                uncached.append(i)
+        
+        current_span().set(documents=len(pairs), cache_hits=len(pairs) - len(uncached))
+        if self.grade_cache:
+            record_cache("grade", True, len(pairs) - len(uncached))
+            record_cache("grade", False, len(uncached))
+        if len(uncached) < len(pairs):
+            print(f"[Evaluator] 💾 Grade cache: {len(pairs) - len(uncached)} hit, {len(uncached)} to grade")
+        return labels, uncached
+    
+    def _store_grades(
+        self,
+        query: str,
+        docs_to_grade: List[Dict],
+        indices: List[int],
+        results: Optional[List[Optional[Tuple[str, float]]]],
+        labels: List[Optional[str]]
+    ):
+        self._store_pair_grades([(query, doc) for doc in docs_to_grade], indices, results, labels)
+    
+    def _store_pair_grades(
+        self,
+        pairs: List[Tuple[str, Dict]],
+        indices: List[int],
+        results: Optional[List[Optional[Tuple[str, float]]]],
+        labels: List[Optional[str]]
+    ):
+        if results is None:  # Lỗi LLM -> AMBIGUOUS, không cache
+            results = [None] * len(pairs)
+        
+        for i, (query, doc), result in zip(indices, pairs, results):
+            if result is None:  # LLM thiếu / trả label lạ -> AMBIGUOUS cho lần này, không cache
+                labels[i] = "AMBIGUOUS"
+                continue
+            label, confidence = result
+            doc.pop("grading_shed", None)
+            if self.grade_cache:
+                self.grade_cache.set(query, doc, label, confidence)
+            labels[i] = label
+    
+    def _create(self, prompt: str, max_tokens: int):
+        return self.hedger.run(
+            lambda model: self.llm.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model,
+                temperature=0.1,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"},
+                priority=PRIORITY_GRADING
+            ),
+            self.model_name,
+            self.model_name
+        )
+    
+    async def _acreate(self, prompt: str, max_tokens: int):
+        return await self.hedger.arun(
+            lambda model: self.async_llm.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=model,
+                temperature=0.1,
+                max_tokens=max_tokens,
+                response_format={"type": "json_object"},
+                priority=PRIORITY_GRADING
+            ),
+            self.model_name,
+            self.model_name
+        )
+    
+    def _grade_with_llm(self, query: str, documents: List[Dict]) -> Optional[List[Optional[Tuple[str, float]]]]:
+        """Gọi LLM chấm một batch. Trả về [(label, confidence)] hoặc None nếu lỗi"""
+        try:
+            response = self._create(self._build_prompt(query, documents), max_tokens=300)
+            return self._parse_grades(response.choices[0].message.content, len(documents))
+        except QuotaExceeded as e:
+            return self._shed(documents, e)
+        except Exception as e:
+            print(f"[Evaluator] ❌ Error: {e}")
+            return None
+    
+    async def _agrade_with_llm(self, query: str, documents: List[Dict]) -> Optional[List[Optional[Tuple[str, float]]]]:
+        try:
+            response = await self._acreate(self._build_prompt(query, documents), max_tokens=300)
+            return self._parse_grades(response.choices[0].message.content, len(documents))
+        except QuotaExceeded as e:
+            return self._shed(documents, e)
+        except Exception as e:
+            print(f"[Evaluator] ❌ Error: {e}")
+            return None
+    
+    def _grade_pairs_with_llm(self, pairs: List[Tuple[str, Dict]]) -> Optional[List[Optional[Tuple[str, float]]]]:
+        # Chỉ có một câu hỏi -> dùng prompt thường (ngắn hơn)
+        if len({query for query, _ in pairs}) == 1:
+            return self._grade_with_llm(pairs[0][0], [doc for _, doc in pairs])
+        try:
+            response = self._create(self._build_pairs_prompt(pairs), max_tokens=max(300, 30 * len(pairs)))
+            return self._parse_grades(response.choices[0].message.content, len(pairs))
+        except QuotaExceeded as e:
+            return self._shed([doc for _, doc in pairs], e)
+        except Exception as e:
+            print(f"[Evaluator] ❌ Error: {e}")
+            return None
+    
+    async def _agrade_pairs_with_llm(self, pairs: List[Tuple[str, Dict]]) -> Optional[List[Optional[Tuple[str, float]]]]:
+        if len({query for query, _ in pairs}) == 1:
+            return await self._agrade_with_llm(pairs[0][0], [doc for _, doc in pairs])
+        try:
+            response = await self._acreate(self._build_pairs_prompt(pairs), max_tokens=max(300, 30 * len(pairs)))
+            return self._parse_grades(response.choices[0].message.content, len(pairs))
+        except QuotaExceeded as e:
+            return self._shed([doc for _, doc in pairs], e)
+        except Exception as e:
+            print(f"[Evaluator] ❌ Error: {e}")
+            return None
+    
+    def _shed(self, documents: List[Dict], error: QuotaExceeded) -> None:
+        """
+        Scheduler từ chối lượt chấm (hết quota) -> các chunk này thành AMBIGUOUS.
+        Đánh dấu chunk + đếm metric để graded_stats báo "grading_shed" thay vì xuống cấp âm thầm.
+        """
+        print(f"[Evaluator] 🚫 Grading shed (Groq quota): {error}")
+        GRADING_SHED.inc(len(documents))
+        current_span().set(grading_shed=True)
+        for doc in documents:
+            doc["grading_shed"] = True
+        return None
+    
+    def _build_pairs_prompt(self, pairs: List[Tuple[str, Dict]]) -> str:
+        items_text = ""
+        for i, (query, doc) in enumerate(pairs, 1):
+            content = self._extract_relevant_content(query, doc, max_length=500)
+            items_text += f"ITEM {i}:\nCÂU HỎI: \"{query}\"\nTÀI LIỆU:\n{content}\n---\n"
+        
+        return f"""Đánh giá độ liên quan của từng tài liệu với CÂU HỎI đi kèm trong cùng ITEM.
+
+TIÊU CHÍ PHÂN LOẠI:
+- CORRECT: Chứa thông tin trả lời trực tiếp, cụ thể.
+- INCORRECT: Không liên quan.
+- AMBIGUOUS: Liên quan nhưng chung chung/thiếu ý.
+
+YÊU CẦU OUTPUT:
+Trả về JSON object chứa danh sách "evaluations" theo ĐÚNG THỨ TỰ các ITEM ({len(pairs)} phần tử). Mỗi phần tử gồm:
+- "label": [CORRECT/INCORRECT/AMBIGUOUS]
+- "confidence": [0.0 đến 1.0] (Độ tự tin của bạn)
+
+INPUT:
+{items_text}
+
+JSON OUTPUT FORMAT (Mẫu):
+{{
+  "evaluations": [
+    {{"label": "CORRECT", "confidence": 0.95}},
+    {{"label": "AMBIGUOUS", "confidence": 0.4}}
+  ]
+}}
+
+CHỈ trả về JSON hợp lệ."""
+    
+    def _build_prompt(self, query: str, documents: List[Dict]) -> str:
         # 1. Chuẩn bị documents với Smart Extraction
         docs_text = ""
         for i, doc in enumerate(documents, 1):
             content = self._extract_relevant_content(query, doc, max_length=500)
             docs_text += f"DOC {i}:\n{content}\n---\n"        
         # 2. Prompt yêu cầu trả về Label + Confidence
-        prompt = f"""Đánh giá tài liệu dựa trên câu hỏi.
+        return f"""Đánh giá tài liệu dựa trên câu hỏi.
 
 CÂU HỎI: "{query}"
 
@@ -50,57 +287,49 @@ JSON OUTPUT FORMAT (Mẫu):
 }}
 
 CHỈ trả về JSON hợp lệ."""
-        
-        try:
-            response = self.llm.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model_name,
-                temperature=0.1,
-                max_tokens=300,
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content.strip()
-            data = json.loads(content)
-            
-            # Lấy danh sách evaluations
-            evals = data.get("evaluations", [])
-            
-            # Validate số lượng
-            if len(evals) != len(documents):
-                print(f"[Evaluator] ⚠️ Mismatch: {len(evals)} evals for {len(documents)} docs")
-                # Fill thiếu bằng default
-                default_eval = {"label": "AMBIGUOUS", "confidence": 0.0}
-                evals = evals[:len(documents)] + [default_eval] * (len(documents) - len(evals))
-            
-            # 3. Xử lý Logic Confidence Threshold
-            final_labels = []
-            
-            for item in evals:
-                raw_label = str(item.get("label", "AMBIGUOUS")).upper()
-                confidence = float(item.get("confidence", 0.5))
-                
-                label = "AMBIGUOUS"
-                if "CORRECT" in raw_label:
-                    label = "CORRECT"
-                elif "INCORRECT" in raw_label:
-                    label = "INCORRECT"
-                
-                
-                # Nếu CORRECT nhưng không tự tin (< 0.7) thì hạ xuống AMBIGUOUS
-                if label == "CORRECT" and confidence < self.confidence_threshold:
-                    print(f"[Eval] Downgraded CORRECT (conf={confidence:.2f}) to AMBIGUOUS")
-                    label = "AMBIGUOUS"              
-                
-                final_labels.append(label)
-            
-            # Thống kê để debug
-            print(f"[Batch Eval] ✅ Rated {len(final_labels)} docs (Threshold: {self.confidence_threshold})")
-            return final_labels
-            
-        except Exception as e:
-            print(f"[Evaluator] ❌ Error: {e}")
-            return ["AMBIGUOUS"] * len(documents)
+    
+    def _parse_grades(self, content: str, num_documents: int) -> List[Optional[Tuple[str, float]]]:
+        """
+        Trả về đúng num_documents phần tử: (label, confidence) hoặc None nếu LLM
+        không chấm tài liệu đó (thiếu phần tử / label không hợp lệ) -> caller không cache.
+        """
+        data = json.loads(content.strip())
+
+        # Lấy danh sách evaluations
+        evals = data.get("evaluations", [])
+
+        # Validate số lượng
+        if len(evals) != num_documents:
+            print(f"[Evaluator] ⚠️ Mismatch: {len(evals)} evals for {num_documents} docs")
+            # Phần thiếu = None (không phải grade thật)
+            evals = evals[:num_documents] + [None] * (num_documents - len(evals))
+
+        # 3. Xử lý Logic Confidence Threshold
+        final_results = []
+
+        for item in evals:
+            if not isinstance(item, dict):
+                final_results.append(None)
+                continue
+            # So khớp tuyệt đối: "INCORRECT" chứa chuỗi "CORRECT"
+            label = str(item.get("label", "")).strip().upper()
+            if label not in ("CORRECT", "INCORRECT", "AMBIGUOUS"):
+                print(f"[Evaluator] ⚠️ Unknown label: {item.get('label')!r}")
+                final_results.append(None)
+                continue
+            confidence = float(item.get("confidence", 0.5))
+
+            # Nếu CORRECT nhưng không tự tin (< 0.7) thì hạ xuống AMBIGUOUS
+            if label == "CORRECT" and confidence < self.confidence_threshold:
+                print(f"[Eval] Downgraded CORRECT (conf={confidence:.2f}) to AMBIGUOUS")
+                label = "AMBIGUOUS"              
+
+            final_results.append((label, confidence))
+
+        # Thống kê để debug
+        rated = sum(1 for result in final_results if result is not None)
+        print(f"[Batch Eval] ✅ Rated {rated}/{num_documents} docs (Threshold: {self.confidence_threshold})")
+        return final_results
     
     def _extract_relevant_content(self, query: str, document: Dict, max_length: int = 600) -> str:
         """
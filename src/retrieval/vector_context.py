@@ -0,0 +1,46 @@
+import threading
+from typing import Callable, Dict, List
+import numpy as np
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from cache.keys import normalize_query
+
+
+class QueryVectorContext:
+    """
+    Vector dùng chung trong phạm vi MỘT request (expansion, filtering, search).
+    Mỗi chuỗi (sau chuẩn hóa) chỉ được embed đúng một lần; các chuỗi còn thiếu
+    được embed chung trong một batch.
+    """
+
+    def __init__(self, embed_many: Callable[[List[str]], List[np.ndarray]]):
+        self._embed_many = embed_many
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> np.ndarray:
+        return self.get_many([text])[0]
+
+    def get_many(self, texts: List[str]) -> List[np.ndarray]:
+        keys = [normalize_query(t) for t in texts]
+
+        with self._lock:
+            missing = []
+            for key, text in zip(keys, texts):
+                if key not in self._vectors and key not in missing:
+                    missing.append(key)
+
+            if missing:
+                for key, vector in zip(missing, self._embed_many(missing)):
+                    self._vectors[key] = vector
+
+            return [self._vectors[key] for key in keys]
+
+    def put(self, text: str, vector: np.ndarray):
+        with self._lock:
+            self._vectors[normalize_query(text)] = vector
+
+    def __len__(self) -> int:
+        return len(self._vectors)
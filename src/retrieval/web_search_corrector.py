@@ -1,13 +1,22 @@
 from typing import List, Dict
 import os
+import sys
+import asyncio
+from functools import partial
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from monitoring.tracing import traced, current_span, bind_context
 
 class WebSearchCorrector:     
     def __init__(self):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         self.cse_id = os.getenv("GOOGLE_CSE_ID")
         self.enabled = bool(self.api_key and self.cse_id)
+    @traced("web_search")
     def search(self, query: str, max_results: int = 3) -> List[Dict]:
         print(f"[WebSearch] Searching: {query}")        
+        current_span().set(enabled=self.enabled)
         if not self.enabled:
             return []        
         try:
@@ -42,7 +51,15 @@ class WebSearchCorrector:
                 }
                 chunks.append(chunk)            
             print(f"[WebSearch] ✅ Found {len(chunks)} results")
+            current_span().set(results=len(chunks))
             return chunks            
         except Exception as e:
             print(f"[WebSearch] ❌ Error: {e}")
             return []    
+    async def asearch(self, query: str, max_results: int = 3, executor=None) -> List[Dict]:
+        # Google API client là blocking -> chạy trong executor
+        if not self.enabled:
+            return self.search(query, max_results)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, bind_context(partial(self.search, query, max_results)))
+
@@ -3,7 +3,12 @@ import time
 from collections import defaultdict, deque
 from typing import Tuple, Dict
 import os
+import sys
 import uuid
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from monitoring.metrics import SECURITY_REJECTIONS
 
 class SecurityManager:   
     def __init__(
@@ -52,19 +57,19 @@ class SecurityManager:
         """
         # 1. Length check
         if len(query) > self.max_length:
-            return False, f"Câu hỏi quá dài (tối đa {self.max_length} ký tự)"
+            return self._reject("too_long", f"Câu hỏi quá dài (tối đa {self.max_length} ký tự)")
         
         if len(query.strip()) < 3:
-            return False, "Câu hỏi quá ngắn"
+            return self._reject("too_short", "Câu hỏi quá ngắn")
         
         # 2. Prompt injection check
         for pattern in self.blacklist_patterns:
             if re.search(pattern, query, re.IGNORECASE):
-                return False, "Phát hiện nội dung không hợp lệ"
+                return self._reject("injection", "Phát hiện nội dung không hợp lệ")
         
         # 3. Spam check
         if re.search(r'(.)\1{10,}', query):
-            return False, "Phát hiện spam"
+            return self._reject("spam", "Phát hiện spam")
         
         # 4. Rate limiting
         current_time = time.time()
@@ -76,12 +81,16 @@ class SecurityManager:
             history.popleft()
         
         if len(history) >= self.max_requests:
-            return False, f"Vượt quá giới hạn {self.max_requests} câu hỏi/phút. Vui lòng chờ"
+            return self._reject("rate_limit", f"Vượt quá giới hạn {self.max_requests} câu hỏi/phút. Vui lòng chờ")
         
         # 5. Allow request
         history.append(current_time)
         return True, ""
     
+    def _reject(self, reason: str, message: str) -> Tuple[bool, str]:
+        SECURITY_REJECTIONS.inc(reason=reason)
+        return False, message
+    
     def get_remaining_requests(self, user_id: str) -> int:
         """Get remaining requests for user"""
         history = self.request_history[user_id]
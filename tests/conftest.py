@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Module trong src/ import lẫn nhau theo tên top-level (config, cache, llm, ...); script benchmark ở thư mục gốc
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "src"))
+# SDK chưa cài (CI, máy dev không có GPU) -> dùng bản stub trong tests/stubs để import được module;
+# đặt cuối sys.path nên package thật luôn được ưu tiên
+sys.path.append(str(Path(__file__).parent / "stubs"))
+
+from cache import corpus_version
+
+
+@pytest.fixture(autouse=True)
+def isolated_corpus_version(tmp_path, monkeypatch):
+    """Mỗi test một file corpus_version riêng, không đụng data/ thật"""
+    monkeypatch.setattr(corpus_version, "CORPUS_VERSION_FILE", str(tmp_path / "corpus_version"))
+    monkeypatch.setattr(corpus_version, "_cached_mtime", None)
+    monkeypatch.setattr(corpus_version, "_cached_version", "0")
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,5 @@
+"""Stub cho test: `python-dotenv` chưa được cài"""
+
+
+def load_dotenv(*args, **kwargs):
+    return False
@@ -0,0 +1,14 @@
+"""Stub cho test: `groq` chưa được cài"""
+
+
+class _Unavailable:
+    def __init__(self, *args, **kwargs):
+        raise ImportError("groq is not installed (tests/stubs)")
+
+
+class Groq(_Unavailable):
+    pass
+
+
+class AsyncGroq(_Unavailable):
+    pass
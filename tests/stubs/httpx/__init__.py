@@ -0,0 +1,21 @@
+"""Stub cho test: `httpx` chưa được cài (chỉ cấu hình timeout / pool, không có network)"""
+
+
+class Timeout:
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        self.kwargs = kwargs
+
+
+class Limits:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+
+class Client:
+    def __init__(self, *args, **kwargs):
+        raise ImportError("httpx is not installed (tests/stubs)")
+
+
+class AsyncClient(Client):
+    pass
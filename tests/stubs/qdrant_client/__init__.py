@@ -0,0 +1,6 @@
+"""Stub cho test: `qdrant-client` chưa được cài"""
+
+
+class QdrantClient:
+    def __init__(self, *args, **kwargs):
+        raise ImportError("qdrant-client is not installed (tests/stubs)")
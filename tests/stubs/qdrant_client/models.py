@@ -0,0 +1,27 @@
+"""Stub cho test: các model của qdrant-client chỉ giữ lại tham số"""
+
+
+class _Model:
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+class Filter(_Model):
+    pass
+
+
+class FieldCondition(_Model):
+    pass
+
+
+class MatchValue(_Model):
+    pass
+
+
+class PointStruct(_Model):
+    pass
+
+
+class PointIdsList(_Model):
+    pass
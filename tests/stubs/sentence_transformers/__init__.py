@@ -0,0 +1,14 @@
+"""Stub cho test: `sentence-transformers` chưa được cài"""
+
+
+class _Unavailable:
+    def __init__(self, *args, **kwargs):
+        raise ImportError("sentence-transformers is not installed (tests/stubs)")
+
+
+class SentenceTransformer(_Unavailable):
+    pass
+
+
+class CrossEncoder(_Unavailable):
+    pass
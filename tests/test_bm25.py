@@ -0,0 +1,24 @@
+import pytest
+
+from retrieval.bm25_index import BM25Index, VietnameseTokenizer, reciprocal_rank_fusion
+
+
+def test_rrf_rewards_documents_ranked_in_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [doc for doc, _ in fused] == ["b", "a", "d", "c"]
+    assert dict(fused)["b"] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_rrf_single_ranking_keeps_order():
+    assert [doc for doc, _ in reciprocal_rank_fusion([["x", "y", "z"]])] == ["x", "y", "z"]
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_bm25_matches_without_diacritics():
+    index = BM25Index(VietnameseTokenizer())
+    index.build([
+        ("hoc-phi", "Học phí ngành Công nghệ thông tin năm 2025"),
+        ("ktx", "Ký túc xá dành cho sinh viên năm nhất"),
+    ])
+    results = index.search("hoc phi cong nghe thong tin", top_k=2)
+    assert results[0][0] == "hoc-phi"
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+from llm import model_router
+from llm.model_router import CircuitBreaker, ModelRouter, retry_after_seconds
+
+
+@pytest.fixture
+def breaker(clock, monkeypatch):
+    monkeypatch.setattr(model_router, "time", SimpleNamespace(time=clock.time))
+    return CircuitBreaker(failure_threshold=2, recovery_timeout=10, max_recovery_timeout=30, probe_timeout=60)
+
+
+def trip(breaker, clock):
+    breaker.on_failure()
+    breaker.on_failure()
+    assert breaker.state == "open"
+    clock.advance(11)
+    assert breaker.state == "half_open"
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.on_failure()
+    assert breaker.allow()
+    breaker.on_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_half_open_allows_a_single_probe(breaker, clock):
+    trip(breaker, clock)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_doubles_recovery_up_to_max(breaker, clock):
+    trip(breaker, clock)
+    breaker.allow()
+    breaker.on_failure()
+    assert breaker.recovery_timeout == 20
+    clock.advance(21)
+    breaker.allow()
+    breaker.on_failure()
+    assert breaker.recovery_timeout == 30
+
+
+def test_released_probe_lets_another_request_through(breaker, clock):
+    trip(breaker, clock)
+    assert breaker.allow()
+    breaker.release_probe()  # stream bị bỏ dở / hedge thua bị cancel
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+
+
+def test_abandoned_probe_expires(breaker, clock):
+    trip(breaker, clock)
+    assert breaker.allow()
+    clock.advance(59)
+    assert not breaker.allow()
+    clock.advance(2)
+    assert breaker.allow()
+
+
+def test_rate_limit_waits_retry_after(breaker, clock):
+    breaker.on_failure(retry_after=5)
+    assert breaker.state == "open"
+    clock.advance(6)
+    assert breaker.allow()
+
+
+def test_retry_after_header():
+    error = SimpleNamespace(response=SimpleNamespace(headers={"retry-after-ms": "1500"}))
+    assert retry_after_seconds(error) == 1.5
+    assert retry_after_seconds(SimpleNamespace(response=SimpleNamespace(headers={"retry-after": "x"}))) is None
+    assert retry_after_seconds(ValueError()) is None
+
+
+def test_router_ranks_open_models_last(clock, monkeypatch):
+    monkeypatch.setattr(model_router, "time", SimpleNamespace(time=clock.time))
+    router = ModelRouter(["fast", "slow"], failure_threshold=1, recovery_timeout=10)
+    router.record_success("slow", 0.5)
+    router.record_failure("fast")
+    assert router.ranked_models() == ["slow", "fast"]
+    assert not router.allow("fast")
+
+    clock.advance(11)
+    assert router.allow("fast")
+    router.record_success("fast", 0.1)
+    assert router.ranked_models() == ["fast", "slow"]
+
+
+def test_router_release_frees_probe(clock, monkeypatch):
+    monkeypatch.setattr(model_router, "time", SimpleNamespace(time=clock.time))
+    router = ModelRouter(["m"], failure_threshold=1, recovery_timeout=10)
+    router.record_failure("m")
+    clock.advance(11)
+
+    assert router.allow("m")
+    assert not router.allow("m")
+    router.release("m")
+    assert router.allow("m")
@@ -0,0 +1,27 @@
+import pytest
+
+from retrieval.cross_encoder_reranker import CrossEncoderReranker
+
+
+class FakeModel:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def predict(self, pairs):
+        return self.scores[:len(pairs)]
+
+
+def test_calibrated_model_labels_by_threshold():
+    reranker = CrossEncoderReranker("cross-encoder/ms-marco-MiniLM-L-6-v2", preloaded_model=FakeModel([3.0, -0.5, -3.0]))
+    docs = [{"content": "a"}, {"content": "b"}, {"content": "c"}]
+
+    assert reranker.label_documents("q", docs) == ["CORRECT", "AMBIGUOUS", "INCORRECT"]
+
+
+def test_uncalibrated_model_reranks_but_refuses_to_label():
+    reranker = CrossEncoderReranker("some/uncalibrated-model", preloaded_model=FakeModel([-1.0, 2.0]))
+    docs = [{"content": "a"}, {"content": "b"}]
+
+    assert [d["content"] for d in reranker.rerank("q", docs)] == ["b", "a"]
+    with pytest.raises(ValueError):
+        reranker.label_documents("q", docs)
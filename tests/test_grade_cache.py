@@ -0,0 +1,28 @@
+from cache.corpus_version import bump_corpus_version
+from cache.grade_cache import GradeCache
+
+
+def test_grade_is_keyed_on_normalized_query_and_chunk():
+    cache = GradeCache()
+    doc = {"chunk_id": "a"}
+    cache.set("Học  phí", doc, "CORRECT", 0.9)
+
+    assert cache.get("học phí", doc) == ("CORRECT", 0.9)
+    assert cache.get("học phí", {"chunk_id": "b"}) is None
+    assert cache.get("ký túc xá", doc) is None
+
+
+def test_document_without_chunk_id_is_not_cached():
+    cache = GradeCache()
+    doc = {"content": "không có chunk_id"}
+    cache.set("học phí", doc, "CORRECT", 0.9)
+    assert cache.get("học phí", doc) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_grade_cache_is_invalidated_by_corpus_change():
+    cache = GradeCache()
+    doc = {"chunk_id": "a"}
+    cache.set("học phí", doc, "CORRECT", 0.9)
+    bump_corpus_version()
+    assert cache.get("học phí", doc) is None
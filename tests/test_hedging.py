@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from llm.hedging import Hedger
+
+
+def failing(model):
+    raise RuntimeError(f"{model} down")
+
+
+def test_primary_error_before_delay_is_counted():
+    hedger = Hedger(default_delay=5)
+    with pytest.raises(RuntimeError):
+        hedger.run(failing, "fast", "fast")
+
+    stats = hedger.stats()
+    assert stats["requests"] == 1 and stats["hedged"] == 0
+
+
+def test_async_primary_error_before_delay_is_counted():
+    hedger = Hedger(default_delay=5)
+
+    async def afailing(model):
+        failing(model)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedger.arun(afailing, "fast", "fast"))
+
+    stats = hedger.stats()
+    assert stats["requests"] == 1 and stats["hedged"] == 0
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = Hedger(default_delay=5)
+    assert hedger.run(lambda model: f"{model}:ok", "fast", "fast") == "fast:ok"
+    assert hedger.stats()["requests"] == 1
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from cache import lru
+from cache.lru import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" mới dùng -> "b" bị đẩy ra
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entry_expires_after_ttl(clock, monkeypatch):
+    monkeypatch.setattr(lru, "time", SimpleNamespace(time=clock.time))
+    cache = LRUCache(max_entries=10, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_seconds=300)
+
+    clock.advance(61)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["expirations"] == 1
+    assert [k for k, _ in cache.items()] == ["b"]
+
+
+def test_max_bytes_evicts_but_keeps_newest_entry():
+    cache = LRUCache(max_entries=10, max_bytes=10, size_fn=len)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+    assert "a" not in cache and cache.total_bytes == 6
+
+    cache.set("c", "z" * 20)  # lớn hơn giới hạn nhưng vẫn giữ entry cuối cùng
+    assert list(cache._data) == ["c"]
+    assert cache.total_bytes == 20
+
+
+def test_overwrite_and_delete_track_bytes():
+    cache = LRUCache(max_entries=10, size_fn=len)
+    cache.set("a", "xxxx")
+    cache.set("a", "xx")
+    assert cache.total_bytes == 2
+    assert cache.delete("a") and not cache.delete("a")
+    assert cache.total_bytes == 0
+
+
+def test_hit_rate():
+    cache = LRUCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    assert cache.stats()["hit_rate"] == 0.5
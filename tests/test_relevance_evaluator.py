@@ -0,0 +1,79 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from cache.grade_cache import GradeCache
+from llm.scheduler import QuotaExceeded
+from monitoring.metrics import GRADING_SHED
+from retrieval.crag_retriever import CRAGRetriever
+from retrieval.relevance_evaluator import RelevanceEvaluator
+
+
+@pytest.fixture
+def evaluator():
+    return RelevanceEvaluator(llm_client=None, grade_cache=GradeCache())
+
+
+def evaluations(*items):
+    return json.dumps({"evaluations": [{"label": label, "confidence": conf} for label, conf in items]})
+
+
+def test_parse_grades_matches_labels_exactly(evaluator):
+    content = evaluations(("INCORRECT", 0.9), ("correct", 0.95), ("AMBIGUOUS", 0.4), ("MOSTLY CORRECT", 0.9))
+    assert evaluator._parse_grades(content, 4) == [
+        ("INCORRECT", 0.9),
+        ("CORRECT", 0.95),
+        ("AMBIGUOUS", 0.4),
+        None
+    ]
+
+
+def test_parse_grades_downgrades_unconfident_correct(evaluator):
+    assert evaluator._parse_grades(evaluations(("CORRECT", 0.5)), 1) == [("AMBIGUOUS", 0.5)]
+
+
+def test_parse_grades_marks_missing_entries(evaluator):
+    assert evaluator._parse_grades(evaluations(("CORRECT", 0.9)), 3) == [("CORRECT", 0.9), None, None]
+    assert evaluator._parse_grades(evaluations(("CORRECT", 0.9), ("INCORRECT", 0.9)), 1) == [("CORRECT", 0.9)]
+
+
+def test_only_parsed_grades_are_cached(evaluator):
+    docs = [{"chunk_id": "a"}, {"chunk_id": "b"}]
+    labels = [None, None]
+    evaluator._store_grades("học phí", docs, [0, 1], [("INCORRECT", 0.9), None], labels)
+
+    assert labels == ["INCORRECT", "AMBIGUOUS"]
+    assert evaluator.grade_cache.get("học phí", docs[0]) == ("INCORRECT", 0.9)
+    assert evaluator.grade_cache.get("học phí", docs[1]) is None
+
+
+def test_llm_failure_is_not_cached(evaluator):
+    docs = [{"chunk_id": "a"}]
+    labels = [None]
+    evaluator._store_grades("học phí", docs, [0], None, labels)
+    assert labels == ["AMBIGUOUS"]
+    assert evaluator.grade_cache.get("học phí", docs[0]) is None
+
+
+def test_cached_grades_skip_the_llm(evaluator):
+    docs = [{"chunk_id": "a"}, {"chunk_id": "b"}]
+    evaluator.grade_cache.set("Học phí", docs[0], "CORRECT", 0.9)
+    labels, uncached = evaluator._lookup_cached("học  phí", docs)
+    assert labels == ["CORRECT", None] and uncached == [1]
+
+
+
+def test_shed_grading_is_flagged_not_silent():
+    def create(**kwargs):
+        raise QuotaExceeded("grading wait too long", retry_after=2.0)
+
+    llm = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    evaluator = RelevanceEvaluator(llm_client=llm, grade_cache=GradeCache())
+    docs = [{"chunk_id": "a"}, {"chunk_id": "b"}]
+    before = GRADING_SHED._values.get((), 0.0)
+
+    assert evaluator.evaluate_batch("học phí", docs) == ["AMBIGUOUS", "AMBIGUOUS"]
+    assert all(doc["grading_shed"] for doc in docs)
+    assert GRADING_SHED._values[()] == before + 2
+    assert CRAGRetriever.graded_stats({"correct": [], "incorrect": [], "ambiguous": docs})["grading_shed"]
@@ -0,0 +1,30 @@
+import math
+
+import pytest
+
+from benchmark_retrieval import ndcg_at_k, percentiles, recall_at_k, reciprocal_rank
+
+RELEVANT = {"a": 2, "b": 1, "z": 0}
+
+
+def test_recall_at_k_ignores_zero_grades():
+    assert recall_at_k(["a", "x", "b"], RELEVANT, 1) == 0.5
+    assert recall_at_k(["a", "x", "b"], RELEVANT, 3) == 1.0
+    assert recall_at_k(["x"], {}, 3) == 0.0
+
+
+def test_reciprocal_rank():
+    assert reciprocal_rank(["x", "z", "b", "a"], RELEVANT) == pytest.approx(1 / 3)
+    assert reciprocal_rank(["x", "z"], RELEVANT) == 0.0
+
+
+def test_ndcg_uses_graded_gain():
+    assert ndcg_at_k(["a", "b"], RELEVANT, 2) == pytest.approx(1.0)
+    swapped = (1 + 3 / math.log2(3)) / (3 + 1 / math.log2(3))
+    assert ndcg_at_k(["b", "a"], RELEVANT, 2) == pytest.approx(swapped)
+    assert ndcg_at_k(["x"], {}, 5) == 0.0
+
+
+def test_percentiles_of_empty_list():
+    assert percentiles([]) == {"p50": 0.0, "p90": 0.0, "p99": 0.0}
+    assert percentiles([1.0, 2.0, 3.0])["p50"] == 2.0
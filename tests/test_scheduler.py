@@ -0,0 +1,65 @@
+import pytest
+
+from llm.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_GENERATION,
+    QuotaExceeded,
+    QuotaScheduler,
+    TokenBucket,
+    estimate_tokens
+)
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(capacity=60, per_minute=60)  # 1 token/giây
+    bucket.updated = 0.0
+    assert bucket.time_until(60, now=0.0) == 0.0
+    bucket.take(60)
+    assert bucket.time_until(5, now=0.0) == pytest.approx(5.0)
+    assert bucket.time_until(5, now=3.0) == pytest.approx(2.0)
+    assert bucket.time_until(5, now=100.0) == 0.0
+    assert bucket.tokens == 60  # không vượt capacity
+
+
+def test_request_larger_than_bucket_waits_for_full_bucket():
+    bucket = TokenBucket(capacity=10, per_minute=60)
+    bucket.updated = 0.0
+    bucket.take(5)
+    assert bucket.time_until(1000, now=0.0) == pytest.approx(5.0)
+
+
+def test_drain_pauses_bucket_for_retry_after():
+    bucket = TokenBucket(capacity=60, per_minute=60)
+    bucket.updated = 0.0
+    bucket.drain(10, now=0.0)
+    assert bucket.time_until(1, now=0.0) == pytest.approx(11.0)
+
+
+def test_estimate_tokens_counts_output_and_images():
+    messages = [
+        {"role": "user", "content": "x" * 300},
+        {"role": "user", "content": [{"type": "text", "text": "y" * 30}, {"type": "image_url"}]}
+    ]
+    assert estimate_tokens(messages, max_tokens=50) == 100 + 10 + 1000 + 50
+
+
+def test_scheduler_admits_within_quota_and_sheds_over_max_wait():
+    scheduler = QuotaScheduler({"m": (2, 10000)}, max_wait={"background": 0.5})
+    assert scheduler.acquire("m", 10, PRIORITY_BACKGROUND) == pytest.approx(0.0, abs=0.05)
+    scheduler.acquire("m", 10, PRIORITY_BACKGROUND)
+
+    # Hết 2 request/phút -> lần thứ 3 phải chờ ~30s > max_wait
+    with pytest.raises(QuotaExceeded) as exc:
+        scheduler.acquire("m", 10, PRIORITY_BACKGROUND)
+    assert exc.value.retry_after > 0.5
+    stats = scheduler.stats()["priorities"]["background"]
+    assert stats["admitted"] == 2 and stats["shed"] == 1
+    assert scheduler.stats()["queue_depth"] == {}
+
+
+def test_settle_returns_overestimated_tokens():
+    scheduler = QuotaScheduler({"m": (100, 1000)})
+    scheduler.acquire("m", 800, PRIORITY_GENERATION)
+    scheduler.settle("m", estimated=800, actual=200)
+    _, token_bucket = scheduler._get_buckets("m")
+    assert token_bucket.tokens == pytest.approx(800, abs=1)
@@ -0,0 +1,73 @@
+import numpy as np
+
+from cache.corpus_version import bump_corpus_version
+from cache.semantic_cache import SemanticCache, key_tokens
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_hit_above_threshold_and_miss_below():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("học phí ngành công nghệ thông tin", unit(1, 0, 0), {"answer": "A"})
+
+    hit = cache.lookup(unit(1, 0.1, 0), "học phí ngành công nghệ thông tin là bao nhiêu")
+    assert hit is not None and hit[0]["answer"] == "A"
+    assert cache.lookup(unit(0, 1, 0), "ký túc xá") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_different_year_is_not_a_hit():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("điểm chuẩn 2024", unit(1, 0, 0), {"answer": "2024"})
+
+    assert cache.lookup(unit(1, 0, 0), "điểm chuẩn 2025") is None
+    assert cache.stats()["guard_rejections"] == 1
+
+
+def test_guard_falls_through_to_next_best_candidate():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("điểm chuẩn ngành 7480201", unit(1, 0, 0), {"answer": "CNTT"})
+    cache.store("điểm chuẩn ngành 7340101", unit(1, 0.2, 0), {"answer": "QTKD"})
+
+    result, _, cached_query = cache.lookup(unit(1, 0.01, 0), "điểm chuẩn ngành 7340101")
+    assert result["answer"] == "QTKD"
+    assert cached_query == "điểm chuẩn ngành 7340101"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(threshold=0.9, max_entries=2)
+    cache.store("a", unit(1, 0, 0), {"answer": "a"})
+    cache.store("b", unit(0, 1, 0), {"answer": "b"})
+    cache.lookup(unit(1, 0, 0), "a")
+    cache.store("c", unit(0, 0, 1), {"answer": "c"})
+
+    assert cache.lookup(unit(0, 1, 0), "b") is None
+    assert cache.lookup(unit(1, 0, 0), "a")[0]["answer"] == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_key_tokens_cover_years_scores_and_codes():
+    assert key_tokens("Điểm chuẩn 2024 ngành 7480201") == {"2024", "7480201"}
+    assert key_tokens("khối A00 được 24,5 điểm") == {"a00", "24.5"}
+    assert key_tokens("ngành CNTT") == {"cntt"}
+    # "năm nay" được chuẩn hóa thành năm hiện hành trước khi so
+    assert key_tokens("học phí năm nay") == key_tokens("học phí năm 2025")
+    assert key_tokens("học phí bao nhiêu?") == frozenset()
+
+
+def test_corpus_change_drops_entries():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("học phí", unit(1, 0), {"answer": "A"})
+    bump_corpus_version()
+
+    assert cache.lookup(unit(1, 0), "học phí") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_expired_entry_is_not_returned():
+    cache = SemanticCache(threshold=0.9, ttl_seconds=-1)
+    cache.store("học phí", unit(1, 0), {"answer": "A"})
+    assert cache.lookup(unit(1, 0), "học phí") is None
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+import pytest
+
+from cache.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight(timeout=5)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("q", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("q", work))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    while flight.stats()["coalesced"] < 3:
+        pass
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [("answer", False)] + [("answer", True)] * 3
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_leader_error_propagates_and_key_is_released():
+    flight = SingleFlight()
+    call, leader = flight.begin("q")
+    follower_call, is_leader = flight.begin("q")
+    assert leader and not is_leader and follower_call is call
+
+    flight.finish("q", call, error=ValueError("boom"))
+    with pytest.raises(ValueError):
+        flight.wait(follower_call)
+    assert flight.do("q", lambda: 42) == (42, False)
+
+
+def test_follower_runs_itself_after_timeout():
+    flight = SingleFlight(timeout=0.01)
+    call, _ = flight.begin("q")  # leader không bao giờ xong
+    assert flight.do("q", lambda: "own") == ("own", False)
+    assert flight.stats()["timeouts"] == 1
+    flight.finish("q", call, "late")
+
+
+def test_follower_runs_itself_when_leader_abandons():
+    flight = SingleFlight(timeout=5)
+    call, _ = flight.begin("q")
+    results = []
+    follower = threading.Thread(target=lambda: results.append(flight.do("q", lambda: "own")))
+    follower.start()
+    while flight.stats()["coalesced"] < 1:
+        pass
+    flight.finish("q", call, None)  # stream của leader bị bỏ dở
+    follower.join(5)
+
+    assert results == [("own", False)]
+    assert flight.stats()["abandoned"] == 1
+
+
+def test_async_calls_are_coalesced():
+    flight = SingleFlight(timeout=5)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*[flight.ado("q", work) for _ in range(4)])
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [shared for _, shared in results].count(False) == 1
+    assert all(result == "answer" for result, _ in results)
@@ -0,0 +1,26 @@
+from llm.transport import cassette_key
+
+
+def request(**overrides):
+    kwargs = {
+        "model": "llama-3.1-8b-instant",
+        "messages": [{"role": "user", "content": "Học phí ngành CNTT?"}],
+        "temperature": 0.1,
+        "max_tokens": 300
+    }
+    kwargs.update(overrides)
+    return kwargs
+
+
+def test_key_ignores_argument_order_and_transport_params():
+    base = cassette_key(request())
+    reordered = cassette_key(dict(reversed(list(request().items()))))
+    streamed = cassette_key(request(stream=True, timeout=30, extra_headers={"x": "1"}))
+    assert base == reordered == streamed
+
+
+def test_key_changes_with_prompt_model_and_sampling():
+    base = cassette_key(request())
+    assert cassette_key(request(messages=[{"role": "user", "content": "Học phí ngành QTKD?"}])) != base
+    assert cassette_key(request(model="llama-3.3-70b-versatile")) != base
+    assert cassette_key(request(temperature=0.7)) != base